@@ -7,10 +7,18 @@
 from flask import Flask, request, make_response
 import os
 from wechat_handler import WeChatHandler
+from reply_rules import reply_manager
+from rule_loader import load_rules_file
+from rule_watcher import RuleFileWatcher
+from faq_engine import FAQEngine, read_faq_file
+from similarity_matcher import SimilarityMatcher
+from config import Config
 from logger_config import wechat_logger, exception_handler, log_function_call
 
 # 创建Flask应用实例
 app = Flask(__name__)
+# 读取请求体时按上限截断，防止分块上传的超大请求体
+app.config['MAX_CONTENT_LENGTH'] = Config.MAX_BODY_SIZE
 
 # 获取日志器
 logger = wechat_logger.get_logger('app')
@@ -18,6 +26,25 @@ logger = wechat_logger.get_logger('app')
 # 微信公众号配置
 WECHAT_TOKEN = os.environ.get('WECHAT_TOKEN', 'your_wechat_token_here')
 
+# 配置了规则目录文件时，用文件中的规则替换内置默认规则，并监视文件变化热加载
+rule_watcher = None
+if Config.RULES_FILE:
+    load_rules_file(reply_manager, Config.RULES_FILE, Config.RULES_CACHE_FILE)
+    if Config.RULES_RELOAD_INTERVAL > 0:
+        rule_watcher = RuleFileWatcher(reply_manager, Config.RULES_FILE,
+                                       Config.RULES_CACHE_FILE, Config.RULES_RELOAD_INTERVAL)
+        rule_watcher.start()
+
+# 加载FAQ问答库并注册为函数规则，相似问题匹配作为检索未命中时的兜底
+if Config.FAQ_FILE:
+    faq_entries = read_faq_file(Config.FAQ_FILE)
+    FAQEngine(faq_entries, min_confidence=Config.FAQ_MIN_CONFIDENCE).register(reply_manager)
+    if Config.FAQ_SIMILARITY_THRESHOLD > 0:
+        try:
+            SimilarityMatcher(faq_entries, threshold=Config.FAQ_SIMILARITY_THRESHOLD).register(reply_manager)
+        except ImportError as e:
+            logger.warning(f"未启用相似问题匹配: {str(e)}")
+
 # 创建微信处理器实例
 wechat_handler = WeChatHandler(WECHAT_TOKEN)
 
@@ -52,6 +79,25 @@ def health_check():
     logger.info("健康检查请求")
     return {"status": "ok", "message": "微信公众号自动回复系统运行正常"}
 
+@app.route('/stats', methods=['GET'])
+@exception_handler(logger)
+def stats():
+    """运行统计接口"""
+    return {
+        "rule_set_version": reply_manager.version,
+        "reply_cache": wechat_handler.reply_cache.stats(),
+        "sessions": reply_manager.sessions.stats(),
+        "idempotency": wechat_handler.idempotency.stats() if wechat_handler.idempotency else None,
+        "async_reply": wechat_handler.async_replies.stats() if wechat_handler.async_replies else None,
+        "rule_reload": rule_watcher.get_status() if rule_watcher else None
+    }
+
+@app.route('/rules', methods=['GET'])
+@exception_handler(logger)
+def rules_info():
+    """规则信息和命中统计接口"""
+    return reply_manager.get_rules_info()
+
 if __name__ == '__main__':
     logger.info("启动微信公众号自动回复系统...")
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
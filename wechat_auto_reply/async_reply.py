@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""
+异步回复
+被动回复必须在微信的5秒超时内返回。回复生成放到后台工作线程中执行，处理器只等待到本次请求的截止时间：
+按时完成的直接被动回复；超时的先回复 success，生成完成后通过客服消息接口发送给用户
+"""
+
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import urllib.parse
+import urllib.request
+from collections import deque
+from typing import Callable, Dict, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# 微信客服消息接口
+CUSTOMER_SERVICE_API_URL = 'https://api.weixin.qq.com/cgi-bin/message/custom/send'
+
+# 统计投递延迟时保留的最近样本数
+LATENCY_SAMPLES = 1024
+
+class DeliveryError(Exception):
+    """客服消息发送失败"""
+
+class HTTPCustomerServiceSender:
+    """
+    通过客服消息接口发送文本消息
+    接口地址可以替换为本地的模拟服务，便于测试
+    """
+
+    def __init__(self, access_token: Union[str, Callable[[], str]], api_url: str = CUSTOMER_SERVICE_API_URL,
+                 timeout: float = 5.0):
+        """
+        :param access_token: 接口调用凭证，或返回凭证的函数（凭证会过期，通常由中控服务刷新）
+        :param api_url: 客服消息接口地址
+        :param timeout: 请求超时（秒）
+        """
+        self._access_token = access_token
+        self.api_url = api_url
+        self.timeout = timeout
+
+    def send_text(self, to_user: str, content: str):
+        """
+        发送文本客服消息
+        :param to_user: 接收用户OpenID
+        :param content: 消息内容
+        :raises DeliveryError: 接口返回错误
+        """
+        token = self._access_token() if callable(self._access_token) else self._access_token
+        url = f"{self.api_url}?{urllib.parse.urlencode({'access_token': token})}"
+        body = json.dumps(
+            {'touser': to_user, 'msgtype': 'text', 'text': {'content': content}}, ensure_ascii=False
+        ).encode('utf-8')
+        request = urllib.request.Request(url, data=body, headers={'Content-Type': 'application/json; charset=utf-8'})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            result = json.loads(response.read() or b'{}')
+        if result.get('errcode', 0) != 0:
+            raise DeliveryError(f"客服消息发送失败: {result.get('errcode')} {result.get('errmsg', '')}")
+
+class _ReplyJob:
+    """一次回复生成任务"""
+
+    __slots__ = ('task', 'to_user', 'created', 'lock', 'finished', 'detached', 'reply', 'event')
+
+    def __init__(self, task: Callable[[], Optional[str]], to_user: str, created: float):
+        self.task = task
+        self.to_user = to_user
+        self.created = created
+        self.lock = threading.Lock()
+        # finished：回复已生成；detached：处理器已超过截止时间，回复改由客服消息发送
+        self.finished = False
+        self.detached = False
+        self.reply: Optional[str] = None
+        self.event = threading.Event()
+
+class AsyncReplyQueue:
+    """
+    有界回复任务队列
+    固定数量的工作线程生成回复；队列满时丢弃新任务并计数（过载保护），请求立即回复 success，
+    不在请求线程中生成，积压时请求仍能在截止时间内返回。
+    工作线程在每个进程第一次提交任务时启动：gunicorn --preload 在主进程中创建处理器后 fork 出工作进程，
+    子进程不会继承线程，需要在子进程中重新创建队列和工作线程
+    """
+
+    def __init__(self, sender, workers: int = 4, max_pending: int = 1000,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        :param sender: 客服消息发送器，需要提供 send_text(to_user, content)
+        :param workers: 工作线程数
+        :param max_pending: 排队任务数上限
+        :param clock: 单调时钟
+        """
+        self.sender = sender
+        self.workers = workers
+        self.max_pending = max_pending
+        self._clock = clock
+        self._queue: "queue.Queue[Optional[_ReplyJob]]" = queue.Queue(maxsize=max_pending)
+        self._threads = []
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        # 已启动工作线程的进程号
+        self._pid: Optional[int] = None
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.on_time = 0
+        self.deferred = 0
+        self.dropped = 0
+        self.delivered = 0
+        self.failed = 0
+
+    def _ensure_workers(self):
+        """在当前进程中启动工作线程，fork 出的子进程丢弃从父进程继承的队列和锁"""
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            pid = os.getpid()
+            if self._pid == pid:
+                return
+            if self._pid is not None:
+                # 父进程的队列中的任务由父进程处理，锁可能在 fork 时正被父进程的线程持有
+                self._queue = queue.Queue(maxsize=self.max_pending)
+                self._lock = threading.Lock()
+                logger.info(f"进程 {pid} 是 fork 出的子进程，重新启动异步回复工作线程")
+            self._threads = []
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"async-reply-{index}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            self._pid = pid
+
+    def run(self, task: Callable[[], Optional[str]], to_user: str, timeout: float) -> Tuple[bool, Optional[str]]:
+        """
+        生成回复，最多等待 timeout 秒
+        :param task: 生成回复的函数
+        :param to_user: 接收用户OpenID，超时后向其发送客服消息
+        :param timeout: 本次请求的截止时间（秒）
+        :return: (是否按时完成, 回复内容)；未按时完成时回复内容为None，稍后通过客服消息发送，
+                 队列已满时任务被丢弃，也返回 (False, None)
+        """
+        self._ensure_workers()
+        job = _ReplyJob(task, to_user, self._clock())
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            # 在请求线程中生成没有截止时间，会拖慢已经积压的请求，直接丢弃
+            with self._lock:
+                self.dropped += 1
+            logger.warning(f"异步回复队列已满，丢弃发给 {to_user} 的回复任务")
+            return False, None
+
+        job.event.wait(timeout)
+        with job.lock:
+            if not job.finished:
+                job.detached = True
+        with self._lock:
+            if job.detached:
+                self.deferred += 1
+                return False, None
+            self.on_time += 1
+        return True, job.reply
+
+    def _work(self):
+        """工作线程：生成回复，超过截止时间的任务通过客服消息发送"""
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+            try:
+                reply = job.task()
+            except Exception as e:
+                logger.error(f"生成异步回复时发生错误: {str(e)}")
+                reply = None
+            with job.lock:
+                job.reply = reply
+                job.finished = True
+                detached = job.detached
+            job.event.set()
+            if detached and reply:
+                self._deliver(job)
+
+    def _deliver(self, job: _ReplyJob):
+        """发送客服消息并记录投递延迟（从收到消息起计算）"""
+        try:
+            self.sender.send_text(job.to_user, job.reply)
+        except Exception as e:
+            logger.error(f"发送客服消息失败，用户: {job.to_user}，错误: {str(e)}")
+            with self._lock:
+                self.failed += 1
+            return
+        latency = self._clock() - job.created
+        with self._lock:
+            self.delivered += 1
+            self._latencies.append(latency)
+        logger.info(f"已通过客服消息发送回复，用户: {job.to_user}，延迟: {latency:.3f}秒")
+
+    def shutdown(self, wait: bool = True):
+        """
+        停止工作线程，已排队的任务会先处理完
+        :param wait: 是否等待工作线程退出
+        """
+        if self._pid != os.getpid():
+            # 当前进程没有启动过工作线程
+            return
+        for _ in self._threads:
+            self._queue.put(None)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def stats(self) -> Dict:
+        """
+        获取统计信息
+        :return: 队列深度、按时完成、转为客服消息、队列满时丢弃、投递成功和失败次数，以及投递延迟（秒）
+        """
+        with self._lock:
+            latencies = sorted(self._latencies)
+            stats = {
+                'queue_depth': self._queue.qsize(),
+                'max_pending': self.max_pending,
+                'workers': self.workers,
+                'on_time': self.on_time,
+                'deferred': self.deferred,
+                'dropped': self.dropped,
+                'delivered': self.delivered,
+                'failed': self.failed,
+            }
+        if latencies:
+            stats['delivery_latency'] = {
+                'p50': round(latencies[len(latencies) // 2], 4),
+                'p99': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))], 4),
+                'max': round(latencies[-1], 4)
+            }
+        return stats
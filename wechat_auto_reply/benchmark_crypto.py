@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+安全模式吞吐量测试
+对比每个请求的完整处理路径：明文模式（解析→匹配→构造回复）、安全模式（校验签名→解密→解析→匹配→构造回复→加密），
+以及每个请求重新派生密钥、在复制出的字节串上去填充的逐步实现。
+长消息的规则匹配耗时远大于加解密，第二张表用固定回复（不匹配）单独比较加解密开销
+
+用法:
+    python benchmark_crypto.py [--rounds 5000]
+"""
+
+import argparse
+import base64
+import struct
+import sys
+import timeit
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+import xml_samples
+from reply_builder import build_text_reply
+from reply_rules import ReplyRuleManager
+from wechat_crypto import WeChatCrypto, compute_signature
+from xml_parser import parse_message
+
+TOKEN = 'benchmark_token'
+ENCODING_AES_KEY = 'abcdefghijklmnopqrstuvwxyz0123456789ABCDEFG'
+APPID = 'wx1234567890abcdef'
+TIMESTAMP = '1409304348'
+NONCE = 'xxxxxx'
+
+manager = ReplyRuleManager()
+crypto = WeChatCrypto(TOKEN, ENCODING_AES_KEY, APPID)
+
+def _envelope(message: bytes):
+    """
+    构造安全模式的请求体和 msg_signature
+    :param message: 明文消息XML
+    :return: (请求体, msg_signature)
+    """
+    encrypt = crypto.encrypt(message).decode('ascii')
+    body = f"<xml><ToUserName><![CDATA[gh_123456789abc]]></ToUserName><Encrypt><![CDATA[{encrypt}]]></Encrypt></xml>"
+    return body.encode('utf-8'), compute_signature(TOKEN, TIMESTAMP, NONCE, encrypt)
+
+PAYLOADS = {
+    '文本消息': xml_samples.TEXT_MESSAGE_SAMPLE.encode('utf-8'),
+    '长文本(2000字)': xml_samples.TEXT_MESSAGE_SAMPLE.replace('你好', '长' * 2000).encode('utf-8'),
+}
+
+def match_reply(msg_dict) -> bytes:
+    """匹配规则并构造回复"""
+    reply = manager.find_match(msg_dict['Content'], msg_dict['FromUserName']).reply or ''
+    return build_text_reply(msg_dict['FromUserName'], msg_dict['ToUserName'], reply)
+
+def fixed_reply(msg_dict) -> bytes:
+    """不匹配，构造固定回复"""
+    return build_text_reply(msg_dict['FromUserName'], msg_dict['ToUserName'], '你好+1')
+
+def plain_pipeline(raw: bytes, signature: str, reply=match_reply) -> bytes:
+    """明文模式"""
+    return reply(parse_message(raw))
+
+def safe_pipeline(body: bytes, signature: str, reply=match_reply) -> bytes:
+    """安全模式：缓存的 Cipher，memoryview 上去填充，解密结果直接交给解析器"""
+    encrypt = parse_message(body)['Encrypt']
+    if not crypto.check_signature(signature, TIMESTAMP, NONCE, encrypt):
+        raise ValueError('签名错误')
+    return crypto.encrypt_reply(reply(parse_message(crypto.decrypt(encrypt))), NONCE)
+
+def naive_pipeline(body: bytes, signature: str, reply=match_reply) -> bytes:
+    """逐步实现：每个请求派生密钥，去填充和取消息时复制字节，解码为字符串后解析"""
+    encrypt = parse_message(body)['Encrypt']
+    if compute_signature(TOKEN, TIMESTAMP, NONCE, encrypt) != signature:
+        raise ValueError('签名错误')
+    key = base64.b64decode(ENCODING_AES_KEY + '=')
+    decryptor = Cipher(algorithms.AES(key), modes.CBC(key[:16])).decryptor()
+    plain = decryptor.update(base64.b64decode(encrypt)) + decryptor.finalize()
+    content = plain[16:-plain[-1]]
+    length = struct.unpack('>I', content[:4])[0]
+    msg_dict = parse_message(content[4:4 + length].decode('utf-8'))
+    reply_xml = reply(msg_dict)
+
+    # 加密回复
+    text = b'0123456789abcdef' + struct.pack('>I', len(reply_xml)) + reply_xml + APPID.encode('utf-8')
+    pad = 32 - len(text) % 32
+    text += bytes([pad]) * pad
+    key = base64.b64decode(ENCODING_AES_KEY + '=')
+    encryptor = Cipher(algorithms.AES(key), modes.CBC(key[:16])).encryptor()
+    encrypt = base64.b64encode(encryptor.update(text) + encryptor.finalize()).decode('ascii')
+    signature = compute_signature(TOKEN, TIMESTAMP, NONCE, encrypt)
+    return (f"<xml>\n<Encrypt><![CDATA[{encrypt}]]></Encrypt>\n<MsgSignature><![CDATA[{signature}]]></MsgSignature>\n"
+            f"<TimeStamp>{TIMESTAMP}</TimeStamp>\n<Nonce><![CDATA[{NONCE}]]></Nonce>\n</xml>").encode('utf-8')
+
+def main(argv=None):
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description='安全模式吞吐量测试')
+    parser.add_argument('--rounds', type=int, default=5000, help='每个样例的请求数')
+    args = parser.parse_args(argv)
+
+    for title, reply in (('解析→匹配→回复', match_reply), ('固定回复，只比较加解密开销', fixed_reply)):
+        print(f"=== 安全模式吞吐量测试（{title}） ===")
+        print(f"{'样例':<16}{'明文(us)':>10}{'安全模式(us)':>14}{'逐步实现(us)':>14}"
+              f"{'安全模式吞吐(次/秒)':>20}{'相对明文':>10}")
+        for name, message in PAYLOADS.items():
+            body, signature = _envelope(message)
+            timings = []
+            for pipeline, payload in ((plain_pipeline, message), (safe_pipeline, body), (naive_pipeline, body)):
+                pipeline(payload, signature, reply)
+                seconds = min(timeit.repeat(lambda: pipeline(payload, signature, reply), number=args.rounds, repeat=5))
+                timings.append(seconds / args.rounds * 1e6)
+            plain_us, safe_us, naive_us = timings
+            print(f"{name:<16}{plain_us:>10.2f}{safe_us:>14.2f}{naive_us:>14.2f}{1e6 / safe_us:>20.0f}"
+                  f"{plain_us / safe_us:>10.0%}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
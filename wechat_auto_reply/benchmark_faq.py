@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+FAQ 检索性能测试
+生成指定规模的模拟问答库，统计索引编译耗时和单次查询延迟分布
+
+用法:
+    python benchmark_faq.py [--entries 20000] [--queries 5000] [--faq-file faq.json]
+"""
+
+import argparse
+import random
+import sys
+import time
+from typing import List, Tuple
+from faq_engine import FAQEngine
+
+# 查询延迟目标（毫秒）
+TARGET_P99_MS = 1.0
+
+_TEMPLATES = [
+    "如何{0}{1}", "{0}怎么{1}", "{0}的{1}在哪里", "为什么{0}不能{1}", "{0}{1}需要多久",
+    "可以{1}{0}吗", "{0}{1}失败怎么办", "请问{0}如何{1}", "{0}和{1}有什么区别", "{0}{1}收费吗",
+]
+
+def _random_word(rng: random.Random) -> str:
+    """生成由常用汉字组成的随机词"""
+    return ''.join(chr(rng.randint(0x4E00, 0x4E00 + 3000)) for _ in range(rng.randint(2, 3)))
+
+def generate_faq(count: int, seed: int = 42) -> List[Tuple[str, str]]:
+    """
+    生成模拟问答库：随机主题词套用常见问法模板
+    :param count: 问答对数量
+    :param seed: 随机种子
+    :return: (问题, 答案) 列表
+    """
+    rng = random.Random(seed)
+    subjects = [_random_word(rng) for _ in range(max(count // 20, 50))]
+    actions = [_random_word(rng) for _ in range(200)]
+    entries = []
+    for i in range(count):
+        question = rng.choice(_TEMPLATES).format(rng.choice(subjects), rng.choice(actions))
+        entries.append((question, f"答案{i}"))
+    return entries
+
+def generate_queries(entries: List[Tuple[str, str]], count: int, seed: int = 7) -> List[str]:
+    """
+    生成查询：大部分为改写过的库内问题（删字、加语气词），其余为库外随机消息
+    :param entries: 问答库
+    :param count: 查询数量
+    :param seed: 随机种子
+    :return: 查询列表
+    """
+    rng = random.Random(seed)
+    fillers = ["", "呢", "啊", "？", "你好，", "我想知道"]
+    queries = []
+    for _ in range(count):
+        if rng.random() < 0.2:
+            queries.append(_random_word(rng) + _random_word(rng) + _random_word(rng))
+            continue
+        question = rng.choice(entries)[0]
+        if len(question) > 4 and rng.random() < 0.5:
+            cut = rng.randrange(len(question))
+            question = question[:cut] + question[cut + 1:]
+        queries.append(rng.choice(fillers) + question + rng.choice(fillers))
+    return queries
+
+def run_benchmark(engine: FAQEngine, queries: List[str]) -> dict:
+    """
+    逐条查询并统计延迟
+    :param engine: FAQ检索引擎
+    :param queries: 查询列表
+    :return: 延迟分位数（毫秒）和命中率
+    """
+    # 预热，排除首次调用的缓存开销
+    for query in queries[:100]:
+        engine.answer(query)
+
+    latencies = []
+    hits = 0
+    clock = time.perf_counter
+    for query in queries:
+        start = clock()
+        reply = engine.answer(query)
+        latencies.append((clock() - start) * 1000)
+        if reply is not None:
+            hits += 1
+
+    latencies.sort()
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))]
+
+    return {
+        'queries': len(queries),
+        'hit_rate': hits / len(queries),
+        'mean_ms': sum(latencies) / len(latencies),
+        'p50_ms': percentile(0.50),
+        'p90_ms': percentile(0.90),
+        'p99_ms': percentile(0.99),
+        'max_ms': latencies[-1],
+    }
+
+def main(argv=None):
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description='FAQ 检索性能测试')
+    parser.add_argument('--entries', type=int, default=20000, help='模拟问答对数量')
+    parser.add_argument('--queries', type=int, default=5000, help='查询次数')
+    parser.add_argument('--faq-file', help='使用真实的FAQ文件代替模拟数据')
+    args = parser.parse_args(argv)
+
+    if args.faq_file:
+        start = time.perf_counter()
+        engine = FAQEngine.from_file(args.faq_file)
+        entries = [(entry.question, entry.answer) for entry in engine.entries]
+    else:
+        entries = generate_faq(args.entries)
+        start = time.perf_counter()
+        engine = FAQEngine(entries)
+    build_seconds = time.perf_counter() - start
+
+    info = engine.get_info()
+    print("=== FAQ 检索性能测试 ===")
+    print(f"问答对: {info['entries']}  二元组: {info['terms']}  平均长度: {info['avg_length']}")
+    print(f"索引编译耗时: {build_seconds:.2f}s")
+
+    result = run_benchmark(engine, generate_queries(entries, args.queries))
+    print(f"查询次数: {result['queries']}  命中率: {result['hit_rate']:.1%}")
+    print(f"延迟(ms): 平均 {result['mean_ms']:.3f}  P50 {result['p50_ms']:.3f}  "
+          f"P90 {result['p90_ms']:.3f}  P99 {result['p99_ms']:.3f}  最大 {result['max_ms']:.3f}")
+
+    if result['p99_ms'] < TARGET_P99_MS:
+        print(f"✅ P99 延迟低于 {TARGET_P99_MS}ms")
+        return 0
+    print(f"❌ P99 延迟超过 {TARGET_P99_MS}ms")
+    return 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+回复XML构造性能测试
+对比原处理器的 f-string 构造（再由 Flask 编码为字节）与预编码字节片段构造的耗时
+
+用法:
+    python benchmark_reply.py [--rounds 100000]
+"""
+
+import argparse
+import sys
+import time
+import timeit
+from typing import Callable
+from reply_builder import Article, build_news_reply, build_text_reply
+
+TO_USER = 'oUser123456789'
+FROM_USER = 'gh_123456789abc'
+CONTENTS = {
+    '短文本': '你好+1',
+    '含]]>文本': '数组写法 a[b[0]]>1 时需要拆分CDATA',
+    '长文本': '您好，我是智能客服助手！可以帮您：1.查询天气 2.了解服务 3.技术支持 4.投诉建议。' * 4,
+}
+
+def build_with_format(to_user: str, from_user: str, content: str) -> bytes:
+    """
+    原处理器的构造方式：f-string 生成字符串后编码为响应体
+    :param to_user: 接收用户
+    :param from_user: 公众号
+    :param content: 回复内容
+    :return: 回复XML字节
+    """
+    reply_xml = f"""<xml>
+<ToUserName><![CDATA[{to_user}]]></ToUserName>
+<FromUserName><![CDATA[{from_user}]]></FromUserName>
+<CreateTime>{int(time.time())}</CreateTime>
+<MsgType><![CDATA[text]]></MsgType>
+<Content><![CDATA[{content}]]></Content>
+</xml>"""
+    return reply_xml.encode('utf-8')
+
+def time_builder(builder: Callable[[], bytes], rounds: int, repeat: int = 5) -> float:
+    """
+    统计单次构造的平均耗时，取多轮中最快的一轮以减少干扰
+    :param builder: 无参数的构造函数
+    :param rounds: 每轮次数
+    :param repeat: 轮数
+    :return: 平均耗时（微秒）
+    """
+    return min(timeit.repeat(builder, number=rounds, repeat=repeat)) / rounds * 1e6
+
+def main(argv=None):
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description='回复XML构造性能测试')
+    parser.add_argument('--rounds', type=int, default=100000, help='每种回复每轮的构造次数')
+    args = parser.parse_args(argv)
+
+    print("=== 回复XML构造性能测试 ===")
+    print(f"{'回复':<12}{'f-string(us)':>14}{'字节片段(us)':>14}{'加速':>8}")
+    for name, content in CONTENTS.items():
+        format_us = time_builder(lambda: build_with_format(TO_USER, FROM_USER, content), args.rounds)
+        bytes_us = time_builder(lambda: build_text_reply(TO_USER, FROM_USER, content), args.rounds)
+        print(f"{name:<12}{format_us:>14.2f}{bytes_us:>14.2f}{format_us / bytes_us:>7.1f}x")
+
+    articles = [Article('标题', '描述', 'http://example.com/pic.jpg', 'http://example.com')] * 3
+    news_us = time_builder(lambda: build_news_reply(TO_USER, FROM_USER, articles), args.rounds)
+    print(f"{'图文(3篇)':<12}{'-':>14}{news_us:>14.2f}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+消息请求处理内存分配测试
+用 tracemalloc 对比原处理路径（请求体解码为字符串、DEBUG日志格式化全文、ElementTree解析、
+f-string 构造回复再编码）与字节路径（直接解析原始字节、字节模板构造回复）每个请求的内存峰值。
+规则匹配两条路径相同，不计入
+
+用法:
+    python benchmark_request.py [--rounds 2000]
+"""
+
+import argparse
+import sys
+import time
+import timeit
+import tracemalloc
+import xml.etree.ElementTree as ET
+from typing import Callable
+import xml_samples
+from xml_parser import BASE_FIELDS, parse_message
+from reply_builder import build_text_reply
+
+REPLY = '您好，我是智能客服助手！有什么可以帮您的吗？'
+
+def _long_text_message(length: int) -> bytes:
+    """
+    构造内容较长的文本消息
+    :param length: 内容字符数
+    :return: 消息XML
+    """
+    return xml_samples.TEXT_MESSAGE_SAMPLE.replace('你好', '长' * length).encode('utf-8')
+
+PAYLOADS = {
+    '文本消息': xml_samples.TEXT_MESSAGE_SAMPLE.encode('utf-8'),
+    '位置消息': xml_samples.LOCATION_MESSAGE_SAMPLE.encode('utf-8'),
+    '长文本(2000字)': _long_text_message(2000),
+}
+
+def text_pipeline(raw: bytes) -> bytes:
+    """
+    原处理路径
+    :param raw: 请求体
+    :return: 响应体
+    """
+    xml_data = raw.decode('utf-8')
+    # 原来的 logger.debug(f"消息内容: {xml_data}") 无论日志级别都会先格式化
+    debug_message = f"消息内容: {xml_data}"
+    root = ET.fromstring(xml_data)
+    msg_dict = {
+        field: root.find(field).text if root.find(field) is not None else ''
+        for field in BASE_FIELDS
+    }
+    reply_xml = f"""<xml>
+<ToUserName><![CDATA[{msg_dict['FromUserName']}]]></ToUserName>
+<FromUserName><![CDATA[{msg_dict['ToUserName']}]]></FromUserName>
+<CreateTime>{int(time.time())}</CreateTime>
+<MsgType><![CDATA[text]]></MsgType>
+<Content><![CDATA[{REPLY}]]></Content>
+</xml>"""
+    del debug_message
+    return reply_xml.encode('utf-8')
+
+def bytes_pipeline(raw: bytes) -> bytes:
+    """
+    字节处理路径
+    :param raw: 请求体
+    :return: 响应体
+    """
+    msg_dict = parse_message(raw)
+    return build_text_reply(msg_dict['FromUserName'], msg_dict['ToUserName'], REPLY)
+
+def peak_per_request(pipeline: Callable[[bytes], bytes], payload: bytes, rounds: int) -> float:
+    """
+    统计单个请求处理期间相对处理前的内存峰值
+    :param pipeline: 处理路径
+    :param payload: 请求体
+    :param rounds: 请求数
+    :return: 平均内存峰值（字节）
+    """
+    pipeline(payload)
+    tracemalloc.start()
+    total = 0
+    try:
+        for _ in range(rounds):
+            tracemalloc.reset_peak()
+            current = tracemalloc.get_traced_memory()[0]
+            pipeline(payload)
+            total += tracemalloc.get_traced_memory()[1] - current
+    finally:
+        tracemalloc.stop()
+    return total / rounds
+
+def main(argv=None):
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description='消息请求处理内存分配测试')
+    parser.add_argument('--rounds', type=int, default=2000, help='每个样例的请求数')
+    args = parser.parse_args(argv)
+
+    print("=== 消息请求处理内存分配测试 ===")
+    print(f"{'样例':<16}{'原路径峰值(B)':>14}{'字节路径峰值(B)':>16}{'节省':>8}"
+          f"{'原路径(us)':>12}{'字节路径(us)':>14}")
+    for name, payload in PAYLOADS.items():
+        text_peak = peak_per_request(text_pipeline, payload, args.rounds)
+        bytes_peak = peak_per_request(bytes_pipeline, payload, args.rounds)
+        text_us = min(timeit.repeat(lambda: text_pipeline(payload), number=args.rounds, repeat=3)) / args.rounds * 1e6
+        bytes_us = min(timeit.repeat(lambda: bytes_pipeline(payload), number=args.rounds, repeat=3)) / args.rounds * 1e6
+        print(f"{name:<16}{text_peak:>14.0f}{bytes_peak:>16.0f}{1 - bytes_peak / text_peak:>8.0%}"
+              f"{text_us:>12.2f}{bytes_us:>14.2f}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
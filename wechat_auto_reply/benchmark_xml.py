@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+消息XML解析性能测试
+用 xml_samples.py 中的消息样例对比 ElementTree 解析与单次扫描解析器的耗时
+
+用法:
+    python benchmark_xml.py [--rounds 20000]
+"""
+
+import argparse
+import sys
+import time
+import xml.etree.ElementTree as ET
+from typing import Callable, Dict, List
+import xml_samples
+from xml_parser import BASE_FIELDS, parse_message
+
+# 入站消息样例（不含回复样例）
+INBOUND_SAMPLES = {
+    name: getattr(xml_samples, name)
+    for name in dir(xml_samples)
+    if name.endswith('_SAMPLE') and 'REPLY' not in name
+}
+
+def parse_with_element_tree(xml_data: bytes) -> Dict[str, str]:
+    """
+    原处理器的解析方式：构建元素树后逐个字段查找（每个字段查找两次）
+    :param xml_data: 消息XML
+    :return: 基本字段字典
+    """
+    root = ET.fromstring(xml_data)
+    return {
+        field: root.find(field).text if root.find(field) is not None else ''
+        for field in BASE_FIELDS
+    }
+
+def time_parser(parser: Callable, payloads: List[bytes], rounds: int) -> float:
+    """
+    统计单条消息的平均解析耗时
+    :param parser: 解析函数
+    :param payloads: 消息列表
+    :param rounds: 轮数
+    :return: 平均耗时（微秒）
+    """
+    for payload in payloads:
+        parser(payload)
+    clock = time.perf_counter
+    start = clock()
+    for _ in range(rounds):
+        for payload in payloads:
+            parser(payload)
+    return (clock() - start) / (rounds * len(payloads)) * 1e6
+
+def main(argv=None):
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description='消息XML解析性能测试')
+    parser.add_argument('--rounds', type=int, default=20000, help='每个样例的解析次数')
+    args = parser.parse_args(argv)
+
+    print("=== 消息XML解析性能测试 ===")
+    print(f"{'样例':<28}{'ElementTree(us)':>16}{'单次扫描(us)':>14}{'加速':>8}")
+    total_tree = total_scan = 0.0
+    for name, sample in INBOUND_SAMPLES.items():
+        payload = [sample.encode('utf-8')]
+        tree_us = time_parser(parse_with_element_tree, payload, args.rounds)
+        scan_us = time_parser(parse_message, payload, args.rounds)
+        total_tree += tree_us
+        total_scan += scan_us
+        print(f"{name:<28}{tree_us:>16.2f}{scan_us:>14.2f}{tree_us / scan_us:>7.1f}x")
+
+    print(f"{'平均':<28}{total_tree / len(INBOUND_SAMPLES):>16.2f}"
+          f"{total_scan / len(INBOUND_SAMPLES):>14.2f}{total_tree / total_scan:>7.1f}x")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -5,12 +5,81 @@
 
 import os
 
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
 class Config:
     """基础配置类"""
     
     # 微信公众号Token（需要在微信公众平台设置）
     WECHAT_TOKEN = os.environ.get('WECHAT_TOKEN', 'your_wechat_token_here')
     
+    # 回复缓存最大条目数，设为0关闭缓存
+    REPLY_CACHE_SIZE = int(os.environ.get('REPLY_CACHE_SIZE', 1024))
+    
+    # 函数规则执行：线程池大小、单个处理函数超时、单条消息的总预算（秒）
+    FUNCTION_RULE_WORKERS = int(os.environ.get('FUNCTION_RULE_WORKERS', 4))
+    FUNCTION_RULE_TIMEOUT = float(os.environ.get('FUNCTION_RULE_TIMEOUT', 1.0))
+    FUNCTION_RULE_BUDGET = float(os.environ.get('FUNCTION_RULE_BUDGET', 3.0))
+    
+    # 函数规则熔断：连续失败次数阈值和冷却时间（秒）
+    FUNCTION_RULE_FAILURE_THRESHOLD = int(os.environ.get('FUNCTION_RULE_FAILURE_THRESHOLD', 5))
+    FUNCTION_RULE_RESET_TIMEOUT = float(os.environ.get('FUNCTION_RULE_RESET_TIMEOUT', 30.0))
+    
+    # 规则目录文件（JSON/CSV/SQLite），为空时使用内置默认规则
+    RULES_FILE = os.environ.get('RULES_FILE', '')
+    # 规则编译缓存文件，默认为规则文件路径加 .cache 后缀
+    RULES_CACHE_FILE = os.environ.get('RULES_CACHE_FILE')
+    # 规则文件热加载的轮询间隔（秒），设为0关闭热加载
+    RULES_RELOAD_INTERVAL = float(os.environ.get('RULES_RELOAD_INTERVAL', 2.0))
+    
+    # FAQ问答库文件（JSON/CSV），为空时不启用FAQ检索；低于最低置信度的检索结果不回复
+    FAQ_FILE = os.environ.get('FAQ_FILE', '')
+    FAQ_MIN_CONFIDENCE = float(os.environ.get('FAQ_MIN_CONFIDENCE', 0.35))
+    # FAQ检索未命中时按字符n-gram余弦相似度兜底匹配（需要numpy），设为0关闭
+    FAQ_SIMILARITY_THRESHOLD = float(os.environ.get('FAQ_SIMILARITY_THRESHOLD', 0.6))
+    
+    # 模糊规则（fuzzy）允许的最大编辑距离
+    FUZZY_MAX_DISTANCE = int(os.environ.get('FUZZY_MAX_DISTANCE', 1))
+    
+    # 多轮对话会话：有效期（秒）、最大会话数和内存上限（MB），超出上限时淘汰最久未使用的会话
+    SESSION_TTL = float(os.environ.get('SESSION_TTL', 300))
+    SESSION_MAX_COUNT = int(os.environ.get('SESSION_MAX_COUNT', 1000000))
+    SESSION_MAX_MEMORY_MB = int(os.environ.get('SESSION_MAX_MEMORY_MB', 256))
+    
+    # 消息请求体大小上限（字节），超出时不读取请求体，直接返回413
+    MAX_BODY_SIZE = int(os.environ.get('MAX_BODY_SIZE', 64 * 1024))
+    
+    # 消息幂等处理：memory（进程内）、sqlite（gunicorn多个工作进程共享）或 none（关闭）；
+    # 已完成回复的保留时间（秒）和重试请求等待第一次处理的最长时间（秒，需小于微信的5秒超时）
+    IDEMPOTENCY_BACKEND = os.environ.get('IDEMPOTENCY_BACKEND', 'memory')
+    IDEMPOTENCY_DB = os.environ.get('IDEMPOTENCY_DB', os.path.join(BASE_DIR, 'idempotency.db'))
+    IDEMPOTENCY_TTL = float(os.environ.get('IDEMPOTENCY_TTL', 30))
+    IDEMPOTENCY_WAIT = float(os.environ.get('IDEMPOTENCY_WAIT', 4.0))
+    
+    # 异步回复：回复生成超过截止时间（秒，从收到请求起计算，需小于微信的5秒超时）时先回复 success，
+    # 生成完成后通过客服消息接口发送；工作线程数和排队任务数上限
+    ASYNC_REPLY_ENABLED = os.environ.get('ASYNC_REPLY_ENABLED', 'False').lower() == 'true'
+    ASYNC_REPLY_DEADLINE = float(os.environ.get('ASYNC_REPLY_DEADLINE', 4.0))
+    ASYNC_REPLY_WORKERS = int(os.environ.get('ASYNC_REPLY_WORKERS', 4))
+    ASYNC_REPLY_MAX_PENDING = int(os.environ.get('ASYNC_REPLY_MAX_PENDING', 1000))
+    # 客服消息接口的调用凭证和地址
+    WECHAT_ACCESS_TOKEN = os.environ.get('WECHAT_ACCESS_TOKEN', '')
+    CUSTOMER_SERVICE_API_URL = os.environ.get('CUSTOMER_SERVICE_API_URL',
+                                              'https://api.weixin.qq.com/cgi-bin/message/custom/send')
+    
+    # 安全模式：消息加解密密钥（EncodingAESKey，43个字符）和公众号AppID，配置密钥后处理加密消息
+    WECHAT_ENCODING_AES_KEY = os.environ.get('WECHAT_ENCODING_AES_KEY', '')
+    WECHAT_APPID = os.environ.get('WECHAT_APPID', '')
+    
+    # 用户关注公众号时的欢迎语，可以使用回复模板变量，为空时不回复
+    WELCOME_MESSAGE = os.environ.get('WELCOME_MESSAGE', "感谢关注！发送'帮助'查看我能为您做什么。")
+    
+    # 回复模板中时间变量使用的时区（相对UTC的小时数），默认北京时间
+    REPLY_UTC_OFFSET = float(os.environ.get('REPLY_UTC_OFFSET', 8))
+    
+    # 智能问答意图表
+    INTENTS_FILE = os.environ.get('INTENTS_FILE', os.path.join(BASE_DIR, 'intents.json'))
+    
     # 日志配置
     LOG_LEVEL = 'INFO'
     LOG_FILE = 'wechat_auto_reply.log'
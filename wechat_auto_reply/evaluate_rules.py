@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+规则离线评估工具
+读取 JSONL 格式的历史消息，用当前（或指定文件中的）规则集批量匹配，输出覆盖率报告
+
+用法:
+    python evaluate_rules.py messages.jsonl [--rules rules.json] [--report report.json]
+                             [--output results.jsonl] [--field content] [--processes 4]
+
+输入文件每行一个 JSON 对象（读取 --field 指定的字段）或 JSON 字符串
+"""
+
+import argparse
+import json
+import sys
+import time
+from collections import Counter, deque
+from typing import Dict, Iterator, Optional, TextIO
+from reply_rules import ReplyRuleManager, reply_manager
+from rule_loader import load_rules_file
+
+def read_messages(stream: TextIO, field: str, counters: Counter) -> Iterator[str]:
+    """
+    逐行读取消息，无法解析的行跳过并计数
+    :param stream: JSONL 输入流
+    :param field: 消息对象中的内容字段
+    :param counters: 记录 invalid_lines 的计数器
+    :return: 消息内容迭代器
+    """
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            counters['invalid_lines'] += 1
+            continue
+
+        if isinstance(record, dict):
+            record = record.get(field)
+        if not isinstance(record, str):
+            counters['invalid_lines'] += 1
+            continue
+        yield record
+
+def evaluate(manager: ReplyRuleManager, stream: TextIO, field: str = 'content',
+             processes: Optional[int] = None, chunksize: int = 256,
+             output: Optional[TextIO] = None, top: int = 20) -> Dict:
+    """
+    批量评估消息并生成覆盖率报告
+    :param manager: 规则管理器
+    :param stream: JSONL 输入流
+    :param field: 消息对象中的内容字段
+    :param processes: 工作进程数，默认为CPU核数
+    :param chunksize: 每次分发给工作进程的消息条数
+    :param output: 逐条结果输出流，为None时不输出
+    :param top: 报告中列出的高频未命中消息条数
+    :return: 覆盖率报告
+    """
+    start = time.perf_counter()
+    rule_set = manager.get_rule_set()
+    counters = Counter()
+    rule_hits = Counter()
+    unmatched = Counter()
+
+    # 结果按输入顺序返回，记下已分发的消息与结果一一对应
+    messages = read_messages(stream, field, counters)
+    pending = deque()
+
+    def remember(source):
+        for content in source:
+            pending.append(content)
+            yield content
+
+    for rule_name, reply in manager.find_replies(remember(messages), processes, chunksize):
+        content = pending.popleft()
+        counters['total'] += 1
+        if rule_name is None:
+            unmatched[content.strip()] += 1
+        else:
+            counters['matched'] += 1
+            rule_hits[rule_name] += 1
+
+        if output is not None:
+            output.write(json.dumps({'content': content, 'rule': rule_name, 'reply': reply},
+                                    ensure_ascii=False) + '\n')
+
+    total = counters['total']
+    rule_names = [rule.name for rule in rule_set.rules] + list(rule_set.function_rules)
+    return {
+        'rule_set_version': rule_set.version,
+        'total': total,
+        'matched': counters['matched'],
+        'unmatched': total - counters['matched'],
+        'coverage': round(counters['matched'] / total, 4) if total else 0.0,
+        'invalid_lines': counters['invalid_lines'],
+        'rule_hits': dict(rule_hits.most_common()),
+        'unused_rules': [name for name in dict.fromkeys(rule_names) if name not in rule_hits],
+        'top_unmatched': [{'content': content, 'count': count} for content, count in unmatched.most_common(top)],
+        'elapsed_seconds': round(time.perf_counter() - start, 3)
+    }
+
+def main(argv=None):
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description='用规则集批量匹配历史消息，输出覆盖率报告')
+    parser.add_argument('input', help='JSONL 消息文件，- 表示标准输入')
+    parser.add_argument('--rules', help='规则文件（JSON/CSV/SQLite），默认使用内置规则')
+    parser.add_argument('--field', default='content', help='消息对象中的内容字段（默认 content）')
+    parser.add_argument('--report', help='覆盖率报告输出路径，默认输出到标准输出')
+    parser.add_argument('--output', help='逐条匹配结果的 JSONL 输出路径')
+    parser.add_argument('--processes', type=int, default=None, help='工作进程数，默认为CPU核数')
+    parser.add_argument('--chunksize', type=int, default=256, help='每次分发给工作进程的消息条数')
+    parser.add_argument('--top', type=int, default=20, help='报告中列出的高频未命中消息条数')
+    args = parser.parse_args(argv)
+
+    if args.rules:
+        load_rules_file(reply_manager, args.rules)
+
+    stream = sys.stdin if args.input == '-' else open(args.input, 'r', encoding='utf-8')
+    output = open(args.output, 'w', encoding='utf-8') if args.output else None
+    try:
+        report = evaluate(reply_manager, stream, args.field, args.processes,
+                          args.chunksize, output, args.top)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+        if output is not None:
+            output.close()
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+        print(f"已评估 {report['total']} 条消息，覆盖率 {report['coverage']:.2%}，报告已写入 {args.report}")
+    else:
+        print(text)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""
+FAQ 检索引擎
+以字符二元组建立问题的倒排索引，按 BM25 打分检索最相近的问题，
+作为函数规则注册到回复规则管理器
+"""
+
+import csv
+import heapq
+import json
+import logging
+import math
+import os
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+from text_normalizer import normalize_message
+
+logger = logging.getLogger(__name__)
+
+# 建索引时忽略的字符：空白、标点和符号
+_SEPARATOR_RE = re.compile(r'[\W_]+')
+
+class FAQEntry(NamedTuple):
+    """FAQ 问答对"""
+    question: str
+    answer: str
+
+class FAQHit(NamedTuple):
+    """检索结果"""
+    entry: FAQEntry
+    score: float
+    confidence: float
+
+def char_bigrams(text: str) -> List[str]:
+    """
+    把文本切分为字符二元组，中文无需分词
+    标点和空白处断开，不跨越分隔符组合；只有一个字符的片段保留单字
+    :param text: 已规范化的文本
+    :return: 二元组列表（含重复）
+    """
+    grams = []
+    for piece in _SEPARATOR_RE.split(text):
+        if len(piece) == 1:
+            grams.append(piece)
+        else:
+            grams.extend(piece[i:i + 2] for i in range(len(piece) - 1))
+    return grams
+
+def read_faq_file(path: str) -> List[Tuple[str, str]]:
+    """
+    读取问答库文件
+    JSON 文件为 {"question", "answer"} 对象列表；CSV 文件首行为 question,answer 表头
+    :param path: 文件路径
+    :return: (问题, 答案) 列表，缺少问题或答案的行被忽略
+    """
+    suffix = os.path.splitext(path)[1].lower()
+    if suffix == '.csv':
+        with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+            rows = list(csv.DictReader(f))
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            rows = json.load(f)
+
+    entries = [(row['question'], row['answer']) for row in rows
+               if row.get('question') and row.get('answer')]
+    logger.info(f"从 {path} 加载 {len(entries)} 条FAQ")
+    return entries
+
+class FAQEngine:
+    """
+    BM25 FAQ 检索引擎
+    建索引时为每个倒排项预先算好 BM25 分值，查询时只需累加；
+    按 MaxScore 思路先处理上界高的稀有二元组，剩余二元组的上界之和
+    已不足以让新问题达到阈值时，只为已有候选补分，不再扩展候选集合
+    """
+
+    def __init__(self, entries: Iterable[Tuple[str, str]], k1: float = 1.2, b: float = 0.75,
+                 min_confidence: float = 0.35):
+        """
+        编译索引
+        :param entries: (问题, 答案) 序列
+        :param k1: BM25 词频饱和参数
+        :param b: BM25 文档长度归一化参数
+        :param min_confidence: 最低置信度，低于该值的结果不返回
+        """
+        self.entries: List[FAQEntry] = [FAQEntry(question, answer) for question, answer in entries]
+        self.k1 = k1
+        self.b = b
+        self.min_confidence = min_confidence
+
+        doc_terms = [Counter(char_bigrams(normalize_message(entry.question).folded)) for entry in self.entries]
+        lengths = [sum(terms.values()) for terms in doc_terms]
+        self.avg_length = (sum(lengths) / len(lengths)) if lengths else 0.0
+
+        document_frequency = Counter()
+        for terms in doc_terms:
+            document_frequency.update(terms.keys())
+
+        count = len(self.entries)
+        # 未出现在索引中的二元组按文档频率为0计算IDF，用于置信度的分母
+        self._unseen_idf = self._idf(0)
+        self._idf_of: Dict[str, float] = {
+            term: self._idf(df) for term, df in document_frequency.items()
+        }
+
+        # 倒排表：二元组 -> {问题序号: 预计算的BM25分值}，以及该二元组的分值上界
+        self._postings: Dict[str, Dict[int, float]] = {}
+        self._upper_bound: Dict[str, float] = {}
+        for doc_id, terms in enumerate(doc_terms):
+            norm = k1 * (1 - b + b * lengths[doc_id] / self.avg_length) if self.avg_length else k1
+            for term, tf in terms.items():
+                impact = self._idf_of[term] * tf * (k1 + 1) / (tf + norm)
+                self._postings.setdefault(term, {})[doc_id] = impact
+                if impact > self._upper_bound.get(term, 0.0):
+                    self._upper_bound[term] = impact
+
+        logger.info(f"FAQ索引编译完成: {count} 个问题, {len(self._postings)} 个二元组")
+
+    def _idf(self, df: int) -> float:
+        """
+        BM25 逆文档频率（加1平滑，始终为正）
+        :param df: 文档频率
+        :return: IDF值
+        """
+        return math.log(1 + (len(self.entries) - df + 0.5) / (df + 0.5))
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs) -> 'FAQEngine':
+        """
+        从问答库文件加载
+        :param path: 文件路径，格式见 read_faq_file
+        :return: FAQ检索引擎
+        """
+        return cls(read_faq_file(path), **kwargs)
+
+    def search(self, query: str, top_k: int = 1, min_confidence: Optional[float] = None) -> List[FAQHit]:
+        """
+        检索与用户输入最相近的问题
+        置信度为得分除以理想得分（每个查询二元组都以平均长度问题中出现一次计）
+        :param query: 用户输入
+        :param top_k: 最多返回的结果数
+        :param min_confidence: 最低置信度，默认使用引擎配置
+        :return: 按得分从高到低排列的结果
+        """
+        if min_confidence is None:
+            min_confidence = self.min_confidence
+
+        query_terms = Counter(char_bigrams(normalize_message(query).folded))
+        if not query_terms or not self.entries:
+            return []
+
+        idf_of = self._idf_of
+        unseen = self._unseen_idf
+        ideal = sum(qtf * idf_of.get(term, unseen) for term, qtf in query_terms.items())
+
+        # 只保留索引中存在的二元组，按分值上界从高到低处理
+        terms = sorted(
+            ((qtf * self._upper_bound[term], qtf, term) for term, qtf in query_terms.items()
+             if term in self._postings),
+            reverse=True
+        )
+        remaining = [0.0] * (len(terms) + 1)
+        for i in range(len(terms) - 1, -1, -1):
+            remaining[i] = remaining[i + 1] + terms[i][0]
+
+        floor = min_confidence * ideal
+        scores: Dict[int, float] = {}
+        expanding = True
+        for i, (_, qtf, term) in enumerate(terms):
+            postings = self._postings[term]
+            if expanding:
+                # 剩余二元组全部命中也达不到阈值或当前第k名时，新问题不可能进入结果
+                threshold = floor
+                if len(scores) >= top_k:
+                    threshold = max(threshold, heapq.nlargest(top_k, scores.values())[-1])
+                if remaining[i] < threshold:
+                    expanding = False
+
+            if expanding:
+                for doc_id, impact in postings.items():
+                    scores[doc_id] = scores.get(doc_id, 0.0) + qtf * impact
+            else:
+                if not scores:
+                    break
+                for doc_id in scores:
+                    impact = postings.get(doc_id)
+                    if impact is not None:
+                        scores[doc_id] += qtf * impact
+
+        best = heapq.nlargest(top_k, scores.items(), key=lambda item: (item[1], -item[0]))
+        return [
+            FAQHit(self.entries[doc_id], score, score / ideal)
+            for doc_id, score in best
+            if score >= floor
+        ]
+
+    def answer(self, user_content: str) -> Optional[str]:
+        """
+        函数规则处理函数：返回置信度足够的最佳答案
+        :param user_content: 用户输入
+        :return: 答案或None
+        """
+        hits = self.search(user_content)
+        if not hits:
+            return None
+        return hits[0].entry.answer
+
+    def register(self, manager, name: str = 'FAQ检索'):
+        """
+        注册为函数规则；检索只占用亚毫秒级CPU且不会阻塞，在请求线程内直接执行
+        :param manager: 回复规则管理器
+        :param name: 函数规则名称
+        """
+        manager.register_function_rule(name, self.answer, inline=True)
+
+    def get_info(self) -> Dict:
+        """
+        获取索引概况
+        :return: 问题数、二元组数和平均长度
+        """
+        return {
+            'entries': len(self.entries),
+            'terms': len(self._postings),
+            'avg_length': round(self.avg_length, 2),
+            'min_confidence': self.min_confidence
+        }
+
+    def __len__(self):
+        return len(self.entries)
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+函数规则执行器
+在有界线程池中执行函数规则，限制单个处理函数的耗时，并对持续失败的处理函数熔断
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class CircuitBreaker:
+    """
+    熔断器
+    连续失败达到阈值后打开，冷却期内直接跳过；冷却结束后放行一次试探调用，成功则恢复
+    """
+    
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+    
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        初始化熔断器
+        :param failure_threshold: 触发熔断的连续失败次数
+        :param reset_timeout: 熔断后的冷却时间（秒）
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+    
+    def allow(self) -> bool:
+        """
+        判断是否允许调用
+        :return: 是否允许
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                # 冷却结束，只放行一次试探调用
+                self.state = self.HALF_OPEN
+                return True
+            return False
+    
+    def cancel_probe(self):
+        """放行的试探调用没有执行（预算耗尽、线程池已满等），重新打开并开始新的冷却期"""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+    
+    def record_success(self):
+        """记录一次成功调用"""
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+    
+    def record_failure(self) -> bool:
+        """
+        记录一次失败调用
+        :return: 本次失败是否导致熔断器打开
+        """
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                opened = self.state != self.OPEN
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                return opened
+            return False
+
+class FunctionRuleExecutor:
+    """
+    函数规则执行器
+    处理函数在线程池中运行，调用方最多等待到截止时间；超时的任务在后台继续运行直至结束，
+    并继续占用名额，名额耗尽时新的调用直接跳过，不会在请求线程中排队
+    """
+    
+    def __init__(self, max_workers: int = 4, timeout: float = 1.0, budget: float = 3.0,
+                 failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        初始化执行器
+        :param max_workers: 线程池大小，同时也是在途任务数量上限
+        :param timeout: 单个处理函数的默认超时时间（秒）
+        :param budget: 一次查找中全部函数规则的总耗时预算（秒）
+        :param failure_threshold: 熔断器的连续失败阈值
+        :param reset_timeout: 熔断器的冷却时间（秒）
+        """
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.budget = budget
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='function-rule')
+        self._slots = threading.BoundedSemaphore(max_workers)
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._breakers_lock = threading.Lock()
+    
+    def get_breaker(self, name: str) -> CircuitBreaker:
+        """
+        获取处理函数对应的熔断器
+        :param name: 函数规则名称
+        :return: 熔断器
+        """
+        breaker = self._breakers.get(name)
+        if breaker is None:
+            with self._breakers_lock:
+                breaker = self._breakers.get(name)
+                if breaker is None:
+                    breaker = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+                    self._breakers[name] = breaker
+        return breaker
+    
+    def new_deadline(self) -> float:
+        """
+        计算一次查找的截止时间
+        :return: time.monotonic() 时间点
+        """
+        return time.monotonic() + self.budget
+    
+    def call(self, name: str, handler: Callable, user_content: str,
+             deadline: float, timeout: Optional[float] = None, inline: bool = False) -> Tuple[Optional[str], bool]:
+        """
+        执行一个函数规则
+        :param name: 函数规则名称
+        :param handler: 处理函数
+        :param user_content: 用户输入
+        :param deadline: 本次查找的截止时间
+        :param timeout: 该处理函数的超时时间，默认使用执行器配置
+        :param inline: 是否在当前线程直接执行，仅用于不会阻塞的内置处理函数
+        :return: (回复内容, 是否正常完成)
+        """
+        if inline:
+            try:
+                return handler(user_content), True
+            except Exception as e:
+                logger.error(f"函数规则 {name} 执行失败: {str(e)}")
+                return None, False
+        
+        # 先检查预算和名额，再询问熔断器：熔断器放行试探调用后，调用必须真正执行并记录结果，
+        # 否则熔断器会一直停留在半开状态
+        remaining = min(timeout if timeout is not None else self.timeout, deadline - time.monotonic())
+        if remaining <= 0:
+            logger.warning(f"函数规则 {name} 未执行：已超出本次查找的时间预算")
+            return None, False
+        
+        if not self._slots.acquire(blocking=False):
+            logger.warning(f"函数规则 {name} 未执行：线程池已满")
+            return None, False
+        
+        breaker = self.get_breaker(name)
+        if not breaker.allow():
+            self._slots.release()
+            logger.debug(f"函数规则 {name} 已熔断，跳过执行")
+            return None, False
+        
+        try:
+            future = self._pool.submit(handler, user_content)
+        except RuntimeError as e:
+            self._slots.release()
+            breaker.cancel_probe()
+            logger.error(f"函数规则 {name} 提交失败: {str(e)}")
+            return None, False
+        future.add_done_callback(lambda _: self._slots.release())
+        
+        try:
+            reply = future.result(timeout=remaining)
+        except FutureTimeoutError:
+            logger.warning(f"函数规则 {name} 执行超时（{remaining:.3f}秒）")
+            self._record_failure(name, breaker)
+            return None, False
+        except Exception as e:
+            logger.error(f"函数规则 {name} 执行失败: {str(e)}")
+            self._record_failure(name, breaker)
+            return None, False
+        
+        breaker.record_success()
+        return reply, True
+    
+    def _record_failure(self, name: str, breaker: CircuitBreaker):
+        """
+        记录失败并在熔断器打开时告警
+        :param name: 函数规则名称
+        :param breaker: 熔断器
+        """
+        if breaker.record_failure():
+            logger.warning(f"函数规则 {name} 连续失败 {breaker.failures} 次，熔断 {breaker.reset_timeout} 秒")
+    
+    def get_breaker_states(self) -> Dict[str, str]:
+        """
+        获取各函数规则的熔断状态
+        :return: {规则名称: 状态}
+        """
+        with self._breakers_lock:
+            return {name: breaker.state for name, breaker in self._breakers.items()}
+    
+    def shutdown(self, wait: bool = False):
+        """
+        关闭线程池
+        :param wait: 是否等待在途任务结束
+        """
+        self._pool.shutdown(wait=wait)
@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+"""
+消息幂等处理
+微信服务器在5秒内收不到响应时会重试同一条消息（最多3次）。按 MsgId（事件按 FromUserName+CreateTime）
+记录正在处理的消息和已生成的回复：重试请求等待第一次处理完成或直接取回它的回复，
+不会重复解析、匹配和调用函数规则
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, NamedTuple, Optional
+from config import Config
+
+class ReplyClaim(NamedTuple):
+    """登记消息的结果"""
+    # 是否由本次请求生成回复；为False时 reply 是第一次处理的回复
+    owner: bool
+    # 已完成的回复（空字节表示不回复），等待超时为None
+    reply: Optional[bytes]
+
+def message_key(msg_dict: Dict[str, str]) -> Optional[str]:
+    """
+    消息的幂等键
+    :param msg_dict: 消息字典
+    :return: 普通消息为 MsgId，事件为 FromUserName:CreateTime，缺少字段时返回None
+    """
+    msg_id = msg_dict.get('MsgId')
+    if msg_id:
+        return msg_id
+    from_user = msg_dict.get('FromUserName')
+    create_time = msg_dict.get('CreateTime')
+    if from_user and create_time:
+        return f"{from_user}:{create_time}"
+    return None
+
+class _Entry:
+    """幂等条目：处理中的标记或已完成的回复"""
+
+    __slots__ = ('done', 'reply', 'expires')
+
+    def __init__(self, done: bool, reply: Optional[bytes], expires: float):
+        self.done = done
+        self.reply = reply
+        self.expires = expires
+
+class MemoryIdempotencyStore:
+    """
+    进程内的幂等存储
+    处理中标记和已完成的回复有效期不同，分别按写入顺序存放，每一队的到期时间随写入顺序递增，
+    过期条目从各自最旧的一端清除；等待中的重试请求由条件变量唤醒
+    """
+
+    def __init__(self, ttl: float = 30.0, inflight_timeout: float = 15.0, max_entries: int = 100000,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        初始化幂等存储
+        :param ttl: 已完成回复的保留时间（秒），覆盖微信的全部重试
+        :param inflight_timeout: 处理中标记的有效期（秒），超时后重试请求可以接管处理
+        :param max_entries: 最大条目数
+        :param clock: 单调时钟，测试时可以替换
+        """
+        self.ttl = ttl
+        self.inflight_timeout = inflight_timeout
+        self.max_entries = max_entries
+        self._clock = clock
+        # 处理中标记和已完成的回复，同一个键只出现在其中一个里
+        self._inflight: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._done: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._cond = threading.Condition()
+        self.owners = 0
+        self.replays = 0
+        self.timeouts = 0
+        self.evictions = 0
+
+    def _purge(self, now: float):
+        """清除两队最旧一端的过期条目；超出容量时先淘汰最旧的回复，正在处理的消息最后淘汰"""
+        for entries in (self._inflight, self._done):
+            while entries and next(iter(entries.values())).expires <= now:
+                entries.popitem(last=False)
+        while len(self._inflight) + len(self._done) > self.max_entries:
+            (self._done or self._inflight).popitem(last=False)
+            self.evictions += 1
+
+    def _get(self, key: str) -> Optional[_Entry]:
+        entry = self._done.get(key)
+        if entry is None:
+            entry = self._inflight.get(key)
+        return entry
+
+    def acquire(self, key: str, wait: float = 0.0) -> ReplyClaim:
+        """
+        登记消息
+        没有记录时写入处理中标记，由本次请求处理；已有回复时直接返回；正在处理时最多等待 wait 秒
+        :param key: 幂等键
+        :param wait: 等待第一次处理完成的最长时间（秒）
+        :return: 登记结果
+        """
+        with self._cond:
+            now = self._clock()
+            deadline = now + wait
+            while True:
+                self._purge(now)
+                entry = self._get(key)
+                if entry is None or entry.expires <= now:
+                    self._done.pop(key, None)
+                    self._inflight.pop(key, None)
+                    self._inflight[key] = _Entry(False, None, now + self.inflight_timeout)
+                    self._purge(now)
+                    self.owners += 1
+                    return ReplyClaim(True, None)
+                if entry.done:
+                    self.replays += 1
+                    return ReplyClaim(False, entry.reply)
+                if now >= deadline:
+                    self.timeouts += 1
+                    return ReplyClaim(False, None)
+                # 处理中标记到期时也要醒来接管
+                self._cond.wait(min(deadline, entry.expires) - now)
+                now = self._clock()
+
+    def complete(self, key: str, reply: bytes):
+        """
+        记录生成的回复，并唤醒等待中的重试请求
+        :param key: 幂等键
+        :param reply: 回复XML字节，空字节表示不回复
+        """
+        with self._cond:
+            now = self._clock()
+            self._inflight.pop(key, None)
+            self._done.pop(key, None)
+            self._done[key] = _Entry(True, reply, now + self.ttl)
+            self._purge(now)
+            self._cond.notify_all()
+
+    def release(self, key: str):
+        """
+        处理失败时删除处理中标记，后续重试重新处理
+        :param key: 幂等键
+        """
+        with self._cond:
+            self._inflight.pop(key, None)
+            self._cond.notify_all()
+
+    def clear(self):
+        """清空全部条目，保留统计计数"""
+        with self._cond:
+            self._inflight.clear()
+            self._done.clear()
+            self._cond.notify_all()
+
+    def stats(self) -> Dict:
+        """
+        获取统计信息
+        :return: 统计信息字典
+        """
+        with self._cond:
+            self._purge(self._clock())
+            return {
+                'backend': 'memory',
+                'size': len(self),
+                'owners': self.owners,
+                'replays': self.replays,
+                'timeouts': self.timeouts,
+                'evictions': self.evictions
+            }
+
+    def __len__(self):
+        return len(self._inflight) + len(self._done)
+
+class SQLiteIdempotencyStore:
+    """
+    多进程共享的幂等存储
+    gunicorn 的各工作进程打开同一个 WAL 模式的 SQLite 文件，登记消息在 IMMEDIATE 事务中完成，
+    同一条消息只有一个进程能写入处理中标记；其他进程的重试请求轮询等待回复
+    """
+
+    # 每完成多少条消息清除一次过期条目
+    PURGE_INTERVAL = 256
+
+    def __init__(self, path: str, ttl: float = 30.0, inflight_timeout: float = 15.0,
+                 poll_interval: float = 0.05, clock: Callable[[], float] = time.time):
+        """
+        初始化幂等存储
+        :param path: 数据库文件路径
+        :param ttl: 已完成回复的保留时间（秒）
+        :param inflight_timeout: 处理中标记的有效期（秒）
+        :param poll_interval: 等待回复时的轮询间隔（秒）
+        :param clock: 时钟，多个进程之间必须一致，默认为系统时间
+        """
+        self.path = path
+        self.ttl = ttl
+        self.inflight_timeout = inflight_timeout
+        self.poll_interval = poll_interval
+        self._clock = clock
+        self._local = threading.local()
+        self._completed = 0
+        self.owners = 0
+        self.replays = 0
+        self.timeouts = 0
+
+        conn = self._connection()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS replies ('
+            'key TEXT PRIMARY KEY, done INTEGER NOT NULL, reply BLOB, expires REAL NOT NULL)'
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        """
+        当前线程的数据库连接
+        连接不能跨线程使用，也不能在 fork 之后继续使用，按线程和进程分别创建
+        :return: 数据库连接
+        """
+        pid = os.getpid()
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != pid:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = pid
+        return conn
+
+    def _claim(self, conn: sqlite3.Connection, key: str) -> ReplyClaim:
+        """
+        在事务中查询消息，没有记录或已过期时写入处理中标记
+        :return: 登记结果，正在处理时 owner 为False且 reply 为None
+        """
+        now = self._clock()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT done, reply, expires FROM replies WHERE key = ?', (key,)).fetchone()
+            if row is None or row[2] <= now:
+                conn.execute(
+                    'INSERT OR REPLACE INTO replies (key, done, reply, expires) VALUES (?, 0, NULL, ?)',
+                    (key, now + self.inflight_timeout)
+                )
+                claim = ReplyClaim(True, None)
+            elif row[0]:
+                claim = ReplyClaim(False, row[1])
+            else:
+                claim = ReplyClaim(False, None)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return claim
+
+    def acquire(self, key: str, wait: float = 0.0) -> ReplyClaim:
+        """
+        登记消息
+        没有记录时写入处理中标记，由本次请求处理；已有回复时直接返回；正在处理时最多等待 wait 秒
+        :param key: 幂等键
+        :param wait: 等待第一次处理完成的最长时间（秒）
+        :return: 登记结果
+        """
+        conn = self._connection()
+        deadline = time.monotonic() + wait
+        while True:
+            claim = self._claim(conn, key)
+            if claim.owner:
+                self.owners += 1
+                return claim
+            if claim.reply is not None:
+                self.replays += 1
+                return claim
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.timeouts += 1
+                return claim
+            time.sleep(min(self.poll_interval, remaining))
+
+    def complete(self, key: str, reply: bytes):
+        """
+        记录生成的回复
+        :param key: 幂等键
+        :param reply: 回复XML字节，空字节表示不回复
+        """
+        conn = self._connection()
+        now = self._clock()
+        conn.execute(
+            'INSERT OR REPLACE INTO replies (key, done, reply, expires) VALUES (?, 1, ?, ?)',
+            (key, reply, now + self.ttl)
+        )
+        self._completed += 1
+        if self._completed % self.PURGE_INTERVAL == 0:
+            conn.execute('DELETE FROM replies WHERE expires <= ?', (now,))
+
+    def release(self, key: str):
+        """
+        处理失败时删除处理中标记，后续重试重新处理
+        :param key: 幂等键
+        """
+        self._connection().execute('DELETE FROM replies WHERE key = ? AND done = 0', (key,))
+
+    def clear(self):
+        """清空全部条目，保留统计计数"""
+        self._connection().execute('DELETE FROM replies')
+
+    def stats(self) -> Dict:
+        """
+        获取统计信息，计数为当前进程的数据
+        :return: 统计信息字典
+        """
+        size = self._connection().execute(
+            'SELECT COUNT(*) FROM replies WHERE expires > ?', (self._clock(),)
+        ).fetchone()[0]
+        return {
+            'backend': 'sqlite',
+            'path': self.path,
+            'size': size,
+            'owners': self.owners,
+            'replays': self.replays,
+            'timeouts': self.timeouts
+        }
+
+def create_idempotency_store(backend: Optional[str] = None):
+    """
+    按配置创建幂等存储
+    :param backend: memory（进程内）、sqlite（多进程共享）或 none（关闭），默认按配置
+    :return: 幂等存储，关闭时返回None
+    """
+    backend = (backend or Config.IDEMPOTENCY_BACKEND).lower()
+    if backend == 'none':
+        return None
+    if backend == 'sqlite':
+        return SQLiteIdempotencyStore(Config.IDEMPOTENCY_DB, ttl=Config.IDEMPOTENCY_TTL)
+    if backend == 'memory':
+        return MemoryIdempotencyStore(ttl=Config.IDEMPOTENCY_TTL)
+    raise ValueError(f"未知的幂等存储类型: {backend}")
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+意图表
+从配置文件加载"关键词-意图-回复"表，编译为一次扫描即可完成的匹配结构
+"""
+
+import json
+import logging
+import threading
+from typing import Dict, List, Optional
+from config import Config
+from matchers import AhoCorasickAutomaton
+from text_normalizer import fold_text, normalize_message
+
+logger = logging.getLogger(__name__)
+
+class Intent:
+    """意图定义"""
+    
+    def __init__(self, intent: str, keywords: List[str], reply: str):
+        """
+        初始化意图
+        :param intent: 意图名称
+        :param keywords: 触发关键词，消息包含任一关键词即命中（忽略大小写和全半角）
+        :param reply: 回复内容
+        """
+        self.intent = intent
+        self.keywords = list(keywords)
+        self.reply = reply
+
+class IntentTable:
+    """
+    意图表
+    所有意图的关键词编译进同一个自动机，表中靠前的意图优先
+    """
+    
+    def __init__(self, intents: List[Intent]):
+        """
+        编译意图表
+        :param intents: 按优先级排列的意图
+        """
+        self.intents = list(intents)
+        self._automaton = AhoCorasickAutomaton(
+            (fold_text(keyword), ordinal)
+            for ordinal, intent in enumerate(self.intents)
+            for keyword in intent.keywords
+            if keyword
+        )
+    
+    @classmethod
+    def from_file(cls, path: str) -> 'IntentTable':
+        """
+        从JSON文件加载意图表
+        文件内容为列表，每项包含 intent、keywords 和 reply 字段
+        :param path: 文件路径
+        :return: 意图表
+        """
+        with open(path, 'r', encoding='utf-8') as f:
+            items = json.load(f)
+        
+        intents = [
+            Intent(item['intent'], item.get('keywords', []), item['reply'])
+            for item in items
+        ]
+        logger.info(f"从 {path} 加载 {len(intents)} 个意图")
+        return cls(intents)
+    
+    def match(self, user_content: str) -> Optional[Intent]:
+        """
+        查找用户输入命中的意图
+        :param user_content: 用户输入
+        :return: 优先级最高的意图或None
+        """
+        ordinal = self._automaton.search(normalize_message(user_content).folded)
+        if ordinal is None:
+            return None
+        return self.intents[ordinal]
+    
+    def get_info(self) -> List[Dict]:
+        """
+        获取意图表信息
+        :return: 意图信息列表
+        """
+        return [
+            {'intent': intent.intent, 'keywords': intent.keywords}
+            for intent in self.intents
+        ]
+    
+    def __len__(self):
+        return len(self.intents)
+
+_default_table: Optional[IntentTable] = None
+_default_table_lock = threading.Lock()
+
+def get_default_intent_table() -> IntentTable:
+    """
+    获取默认意图表，进程内只加载一次
+    配置文件缺失或格式错误时返回空表
+    :return: 意图表
+    """
+    global _default_table
+    if _default_table is None:
+        with _default_table_lock:
+            if _default_table is None:
+                try:
+                    _default_table = IntentTable.from_file(Config.INTENTS_FILE)
+                except (OSError, ValueError, KeyError, TypeError) as e:
+                    logger.error(f"加载意图表失败: {Config.INTENTS_FILE}, 错误: {str(e)}")
+                    _default_table = IntentTable([])
+    return _default_table
@@ -0,0 +1,612 @@
+# -*- coding: utf-8 -*-
+"""
+规则匹配索引
+为回复规则管理器提供预编译的多模式匹配结构
+"""
+
+import re
+import time
+from bisect import bisect_left
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Pattern, Tuple
+
+try:
+    from re import _parser as sre_parse, _constants as sre_constants
+except ImportError:  # Python 3.10 及以下
+    import sre_parse
+    import sre_constants
+
+# 组合正则的缓存上限，超过后整体清空
+COMBINED_CACHE_SIZE = 256
+
+# 出现在模式开头的全局内联标志，无法嵌入组合正则
+_GLOBAL_FLAGS_RE = re.compile(r'\(\?[aiLmsux]+\)')
+
+_REPEAT_OPS = tuple(
+    getattr(sre_constants, name)
+    for name in ('MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT')
+    if hasattr(sre_constants, name)
+)
+_GROUPREF_OPS = tuple(
+    getattr(sre_constants, name)
+    for name in ('GROUPREF', 'GROUPREF_IGNORE', 'GROUPREF_EXISTS',
+                 'GROUPREF_LOC_IGNORE', 'GROUPREF_UNI_IGNORE')
+    if hasattr(sre_constants, name)
+)
+
+
+class AhoCorasickAutomaton:
+    """
+    Aho-Corasick 多模式匹配自动机
+    一次扫描文本即可找出所有命中的模式，返回其中优先级最高（值最小）的结果
+    """
+
+    def __init__(self, patterns: Iterable[Tuple[str, int]] = ()):
+        """
+        初始化自动机
+        :param patterns: (模式串, 优先级序号) 序列，序号越小优先级越高
+        """
+        # 每个节点的转移表、失败指针和命中的最小序号
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._best: List[Optional[int]] = [None]
+        self.pattern_count = 0
+
+        for pattern, value in patterns:
+            self._insert(pattern, value)
+        self._build_fail_links()
+
+    def _insert(self, pattern: str, value: int):
+        """
+        向字典树插入模式串
+        :param pattern: 模式串
+        :param value: 优先级序号
+        """
+        node = 0
+        for ch in pattern:
+            next_node = self._goto[node].get(ch)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][ch] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._best.append(None)
+            node = next_node
+
+        # 相同模式串只保留优先级最高的规则
+        current = self._best[node]
+        if current is None or value < current:
+            self._best[node] = value
+        self.pattern_count += 1
+
+    def _build_fail_links(self):
+        """广度优先构建失败指针，并把后缀节点的命中结果合并到当前节点"""
+        queue = deque(self._goto[0].values())
+
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(ch, 0)
+
+                # 失败链上的模式串同样以当前位置结尾，取其中最小序号
+                inherited = self._best[self._fail[child]]
+                if inherited is not None:
+                    current = self._best[child]
+                    if current is None or inherited < current:
+                        self._best[child] = inherited
+
+    def search(self, text: str) -> Optional[int]:
+        """
+        扫描文本，返回命中模式中的最小优先级序号
+        :param text: 待匹配文本
+        :return: 最小序号，未命中返回None
+        """
+        goto = self._goto
+        fail = self._fail
+        best_of = self._best
+
+        best = best_of[0]
+        node = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+
+            value = best_of[node]
+            if value is not None and (best is None or value < best):
+                best = value
+
+        return best
+
+    def __len__(self):
+        return self.pattern_count
+
+
+class ExactMatchIndex:
+    """
+    精确匹配哈希索引
+    以消息文本为键直接查出优先级最高的规则序号
+    """
+
+    def __init__(self, patterns: Iterable[Tuple[str, int]] = ()):
+        """
+        初始化索引
+        :param patterns: (模式串, 优先级序号) 序列，序号越小优先级越高
+        """
+        self._index: Dict[str, int] = {}
+        # 每个模式串对应的全部序号，增量删除规则时用于找出下一个优先级最高的规则
+        self._values: Dict[str, Tuple[int, ...]] = {}
+        for pattern, value in patterns:
+            self._add(pattern, value)
+
+    def _add(self, pattern: str, value: int):
+        values = tuple(sorted(self._values.get(pattern, ()) + (value,)))
+        self._values[pattern] = values
+        self._index[pattern] = values[0]
+
+    def _remove(self, pattern: str, value: int):
+        values = tuple(v for v in self._values.get(pattern, ()) if v != value)
+        if values:
+            self._values[pattern] = values
+            self._index[pattern] = values[0]
+        else:
+            self._values.pop(pattern, None)
+            self._index.pop(pattern, None)
+
+    def updated(self, removed: Iterable[Tuple[str, int]], added: Iterable[Tuple[str, int]]) -> 'ExactMatchIndex':
+        """
+        生成增量修改后的新索引，原索引保持不变
+        :param removed: 要删除的 (模式串, 优先级序号)
+        :param added: 要加入的 (模式串, 优先级序号)
+        :return: 新索引
+        """
+        index = ExactMatchIndex()
+        index._index = dict(self._index)
+        index._values = dict(self._values)
+        for pattern, value in removed:
+            index._remove(pattern, value)
+        for pattern, value in added:
+            index._add(pattern, value)
+        return index
+
+    def lookup(self, text: str) -> Optional[int]:
+        """
+        查找与文本完全相同的模式
+        :param text: 已规范化的消息文本
+        :return: 规则序号，未命中返回None
+        """
+        return self._index.get(text)
+
+    def __len__(self):
+        return len(self._index)
+
+
+def edit_distance(a: str, b: str, limit: Optional[int] = None) -> int:
+    """
+    计算两个字符串的编辑距离（插入、删除、替换各计1）
+    :param a: 字符串
+    :param b: 字符串
+    :param limit: 距离上限，确定超过时提前返回 limit + 1
+    :return: 编辑距离
+    """
+    if len(a) < len(b):
+        a, b = b, a
+    if limit is not None and len(a) - len(b) > limit:
+        return limit + 1
+
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (ca != cb)
+            ))
+        if limit is not None and min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class SymmetricDeleteIndex:
+    """
+    对称删除模糊匹配索引
+    预先为每个模式串生成删除至多 k 个字符后的全部变体；查询时同样生成文本的删除变体，
+    两者有共同变体的模式串才可能在编辑距离 k 以内，只需对这些候选计算编辑距离
+    """
+
+    def __init__(self, patterns: Iterable[Tuple[str, int]] = (), max_distance: int = 1):
+        """
+        初始化索引
+        :param patterns: (模式串, 优先级序号) 序列，序号越小优先级越高
+        :param max_distance: 最大编辑距离
+        """
+        self.max_distance = max_distance
+        # 模式串 -> 优先级最高的序号；相同模式串的全部序号另行记录，删除一条规则后由下一条接替
+        self._values: Dict[str, int] = {}
+        self._all_values: Dict[str, Tuple[int, ...]] = {}
+        # 删除变体 -> 可能由其生成的模式串
+        self._variants: Dict[str, List[str]] = {}
+        # 模式串长度 -> 该长度的模式串数量，用于维护长度范围
+        self._length_counts: Dict[int, int] = {}
+        self.min_length = 0
+        self.max_length = 0
+
+        for pattern, value in patterns:
+            if pattern:
+                self._add(pattern, value)
+        self._update_length_range()
+
+    def _add(self, pattern: str, value: int, shared: bool = False):
+        values = self._all_values.get(pattern)
+        if values is None:
+            for variant in _deletion_variants(pattern, min(self.max_distance, len(pattern) - 1)):
+                if shared:
+                    # 变体列表与旧索引共享，替换为新列表而不是原地修改
+                    self._variants[variant] = self._variants.get(variant, []) + [pattern]
+                else:
+                    self._variants.setdefault(variant, []).append(pattern)
+            self._length_counts[len(pattern)] = self._length_counts.get(len(pattern), 0) + 1
+            values = ()
+        values = tuple(sorted(values + (value,)))
+        self._all_values[pattern] = values
+        self._values[pattern] = values[0]
+
+    def _remove(self, pattern: str, value: int):
+        values = tuple(v for v in self._all_values.get(pattern, ()) if v != value)
+        if values:
+            self._all_values[pattern] = values
+            self._values[pattern] = values[0]
+            return
+        if self._all_values.pop(pattern, None) is None:
+            return
+        del self._values[pattern]
+        for variant in _deletion_variants(pattern, min(self.max_distance, len(pattern) - 1)):
+            remaining = [p for p in self._variants[variant] if p != pattern]
+            if remaining:
+                self._variants[variant] = remaining
+            else:
+                del self._variants[variant]
+        count = self._length_counts[len(pattern)] - 1
+        if count:
+            self._length_counts[len(pattern)] = count
+        else:
+            del self._length_counts[len(pattern)]
+
+    def _update_length_range(self):
+        self.min_length = min(self._length_counts, default=0)
+        self.max_length = max(self._length_counts, default=0)
+
+    def updated(self, removed: Iterable[Tuple[str, int]], added: Iterable[Tuple[str, int]]) -> 'SymmetricDeleteIndex':
+        """
+        生成增量修改后的新索引，原索引保持不变
+        只为增删的模式串生成删除变体，其余变体沿用原索引
+        :param removed: 要删除的 (模式串, 优先级序号)
+        :param added: 要加入的 (模式串, 优先级序号)
+        :return: 新索引
+        """
+        index = SymmetricDeleteIndex(max_distance=self.max_distance)
+        index._values = dict(self._values)
+        index._all_values = dict(self._all_values)
+        index._variants = dict(self._variants)
+        index._length_counts = dict(self._length_counts)
+        for pattern, value in removed:
+            if pattern:
+                index._remove(pattern, value)
+        for pattern, value in added:
+            if pattern:
+                index._add(pattern, value, shared=True)
+        index._update_length_range()
+        return index
+
+    def search(self, text: str) -> Optional[Tuple[int, int]]:
+        """
+        查找编辑距离最近的模式串
+        每个模式串允许的距离不超过其长度减1，避免过短的模式匹配任意文本
+        :param text: 已规范化的消息文本
+        :return: (编辑距离, 优先级序号)，距离相同时取序号最小者；未命中返回None
+        """
+        k = self.max_distance
+        # 长度差本身就是编辑距离的下界
+        if not self._values or len(text) > self.max_length + k or len(text) < self.min_length - k:
+            return None
+
+        best: Optional[Tuple[int, int]] = None
+        checked = set()
+        for variant in _deletion_variants(text, k):
+            for pattern in self._variants.get(variant, ()):
+                if pattern in checked:
+                    continue
+                checked.add(pattern)
+                limit = min(k, len(pattern) - 1)
+                distance = edit_distance(text, pattern, limit)
+                if distance <= limit:
+                    candidate = (distance, self._values[pattern])
+                    if best is None or candidate < best:
+                        best = candidate
+        return best
+
+    def __len__(self):
+        return len(self._values)
+
+
+def _deletion_variants(text: str, depth: int) -> set:
+    """
+    生成删除至多 depth 个字符后的全部变体（含原文）
+    :param text: 文本
+    :param depth: 最多删除的字符数
+    :return: 变体集合
+    """
+    variants = {text}
+    frontier = {text}
+    for _ in range(max(depth, 0)):
+        frontier = {word[:i] + word[i + 1:] for word in frontier for i in range(len(word))}
+        variants |= frontier
+    return variants
+
+
+class RegexRuleEntry:
+    """正则规则的预过滤信息"""
+
+    __slots__ = ('ordinal', 'pattern', 'compiled', 'min_length', 'literals', 'combinable')
+
+    def __init__(self, ordinal: int, pattern: str, compiled: Pattern):
+        """
+        分析正则表达式，提取最小匹配长度和必需字面量
+        :param ordinal: 规则优先级序号
+        :param pattern: 正则表达式源码
+        :param compiled: 预编译的正则对象
+        """
+        self.ordinal = ordinal
+        self.pattern = pattern
+        self.compiled = compiled
+
+        try:
+            parsed = sre_parse.parse(pattern, compiled.flags)
+            self.min_length = parsed.getwidth()[0]
+            self.literals = tuple(sorted(set(_required_literals(parsed)), key=len, reverse=True))
+            has_groupref = _contains_op(parsed, _GROUPREF_OPS)
+        except Exception:
+            # 无法分析的模式不做预过滤，也不参与组合
+            self.min_length = 0
+            self.literals = ()
+            has_groupref = True
+
+        # 命名分组、反向引用和全局内联标志在组合正则中会改变语义
+        self.combinable = not (
+            compiled.groupindex
+            or has_groupref
+            or _GLOBAL_FLAGS_RE.match(pattern)
+        )
+
+    def accepts(self, text: str) -> bool:
+        """
+        预过滤：文本长度和必需字面量都满足时才可能匹配
+        :param text: 待匹配文本
+        :return: 是否需要执行正则
+        """
+        if len(text) < self.min_length:
+            return False
+        for literal in self.literals:
+            if literal not in text:
+                return False
+        return True
+
+
+class RegexPrefilterTier:
+    """
+    正则规则匹配层
+    先用长度和必需字面量过滤规则，再把剩余规则组合成一个按优先级排列的正则执行
+    """
+
+    def __init__(self, rules: Iterable[Tuple[int, str, Pattern]] = ()):
+        """
+        初始化正则匹配层
+        :param rules: (优先级序号, 正则表达式, 预编译对象) 序列
+        """
+        self._entries: List[RegexRuleEntry] = sorted(
+            (RegexRuleEntry(ordinal, pattern, compiled) for ordinal, pattern, compiled in rules),
+            key=lambda entry: entry.ordinal
+        )
+        self._combined_cache: Dict[Tuple[int, ...], List[Tuple[Pattern, Optional[int]]]] = {}
+
+    def search(self, text: str, limit: Optional[int] = None,
+               evaluated: Optional[List[int]] = None,
+               timings: Optional[Dict[int, float]] = None) -> Optional[int]:
+        """
+        查找命中的优先级最高的正则规则
+        :param text: 待匹配文本
+        :param limit: 只检查序号小于该值的规则
+        :param evaluated: 传入列表时，追加通过预过滤、需要执行正则的规则序号
+        :param timings: 传入字典时，记录单独执行的规则（唯一通过预过滤的规则和不可组合的规则）的耗时（秒）；
+                        组合执行的规则共用一次匹配，没有单条规则的耗时
+        :return: 规则序号，未命中返回None
+        """
+        survivors = []
+        for entry in self._entries:
+            if limit is not None and entry.ordinal >= limit:
+                break
+            if entry.accepts(text):
+                survivors.append(entry)
+
+        if evaluated is not None:
+            evaluated.extend(entry.ordinal for entry in survivors)
+
+        if not survivors:
+            return None
+        if len(survivors) == 1:
+            entry = survivors[0]
+            return entry.ordinal if self._search_one(entry.compiled, entry.ordinal, text, timings) else None
+
+        for compiled, ordinal in self._get_segments(survivors):
+            if ordinal is not None:
+                # 不可组合的规则单独执行
+                if self._search_one(compiled, ordinal, text, timings):
+                    return ordinal
+            else:
+                match = compiled.match(text)
+                if match:
+                    return int(match.lastgroup[1:])
+
+        return None
+
+    @staticmethod
+    def _search_one(compiled: Pattern, ordinal: int, text: str, timings: Optional[Dict[int, float]]) -> bool:
+        """
+        单独执行一条规则的正则
+        :param compiled: 预编译的正则对象
+        :param ordinal: 规则序号
+        :param text: 待匹配文本
+        :param timings: 传入字典时记录本次耗时（秒）
+        :return: 是否命中
+        """
+        if timings is None:
+            return compiled.search(text) is not None
+        start = time.perf_counter()
+        matched = compiled.search(text) is not None
+        timings[ordinal] = time.perf_counter() - start
+        return matched
+
+    def updated(self, removed: Iterable[int], added: Iterable[Tuple[int, str, Pattern]]) -> 'RegexPrefilterTier':
+        """
+        生成增量修改后的新匹配层，未变化的规则沿用已有的预过滤分析，原匹配层保持不变
+        :param removed: 要删除的规则序号
+        :param added: 要加入的 (优先级序号, 正则表达式, 预编译对象)
+        :return: 新匹配层
+        """
+        removed = set(removed)
+        entries = [entry for entry in self._entries if entry.ordinal not in removed]
+        ordinals = [entry.ordinal for entry in entries]
+        for ordinal, pattern, compiled in added:
+            position = bisect_left(ordinals, ordinal)
+            ordinals.insert(position, ordinal)
+            entries.insert(position, RegexRuleEntry(ordinal, pattern, compiled))
+
+        tier = RegexPrefilterTier()
+        tier._entries = entries
+        return tier
+
+    def __getstate__(self):
+        # 组合正则缓存只是运行期的加速结构，不随索引持久化
+        state = self.__dict__.copy()
+        state['_combined_cache'] = {}
+        return state
+
+    def _get_segments(self, survivors: List[RegexRuleEntry]) -> List[Tuple[Pattern, Optional[int]]]:
+        """
+        获取通过预过滤的规则对应的执行片段，按规则组合缓存
+        :param survivors: 通过预过滤的规则，按序号排列
+        :return: (正则对象, 单独执行时的规则序号) 列表，组合片段的序号为None
+        """
+        key = tuple(entry.ordinal for entry in survivors)
+        segments = self._combined_cache.get(key)
+        if segments is not None:
+            return segments
+
+        segments = []
+        run: List[RegexRuleEntry] = []
+        for entry in survivors:
+            if entry.combinable:
+                run.append(entry)
+                continue
+            if run:
+                segments.extend(self._combine(run))
+                run = []
+            segments.append((entry.compiled, entry.ordinal))
+        if run:
+            segments.extend(self._combine(run))
+
+        if len(self._combined_cache) >= COMBINED_CACHE_SIZE:
+            self._combined_cache.clear()
+        self._combined_cache[key] = segments
+        return segments
+
+    @staticmethod
+    def _combine(entries: List[RegexRuleEntry]) -> List[Tuple[Pattern, Optional[int]]]:
+        """
+        把多条规则组合为一个正则
+        每个分支是一个从当前位置向后搜索的前瞻断言，分支顺序即优先级，
+        因此组合正则命中的分支就是序号最小的命中规则
+        :param entries: 可组合的规则
+        :return: 执行片段列表，无法组合时退化为逐条执行
+        """
+        individual = [(entry.compiled, entry.ordinal) for entry in entries]
+        if len(entries) == 1:
+            return individual
+
+        branches = '|'.join(
+            f'(?=[\\s\\S]*?(?P<r{entry.ordinal}>{entry.pattern}))'
+            for entry in entries
+        )
+        try:
+            return [(re.compile(branches, entries[0].compiled.flags), None)]
+        except re.error:
+            return individual
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def _required_literals(parsed) -> List[str]:
+    """
+    提取正则表达式匹配时必定出现的字面量
+    只保留没有大小写变体的字符，忽略大小写匹配时同样成立
+    :param parsed: sre_parse 解析结果
+    :return: 字面量列表
+    """
+    literals = []
+    run = []
+
+    def flush():
+        if run:
+            literals.append(''.join(run))
+            run.clear()
+
+    for op, av in parsed:
+        if op is sre_constants.LITERAL:
+            ch = chr(av)
+            if ch.lower() == ch.upper():
+                run.append(ch)
+                continue
+            flush()
+        elif op is sre_constants.SUBPATTERN:
+            flush()
+            literals.extend(_required_literals(av[-1]))
+        elif op in _REPEAT_OPS:
+            flush()
+            if av[0] >= 1:
+                literals.extend(_required_literals(av[2]))
+        else:
+            flush()
+    flush()
+
+    return literals
+
+
+def _contains_op(parsed, ops: Tuple) -> bool:
+    """
+    检查解析结果中是否包含指定操作
+    :param parsed: sre_parse 解析结果
+    :param ops: 要查找的操作
+    :return: 是否包含
+    """
+    for op, av in parsed:
+        if op in ops:
+            return True
+        if isinstance(av, (tuple, list)):
+            for item in av:
+                if isinstance(item, sre_parse.SubPattern) and _contains_op(item, ops):
+                    return True
+                if isinstance(item, (tuple, list)):
+                    for sub in item:
+                        if isinstance(sub, sre_parse.SubPattern) and _contains_op(sub, ops):
+                            return True
+        elif isinstance(av, sre_parse.SubPattern) and _contains_op(av, ops):
+            return True
+    return False
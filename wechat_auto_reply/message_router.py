@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+消息分发
+按 (MsgType, Event) 把消息交给对应的处理函数，一次字典查找完成分发。
+新的消息或事件类型通过 register 注册处理函数，不需要修改处理器
+"""
+
+import logging
+from typing import Callable, Dict, Optional, Tuple, Union
+from config import Config
+from reply_template import compile_template
+
+logger = logging.getLogger(__name__)
+
+# 处理函数：(微信处理器, 消息字典, 被动回复的截止时间) -> 文本回复内容、完整的回复XML字节或None（不回复）
+MessageHandler = Callable[..., Union[str, bytes, None]]
+
+def route_key(msg_type: str, event: str = '') -> Tuple[str, str]:
+    """
+    分发键，事件名不区分大小写（微信的 subscribe 为小写，CLICK 为大写）
+    :param msg_type: 消息类型
+    :param event: 事件类型，普通消息为空字符串
+    :return: 分发键
+    """
+    return msg_type, event.lower()
+
+class MessageRouter:
+    """消息分发表"""
+
+    def __init__(self):
+        self._handlers: Dict[Tuple[str, str], MessageHandler] = {}
+
+    def register(self, msg_type: str, event: str = '', handler: Optional[MessageHandler] = None):
+        """
+        注册处理函数，同一类型重复注册时替换原来的处理函数；不传 handler 时作为装饰器使用
+        :param msg_type: 消息类型，如 text、image、event
+        :param event: 事件类型，如 subscribe、CLICK，普通消息不填
+        :param handler: 处理函数
+        :return: 装饰器，或传入的处理函数
+        """
+        def decorator(func: MessageHandler) -> MessageHandler:
+            self._handlers[route_key(msg_type, event)] = func
+            return func
+
+        if handler is None:
+            return decorator
+        return decorator(handler)
+
+    def unregister(self, msg_type: str, event: str = '') -> bool:
+        """
+        删除处理函数
+        :param msg_type: 消息类型
+        :param event: 事件类型
+        :return: 是否存在
+        """
+        return self._handlers.pop(route_key(msg_type, event), None) is not None
+
+    def get_handler(self, msg_dict: Dict[str, str]) -> Optional[MessageHandler]:
+        """
+        查找消息的处理函数
+        :param msg_dict: 消息字典
+        :return: 处理函数，未注册时返回None
+        """
+        return self._handlers.get(route_key(msg_dict.get('MsgType', ''), msg_dict.get('Event', '')))
+
+    def dispatch(self, wechat_handler, msg_dict: Dict[str, str], deadline: Optional[float] = None):
+        """
+        分发消息
+        :param wechat_handler: 微信处理器
+        :param msg_dict: 消息字典
+        :param deadline: 被动回复的截止时间（time.monotonic）
+        :return: 处理函数的返回值，未注册的类型返回None
+        """
+        key = route_key(msg_dict.get('MsgType', ''), msg_dict.get('Event', ''))
+        handler = self._handlers.get(key)
+        if handler is None:
+            logger.info(f"忽略未注册的消息类型: {key}")
+            return None
+        return handler(wechat_handler, msg_dict, deadline)
+
+    def __contains__(self, key: Tuple[str, str]) -> bool:
+        return route_key(*key) in self._handlers
+
+    def __len__(self):
+        return len(self._handlers)
+
+# 关注时的欢迎语只编译一次，含模板变量（如 {user}）时每次渲染
+_welcome_template = compile_template(Config.WELCOME_MESSAGE)
+
+def handle_text(wechat_handler, msg_dict, deadline=None):
+    """文本消息：交给规则引擎"""
+    return wechat_handler.generate_text_reply(msg_dict.get('Content', '').strip(), msg_dict.get('FromUserName'), deadline)
+
+def handle_voice(wechat_handler, msg_dict, deadline=None):
+    """语音消息：开启语音识别时，识别结果（Recognition）交给规则引擎"""
+    recognition = msg_dict.get('Recognition', '').strip()
+    if not recognition:
+        logger.info("语音消息没有识别结果，不回复")
+        return None
+    return wechat_handler.generate_text_reply(recognition, msg_dict.get('FromUserName'), deadline)
+
+def handle_subscribe(wechat_handler, msg_dict, deadline=None):
+    """关注事件：回复欢迎语"""
+    if _welcome_template is None:
+        return Config.WELCOME_MESSAGE or None
+    return _welcome_template.render(user_id=msg_dict.get('FromUserName'))
+
+def handle_unsubscribe(wechat_handler, msg_dict, deadline=None):
+    """取消关注事件：结束用户的多轮会话，不回复"""
+    user_id = msg_dict.get('FromUserName')
+    if user_id:
+        wechat_handler.clear_session(user_id)
+    return None
+
+def handle_click(wechat_handler, msg_dict, deadline=None):
+    """菜单点击事件：EventKey 交给规则引擎，按菜单的 key 配置规则即可"""
+    return wechat_handler.generate_text_reply(msg_dict.get('EventKey', '').strip(), msg_dict.get('FromUserName'), deadline)
+
+def ignore_message(wechat_handler, msg_dict, deadline=None):
+    """已知但默认不回复的类型（图片、视频、位置、链接、菜单跳转等），可以注册新的处理函数替换"""
+    logger.info(f"收到默认不回复的消息: {route_key(msg_dict.get('MsgType', ''), msg_dict.get('Event', ''))}")
+    return None
+
+def create_default_router() -> MessageRouter:
+    """
+    创建带有内置处理函数的分发表
+    :return: 分发表
+    """
+    router = MessageRouter()
+    router.register('text', handler=handle_text)
+    router.register('voice', handler=handle_voice)
+    router.register('event', 'subscribe', handle_subscribe)
+    router.register('event', 'unsubscribe', handle_unsubscribe)
+    router.register('event', 'CLICK', handle_click)
+    for msg_type in ('image', 'video', 'shortvideo', 'location', 'link'):
+        router.register(msg_type, handler=ignore_message)
+    for event in ('VIEW', 'SCAN', 'LOCATION'):
+        router.register('event', event, ignore_message)
+    return router
+
+# 全局分发表
+message_router = create_default_router()
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+被动回复消息XML构造
+回复的固定部分预先编码为字节片段，构造时只编码变量部分并一次拼接，直接得到响应体字节，
+不再先生成字符串再由 Flask 编码；内容中的 ]]> 拆分到相邻的CDATA段，不会破坏XML
+"""
+
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+# 图文回复最多包含的文章数（微信限制）
+MAX_ARTICLES = 8
+
+_CDATA_END = ']]>'
+# 内容中的 ]]> 拆到两个CDATA段中：]] 留在前一段，> 放到下一段
+_CDATA_END_SPLIT = ']]]]><![CDATA[>'
+
+# 回复的固定部分预先编码为字节片段，构造时与已编码的变量交替排列，用一次 b''.join 拼接
+_OPEN = b'<xml>\n<ToUserName><![CDATA['
+_AFTER_TO_USER = b']]></ToUserName>\n<FromUserName><![CDATA['
+_AFTER_FROM_USER = b']]></FromUserName>\n<CreateTime>'
+# 单字段回复的 (字段前的片段, 字段后的片段)
+_TEXT_PARTS = (
+    b'</CreateTime>\n<MsgType><![CDATA[text]]></MsgType>\n<Content><![CDATA[',
+    b']]></Content>\n</xml>'
+)
+_IMAGE_PARTS = (
+    b'</CreateTime>\n<MsgType><![CDATA[image]]></MsgType>\n<Image>\n<MediaId><![CDATA[',
+    b']]></MediaId>\n</Image>\n</xml>'
+)
+_VOICE_PARTS = (
+    b'</CreateTime>\n<MsgType><![CDATA[voice]]></MsgType>\n<Voice>\n<MediaId><![CDATA[',
+    b']]></MediaId>\n</Voice>\n</xml>'
+)
+# 图文回复的字段较多，头部和每篇文章用字节模板格式化
+_HEAD = _OPEN + b'%s' + _AFTER_TO_USER + b'%s' + _AFTER_FROM_USER + b'%d</CreateTime>\n'
+_NEWS_TEMPLATE = _HEAD + b'<MsgType><![CDATA[news]]></MsgType>\n<ArticleCount>%d</ArticleCount>\n<Articles>\n'
+_ARTICLE_TEMPLATE = (
+    b'<item>\n<Title><![CDATA[%s]]></Title>\n<Description><![CDATA[%s]]></Description>\n'
+    b'<PicUrl><![CDATA[%s]]></PicUrl>\n<Url><![CDATA[%s]]></Url>\n</item>\n'
+)
+_NEWS_TAIL = b'</Articles>\n</xml>'
+
+CONTENT_TYPE = 'application/xml; charset=utf-8'
+
+class Article(NamedTuple):
+    """图文回复中的一篇文章"""
+    title: str
+    description: str = ''
+    pic_url: str = ''
+    url: str = ''
+
+def cdata(text: Optional[str]) -> bytes:
+    """
+    编码CDATA段的内容
+    :param text: 文本，None按空字符串处理
+    :return: UTF-8字节，其中的 ]]> 已拆分到相邻的CDATA段
+    """
+    if not text:
+        return b''
+    if _CDATA_END in text:
+        text = text.replace(_CDATA_END, _CDATA_END_SPLIT)
+    return text.encode('utf-8')
+
+def _build_single(parts: Tuple[bytes, bytes], to_user: str, from_user: str, value: str,
+                  create_time: Optional[int]) -> bytes:
+    """
+    构造只有一个变量字段的回复
+    :param parts: 变量字段前后的字节片段
+    :param to_user: 接收用户OpenID
+    :param from_user: 公众号原始ID
+    :param value: 变量字段的内容
+    :param create_time: 消息时间戳，None为当前时间
+    :return: 回复XML字节
+    """
+    if create_time is None:
+        create_time = time.time()
+    # 在字符串上检查 ]]> 比编码后检查快，绝大多数回复不含 ]]>，直接编码
+    if _CDATA_END in value or _CDATA_END in to_user or _CDATA_END in from_user:
+        to_user, from_user, value = cdata(to_user), cdata(from_user), cdata(value)
+    else:
+        to_user, from_user, value = to_user.encode('utf-8'), from_user.encode('utf-8'), value.encode('utf-8')
+    return b''.join((
+        _OPEN, to_user, _AFTER_TO_USER, from_user, _AFTER_FROM_USER, b'%d' % create_time,
+        parts[0], value, parts[1]
+    ))
+
+def build_text_reply(to_user: str, from_user: str, content: str, create_time: Optional[int] = None) -> bytes:
+    """
+    构造文本回复
+    :param to_user: 接收用户OpenID
+    :param from_user: 公众号原始ID
+    :param content: 回复内容
+    :param create_time: 消息时间戳，默认当前时间
+    :return: 回复XML字节
+    """
+    return _build_single(_TEXT_PARTS, to_user, from_user, content, create_time)
+
+def build_image_reply(to_user: str, from_user: str, media_id: str, create_time: Optional[int] = None) -> bytes:
+    """
+    构造图片回复
+    :param to_user: 接收用户OpenID
+    :param from_user: 公众号原始ID
+    :param media_id: 素材的MediaId
+    :param create_time: 消息时间戳，默认当前时间
+    :return: 回复XML字节
+    """
+    return _build_single(_IMAGE_PARTS, to_user, from_user, media_id, create_time)
+
+def build_voice_reply(to_user: str, from_user: str, media_id: str, create_time: Optional[int] = None) -> bytes:
+    """
+    构造语音回复
+    :param to_user: 接收用户OpenID
+    :param from_user: 公众号原始ID
+    :param media_id: 素材的MediaId
+    :param create_time: 消息时间戳，默认当前时间
+    :return: 回复XML字节
+    """
+    return _build_single(_VOICE_PARTS, to_user, from_user, media_id, create_time)
+
+def build_news_reply(to_user: str, from_user: str, articles: Iterable[Article],
+                     create_time: Optional[int] = None) -> bytes:
+    """
+    构造图文回复
+    :param to_user: 接收用户OpenID
+    :param from_user: 公众号原始ID
+    :param articles: 文章列表，1到8篇
+    :param create_time: 消息时间戳，默认当前时间
+    :return: 回复XML字节
+    """
+    articles = list(articles)
+    if not 0 < len(articles) <= MAX_ARTICLES:
+        raise ValueError(f"图文回复需要1到{MAX_ARTICLES}篇文章，实际为{len(articles)}篇")
+    if create_time is None:
+        create_time = time.time()
+
+    # 字段较多，逐个拆分 ]]> 后拼接
+    parts: List[bytes] = [_NEWS_TEMPLATE % (cdata(to_user), cdata(from_user), create_time, len(articles))]
+    parts += [
+        _ARTICLE_TEMPLATE % (cdata(article.title), cdata(article.description), cdata(article.pic_url), cdata(article.url))
+        for article in articles
+    ]
+    parts.append(_NEWS_TAIL)
+    return b''.join(parts)
+
+def reply_headers(body: bytes) -> Dict[str, str]:
+    """
+    回复的响应头
+    :param body: 回复XML字节
+    :return: 包含 Content-Type 和 Content-Length 的响应头
+    """
+    return {'Content-Type': CONTENT_TYPE, 'Content-Length': str(len(body))}
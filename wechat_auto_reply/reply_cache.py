@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+回复缓存
+缓存高频消息的规则查找结果，避免重复执行规则引擎
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+
+# 区分"未缓存"和"缓存了空回复"
+_MISSING = object()
+
+class ReplyCache:
+    """
+    有界LRU回复缓存
+    键为 (规范化后的消息, 规则集版本)，规则集更新后旧版本的条目自然失效并被逐步淘汰
+    """
+    
+    def __init__(self, maxsize: int = 1024):
+        """
+        初始化回复缓存
+        :param maxsize: 最大缓存条目数，为0时禁用缓存
+        """
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[Hashable, Optional[str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def get(self, content: str, version: int) -> Tuple[bool, Optional[str]]:
+        """
+        查询缓存
+        :param content: 规范化后的消息内容
+        :param version: 当前规则集版本
+        :return: (是否命中, 缓存的回复内容)
+        """
+        key = (content, version)
+        with self._lock:
+            reply = self._entries.get(key, _MISSING)
+            if reply is _MISSING:
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, reply
+    
+    def put(self, content: str, version: int, reply: Optional[str]):
+        """
+        写入缓存，超出容量时淘汰最久未使用的条目
+        :param content: 规范化后的消息内容
+        :param version: 产生该回复的规则集版本
+        :param reply: 回复内容，None表示没有匹配的回复
+        """
+        if self.maxsize <= 0:
+            return
+        
+        key = (content, version)
+        with self._lock:
+            self._entries[key] = reply
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def clear(self):
+        """清空缓存条目，保留统计计数"""
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self) -> Dict:
+        """
+        获取缓存统计信息
+        :return: 统计信息字典
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0
+            }
+    
+    def __len__(self):
+        return len(self._entries)
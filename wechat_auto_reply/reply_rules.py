@@ -4,27 +4,67 @@
 负责管理和执行各种自动回复规则
 """
 
+import os
 import re
+import time
 import logging
-from typing import Optional, Dict, List, Callable
+import threading
+import multiprocessing
+from collections import deque
+from contextlib import contextmanager
+from itertools import islice
+from operator import attrgetter
+from bisect import bisect_left
+from types import MappingProxyType
+from typing import Optional, Dict, List, Callable, Tuple, Mapping, NamedTuple, Iterable, Iterator, Pattern
+from matchers import AhoCorasickAutomaton, SymmetricDeleteIndex, ExactMatchIndex, RegexPrefilterTier
+from intents import IntentTable, get_default_intent_table
+from function_executor import FunctionRuleExecutor
+from rule_stats import RuleStats
+from text_normalizer import fold_text, normalize_key, normalize_message
+from session_store import SessionStore
+from reply_template import ReplyTemplate, compile_template
+from config import Config
 
 logger = logging.getLogger(__name__)
 
+# 支持的规则类型
+RULE_TYPES = ('exact', 'contains', 'regex', 'fuzzy', 'state')
+
+# 状态规则中匹配该状态下任意输入的模式
+STATE_WILDCARD = '*'
+
+# 模糊规则允许的最大编辑距离
+FUZZY_MAX_DISTANCE = Config.FUZZY_MAX_DISTANCE
+
+# 相邻规则优先级键的初始间隔，在两条规则之间插入时取中间值，无需给其他规则重新编号
+PRIORITY_KEY_SPACING = 1 << 16
+
+# 规则集的匹配索引：(精确匹配索引, 包含匹配自动机, 正则匹配层, 模糊匹配索引, 状态规则索引)
+RuleIndexes = Tuple[ExactMatchIndex, AhoCorasickAutomaton, RegexPrefilterTier, SymmetricDeleteIndex, ExactMatchIndex]
+
 class ReplyRule:
     """回复规则类"""
     
-    def __init__(self, name: str, pattern: str, reply: str, rule_type: str = 'exact'):
+    def __init__(self, name: str, pattern: str, reply: str, rule_type: str = 'exact', dynamic: bool = False,
+                 state: str = '', next_state: str = ''):
         """
         初始化回复规则
         :param name: 规则名称
         :param pattern: 匹配模式
         :param reply: 回复内容
-        :param rule_type: 规则类型 (exact/contains/regex/function)
+        :param rule_type: 规则类型 (exact/contains/regex/fuzzy/state)
+        :param dynamic: 回复是否随时间或用户变化，动态规则的结果不进入回复缓存；含模板变量的规则总是动态规则
+        :param state: 状态规则要求用户所处的状态，空字符串表示用户不在任何流程中
+        :param next_state: 状态规则命中后用户进入的状态，空字符串表示结束流程
         """
         self.name = name
         self.pattern = pattern
         self.reply = reply
         self.rule_type = rule_type
+        self.dynamic = dynamic
+        self.state = state
+        self.next_state = next_state
         
         # 如果是正则表达式，预编译
         if rule_type == 'regex':
@@ -33,18 +73,644 @@ class ReplyRule:
             except re.error as e:
                 logger.error(f"正则表达式编译失败: {pattern}, 错误: {str(e)}")
                 self.compiled_pattern = None
+        
+        # 回复中的模板变量在此编译一次，渲染结果随时间或用户变化，不能缓存
+        self.template: Optional[ReplyTemplate] = compile_template(
+            reply, self.compiled_pattern if rule_type == 'regex' else None
+        )
+        if self.template is not None:
+            self.dynamic = True
+    
+    def render(self, user_content: str, user_id: Optional[str] = None) -> str:
+        """
+        生成回复内容，固定回复直接返回
+        :param user_content: 用户输入
+        :param user_id: 用户OpenID
+        :return: 回复内容
+        """
+        template = self.template
+        if template is None:
+            return self.reply
+        match = None
+        if template.uses_groups and self.compiled_pattern:
+            # 分组先从原文中取，保留用户输入的大小写和全半角；
+            # 规则是按规范化后的消息命中的，原文匹配不上时再取规范化后的文本
+            match = self.compiled_pattern.search(user_content.strip())
+            if match is None:
+                match = self.compiled_pattern.search(normalize_message(user_content).folded)
+        return template.render(user_content, user_id, match)
+
+class FunctionRule:
+    """函数规则类"""
+    
+    def __init__(self, name: str, handler: Callable, dynamic: bool = False,
+                 timeout: Optional[float] = None, inline: bool = False):
+        """
+        初始化函数规则
+        :param name: 规则名称
+        :param handler: 处理函数，接收用户输入，返回回复内容或None
+        :param dynamic: 回复是否随时间或用户变化，动态规则的结果不进入回复缓存
+        :param timeout: 处理函数的超时时间（秒），默认使用执行器配置
+        :param inline: 是否在请求线程中直接执行，仅用于不会阻塞的内置处理函数
+        """
+        self.name = name
+        self.handler = handler
+        self.dynamic = dynamic
+        self.timeout = timeout
+        self.inline = inline
+    
+    def __call__(self, user_content: str) -> Optional[str]:
+        return self.handler(user_content)
+
+class ReplyMatch(NamedTuple):
+    """规则查找结果"""
+    rule_name: Optional[str]
+    reply: Optional[str]
+    # 结果是否可以缓存
+    cacheable: bool
+    # 产生结果的规则集版本
+    version: int
+
+class CompiledRuleSet:
+    """
+    已编译的规则集快照
+    创建后不再修改，读取方无需加锁即可并发使用，规则变更时整体替换为新快照
+    """
+    
+    __slots__ = ('version', 'rules', 'keys', 'rule_by_key', 'key_by_name', 'function_rules',
+                 'has_dynamic_functions', 'exact_index', 'contains_automaton', 'regex_tier', 'fuzzy_index',
+                 'state_index')
+    
+    def __init__(self, version: int, rules: Tuple[ReplyRule, ...], function_rules: Mapping[str, FunctionRule],
+                 indexes: Optional[RuleIndexes] = None, keys: Optional[Tuple[int, ...]] = None):
+        """
+        编译规则集
+        索引中记录的是规则的优先级键，键越小优先级越高；规则名称在规则集中唯一
+        :param version: 快照版本号，每次发布递增
+        :param rules: 按优先级排列的回复规则
+        :param function_rules: 按注册顺序排列的函数规则
+        :param indexes: 已为这组规则和优先级键编译好的索引（如从缓存文件加载），默认重新编译
+        :param keys: 与规则一一对应的递增优先级键，默认按固定间隔编号
+        """
+        self.version = version
+        self.rules = tuple(rules)
+        self.keys = tuple(keys) if keys is not None else spaced_keys(len(self.rules))
+        self.rule_by_key: Dict[int, ReplyRule] = dict(zip(self.keys, self.rules))
+        self.key_by_name: Dict[str, int] = dict(zip(map(attrgetter('name'), self.rules), self.keys))
+        if len(self.key_by_name) != len(self.rules):
+            raise ValueError("规则名称重复")
+        self.function_rules = MappingProxyType(dict(function_rules))
+        # 存在动态函数规则时，未命中的结果也不能缓存
+        self.has_dynamic_functions = any(rule.dynamic for rule in self.function_rules.values())
+        
+        if indexes is None:
+            indexes = build_rule_indexes(self.rules, self.keys)
+        self.exact_index, self.contains_automaton, self.regex_tier, self.fuzzy_index, self.state_index = indexes
+        if self.fuzzy_index.max_distance != FUZZY_MAX_DISTANCE:
+            # 缓存文件中的模糊索引按旧的距离配置生成，只重建这一层
+            self.fuzzy_index = _build_fuzzy_index(self.rules, self.keys)
+    
+    def get_rule(self, name: str) -> Optional[ReplyRule]:
+        """
+        按名称查找规则
+        :param name: 规则名称
+        :return: 规则或None
+        """
+        key = self.key_by_name.get(name)
+        if key is None:
+            return None
+        return self.rule_by_key[key]
+    
+    def match_rule(self, user_content: str, stats: Optional[RuleStats] = None,
+                   state: Optional[str] = None) -> Optional[ReplyRule]:
+        """
+        查找优先级最高的命中规则（不含函数规则）
+        :param user_content: 用户输入
+        :param stats: 统计计数器，传入时记录各匹配层耗时和规则命中情况
+        :param state: 用户当前的状态（不在流程中为空字符串），为None时不检查状态规则
+        :return: 命中的规则或None
+        """
+        timed = stats is not None
+        clock = time.perf_counter
+        view = normalize_message(user_content)
+        
+        # 状态规则比普通规则更具体，先按 (状态, 输入) 查找，再查该状态下的通配规则
+        if state is not None and len(self.state_index):
+            start = clock() if timed else 0.0
+            state_hit = self.state_index.lookup(state_rule_key(state, view.key))
+            if state_hit is None:
+                state_hit = self.state_index.lookup(state_rule_key(state, STATE_WILDCARD))
+            if timed:
+                stats.record_tier('state', clock() - start, state_hit is not None)
+                if state_hit is not None:
+                    stats.record_rule(self.rule_by_key[state_hit].name, evaluations=0, hits=1)
+            if state_hit is not None:
+                return self.rule_by_key[state_hit]
+        
+        # 精确匹配查哈希索引，包含匹配一次扫描，各自得到优先级最高的命中序号
+        start = clock() if timed else 0.0
+        exact_hit = self.exact_index.lookup(view.key)
+        exact_done = clock() if timed else 0.0
+        contains_hit = self.contains_automaton.search(view.folded)
+        contains_done = clock() if timed else 0.0
+        best_hit = _min_ordinal(exact_hit, contains_hit)
+        
+        # 只需检查序号更小的正则规则
+        evaluated = [] if timed else None
+        regex_timings = {} if timed else None
+        regex_hit = self.regex_tier.search(view.folded, limit=best_hit, evaluated=evaluated, timings=regex_timings)
+        best_hit = _min_ordinal(best_hit, regex_hit)
+        regex_done = clock() if timed else 0.0
+        
+        # 模糊规则与原文相同时已由精确索引命中；有编辑误差的命中只在其他规则都未命中时使用
+        fuzzy_hit = None
+        if best_hit is None and len(self.fuzzy_index):
+            nearest = self.fuzzy_index.search(view.key)
+            if nearest is not None:
+                fuzzy_hit = best_hit = nearest[1]
+            if timed:
+                stats.record_tier('fuzzy', clock() - regex_done, fuzzy_hit is not None)
+        
+        if timed:
+            stats.record_tier('exact', exact_done - start, exact_hit is not None)
+            stats.record_tier('contains', contains_done - exact_done, contains_hit is not None)
+            stats.record_tier('regex', regex_done - contains_done, regex_hit is not None)
+            for key in evaluated:
+                stats.record_rule(
+                    self.rule_by_key[key].name, hits=1 if key == regex_hit else 0, seconds=regex_timings.get(key)
+                )
+            if best_hit is not None and best_hit != regex_hit:
+                # 精确和包含规则的执行次数按所在匹配层统计
+                stats.record_rule(self.rule_by_key[best_hit].name, evaluations=0, hits=1)
+        
+        if best_hit is None:
+            return None
+        return self.rule_by_key[best_hit]
+    
+    def evaluate(self, user_content: str) -> Tuple[Optional[str], Optional[str]]:
+        """
+        离线评估单条消息，不记录日志和统计
+        函数规则在当前线程中直接调用，不经过执行器的超时和熔断
+        :param user_content: 用户输入
+        :return: (规则名称, 回复内容)，未命中时均为None
+        """
+        if not user_content:
+            return None, None
+        user_content = user_content.strip()
+        
+        # 离线评估没有会话，按不在流程中的用户处理
+        rule = self.match_rule(user_content, state='')
+        if rule is not None:
+            return rule.name, rule.render(user_content)
+        
+        for name, function_rule in self.function_rules.items():
+            try:
+                reply = function_rule(user_content)
+            except Exception:
+                continue
+            if reply:
+                return name, reply
+        
+        return None, None
+
+# 批量评估工作进程使用的规则集快照，由 fork 从父进程继承
+_batch_rule_set: Optional[CompiledRuleSet] = None
+
+def _init_batch_worker(rule_set: CompiledRuleSet):
+    """
+    批量评估工作进程初始化
+    :param rule_set: 规则集快照，fork 启动时直接继承，无需序列化
+    """
+    global _batch_rule_set
+    _batch_rule_set = rule_set
+
+def _evaluate_batch_chunk(messages: List[str]) -> List[Tuple[Optional[str], Optional[str]]]:
+    """在工作进程中评估一批消息"""
+    return [_batch_rule_set.evaluate(user_content) for user_content in messages]
+
+def spaced_keys(count: int) -> Tuple[int, ...]:
+    """
+    按固定间隔生成递增的优先级键
+    :param count: 规则数量
+    :return: 优先级键元组
+    """
+    return tuple(range(PRIORITY_KEY_SPACING, (count + 1) * PRIORITY_KEY_SPACING, PRIORITY_KEY_SPACING))
+
+def _exact_entries(pairs: Iterable[Tuple[int, ReplyRule]]) -> List[Tuple[str, int]]:
+    # 模糊规则与原文相同时按精确规则处理；空回复的规则永远不会被选中，无需进入索引
+    return [(normalize_key(rule.pattern), key) for key, rule in pairs
+            if rule.rule_type in ('exact', 'fuzzy') and rule.reply]
+
+def _contains_entries(pairs: Iterable[Tuple[int, ReplyRule]]) -> List[Tuple[str, int]]:
+    return [(fold_text(rule.pattern), key) for key, rule in pairs
+            if rule.rule_type == 'contains' and rule.reply]
+
+def _regex_entries(pairs: Iterable[Tuple[int, ReplyRule]]) -> List[Tuple[int, str, Pattern]]:
+    return [(key, rule.pattern, rule.compiled_pattern) for key, rule in pairs
+            if rule.rule_type == 'regex' and rule.reply and rule.compiled_pattern]
+
+def _fuzzy_entries(pairs: Iterable[Tuple[int, ReplyRule]]) -> List[Tuple[str, int]]:
+    return [(normalize_key(rule.pattern), key) for key, rule in pairs
+            if rule.rule_type == 'fuzzy' and rule.reply]
+
+def _state_entries(pairs: Iterable[Tuple[int, ReplyRule]]) -> List[Tuple[str, int]]:
+    return [(state_rule_key(rule.state, state_pattern_key(rule.pattern)), key) for key, rule in pairs
+            if rule.rule_type == 'state' and rule.reply]
+
+def state_pattern_key(pattern: str) -> str:
+    """
+    状态规则模式的索引键，通配模式保持不变
+    :param pattern: 状态规则的匹配模式
+    :return: 规范化后的输入或通配符
+    """
+    if pattern.strip() == STATE_WILDCARD:
+        return STATE_WILDCARD
+    return normalize_key(pattern)
+
+def state_rule_key(state: str, key: str) -> str:
+    """
+    拼接状态索引的键
+    :param state: 用户状态
+    :param key: 规范化后的输入或通配符
+    :return: 索引键
+    """
+    return f"{state}\x00{key}"
+
+def build_rule_indexes(rules: Tuple[ReplyRule, ...], keys: Optional[Tuple[int, ...]] = None) -> RuleIndexes:
+    """
+    为一组规则编译匹配索引，索引中记录的是规则的优先级键
+    精确和包含规则的模式在此按消息的规范化方式处理一次；正则在规范化后的消息上执行，
+    因此正则中的字母和数字应使用半角形式。模糊规则同时进入精确索引和模糊索引；
+    状态规则以 (状态, 输入) 为键进入单独的哈希索引
+    :param rules: 按优先级排列的回复规则
+    :param keys: 与规则一一对应的优先级键，默认按固定间隔编号
+    :return: (精确匹配索引, 包含匹配自动机, 正则匹配层, 模糊匹配索引, 状态规则索引)
+    """
+    if keys is None:
+        keys = spaced_keys(len(rules))
+    pairs = list(zip(keys, rules))
+    return (
+        ExactMatchIndex(_exact_entries(pairs)),
+        AhoCorasickAutomaton(_contains_entries(pairs)),
+        RegexPrefilterTier(_regex_entries(pairs)),
+        SymmetricDeleteIndex(_fuzzy_entries(pairs), FUZZY_MAX_DISTANCE),
+        ExactMatchIndex(_state_entries(pairs))
+    )
+
+def _build_fuzzy_index(rules: Tuple[ReplyRule, ...], keys: Tuple[int, ...]) -> SymmetricDeleteIndex:
+    """
+    单独编译模糊匹配索引
+    :param rules: 按优先级排列的回复规则
+    :param keys: 与规则一一对应的优先级键
+    :return: 模糊匹配索引
+    """
+    return SymmetricDeleteIndex(_fuzzy_entries(zip(keys, rules)), FUZZY_MAX_DISTANCE)
+
+def update_rule_indexes(base: 'CompiledRuleSet', rules: Tuple[ReplyRule, ...], keys: Tuple[int, ...],
+                        removed: List[Tuple[int, ReplyRule]], added: List[Tuple[int, ReplyRule]]) -> RuleIndexes:
+    """
+    按变更增量更新匹配索引，未涉及的匹配层直接沿用旧快照中的对象
+    精确索引、状态索引、正则层和模糊索引只处理变更的规则；自动机的失败指针
+    无法局部修补，包含规则有变更时只重建这一层
+    :param base: 变更前的规则集快照
+    :param rules: 变更后按优先级排列的回复规则
+    :param keys: 变更后与规则一一对应的优先级键
+    :param removed: 删除的 (优先级键, 规则)，修改的规则以旧键和旧规则出现在这里
+    :param added: 加入的 (优先级键, 规则)
+    :return: (精确匹配索引, 包含匹配自动机, 正则匹配层, 模糊匹配索引, 状态规则索引)
+    """
+    changed_types = {rule.rule_type for _, rule in removed} | {rule.rule_type for _, rule in added}
+    
+    exact_index = base.exact_index
+    if changed_types & {'exact', 'fuzzy'}:
+        exact_index = exact_index.updated(_exact_entries(removed), _exact_entries(added))
+    
+    contains_automaton = base.contains_automaton
+    if 'contains' in changed_types:
+        contains_automaton = AhoCorasickAutomaton(_contains_entries(zip(keys, rules)))
+    
+    regex_tier = base.regex_tier
+    if 'regex' in changed_types:
+        regex_tier = regex_tier.updated(
+            [key for key, rule in removed if rule.rule_type == 'regex'],
+            _regex_entries(added)
+        )
+    
+    fuzzy_index = base.fuzzy_index
+    if 'fuzzy' in changed_types:
+        fuzzy_index = fuzzy_index.updated(_fuzzy_entries(removed), _fuzzy_entries(added))
+    
+    state_index = base.state_index
+    if 'state' in changed_types:
+        state_index = state_index.updated(_state_entries(removed), _state_entries(added))
+    
+    return exact_index, contains_automaton, regex_tier, fuzzy_index, state_index
+
+class RuleDraft:
+    """
+    规则集草稿
+    批量修改期间按名称索引规则，记录发生变化的规则，发布时据此增量更新匹配索引
+    """
+    
+    def __init__(self, base: CompiledRuleSet):
+        """
+        以当前快照为基础创建草稿
+        :param base: 当前规则集快照
+        """
+        self.base = base
+        self.function_rules: Dict[str, FunctionRule] = dict(base.function_rules)
+        # 名称 -> 优先级键、优先级键 -> 规则，以及按优先级排列的键，均从快照整体复制
+        self._key_by_name: Dict[str, int] = dict(base.key_by_name)
+        self._rule_by_key: Dict[int, ReplyRule] = dict(base.rule_by_key)
+        self._keys: List[int] = list(base.keys)
+        self._changed: set = set()
+        # 整体替换或重新编号后不再做增量更新；整体替换时可以附带已编译好的索引
+        self._rebuild = False
+        self._prebuilt_indexes = None
+    
+    def __len__(self):
+        return len(self._key_by_name)
+    
+    def __contains__(self, name: str) -> bool:
+        return name in self._key_by_name
+    
+    def get(self, name: str) -> Optional[ReplyRule]:
+        """
+        按名称查找规则
+        :param name: 规则名称
+        :return: 规则或None
+        """
+        key = self._key_by_name.get(name)
+        return self._rule_by_key[key] if key is not None else None
+    
+    @property
+    def rules(self) -> List[ReplyRule]:
+        """按优先级排列的规则"""
+        return list(map(self._rule_by_key.__getitem__, self._keys))
+    
+    def upsert(self, rule: ReplyRule, before: Optional[str] = None, position: Optional[int] = None) -> bool:
+        """
+        加入或替换规则
+        已存在的同名规则原位替换，指定 before 或 position 时同时移动到该位置
+        :param rule: 回复规则
+        :param before: 放在该名称的规则之前
+        :param position: 放在第几位（从0开始），超出范围时放在末尾
+        :return: 是否为新加入的规则
+        """
+        key = self._key_by_name.get(rule.name)
+        if key is not None and (before == rule.name or (before is None and position is None)):
+            self._set(rule.name, key, rule)
+            return False
+        
+        if key is not None:
+            self._detach(rule.name)
+        self._set(rule.name, self._allocate_key(self._insert_position(before, position)), rule)
+        return key is None
+    
+    def move(self, name: str, before: Optional[str] = None, position: Optional[int] = None) -> bool:
+        """
+        调整规则的优先级
+        :param name: 规则名称
+        :param before: 移到该名称的规则之前
+        :param position: 移到第几位（从0开始），两者都不指定时移到末尾
+        :return: 规则是否存在
+        """
+        if name not in self._key_by_name:
+            return False
+        if before == name:
+            return True
+        rule = self._detach(name)
+        self._set(name, self._allocate_key(self._insert_position(before, position)), rule)
+        return True
+    
+    def remove(self, name: str) -> Optional[ReplyRule]:
+        """
+        删除规则
+        :param name: 规则名称
+        :return: 被删除的规则，不存在时返回None
+        """
+        if name not in self._key_by_name:
+            return None
+        rule = self._detach(name)
+        self._changed.add(name)
+        self._prebuilt_indexes = None
+        return rule
+    
+    def replace_all(self, rules: Iterable[ReplyRule], indexes: Optional[Tuple] = None):
+        """
+        整体替换规则，按固定间隔重新编号
+        :param rules: 按优先级排列的回复规则
+        :param indexes: 已按固定间隔编号编译好的索引
+        """
+        rules = list(rules)
+        keys = spaced_keys(len(rules))
+        key_by_name = {}
+        for key, rule in zip(keys, rules):
+            if rule.name in key_by_name:
+                raise ValueError(f"规则名称重复: {rule.name}")
+            key_by_name[rule.name] = key
+        self._key_by_name = key_by_name
+        self._rule_by_key = dict(zip(keys, rules))
+        self._keys = list(keys)
+        self._rebuild = True
+        self._prebuilt_indexes = indexes
+    
+    def clear(self):
+        """清空回复规则"""
+        self.replace_all(())
+    
+    def _set(self, name: str, key: int, rule: ReplyRule):
+        if key not in self._rule_by_key:
+            self._keys.insert(bisect_left(self._keys, key), key)
+        self._key_by_name[name] = key
+        self._rule_by_key[key] = rule
+        self._changed.add(name)
+        self._prebuilt_indexes = None
+    
+    def _detach(self, name: str) -> ReplyRule:
+        # 从草稿中摘除规则，返回被摘除的规则
+        key = self._key_by_name.pop(name)
+        del self._keys[bisect_left(self._keys, key)]
+        return self._rule_by_key.pop(key)
+    
+    def _insert_position(self, before: Optional[str], position: Optional[int]) -> int:
+        """
+        计算插入位置
+        :param before: 放在该名称的规则之前
+        :param position: 放在第几位
+        :return: 在优先级键列表中的下标
+        """
+        if before is not None:
+            key = self._key_by_name.get(before)
+            if key is None:
+                raise KeyError(f"规则不存在: {before}")
+            return bisect_left(self._keys, key)
+        if position is not None:
+            return max(0, min(position, len(self._keys)))
+        return len(self._keys)
+    
+    def _allocate_key(self, index: int) -> int:
+        """
+        在相邻两条规则的键之间取一个新键，间隔用尽时整体重新编号
+        :param index: 插入位置
+        :return: 新的优先级键
+        """
+        low = self._keys[index - 1] if index > 0 else 0
+        high = self._keys[index] if index < len(self._keys) else None
+        if high is None:
+            return low + PRIORITY_KEY_SPACING
+        if high - low > 1:
+            return (low + high) // 2
+        
+        self._renumber()
+        low = self._keys[index - 1] if index > 0 else 0
+        return low + PRIORITY_KEY_SPACING // 2
+    
+    def _renumber(self):
+        rules = self.rules
+        keys = spaced_keys(len(rules))
+        self._key_by_name = {rule.name: key for key, rule in zip(keys, rules)}
+        self._rule_by_key = dict(zip(keys, rules))
+        self._keys = list(keys)
+        self._rebuild = True
+        self._prebuilt_indexes = None
+    
+    def compile(self, version: int) -> CompiledRuleSet:
+        """
+        编译为新的规则集快照
+        :param version: 新快照的版本号
+        :return: 规则集快照
+        """
+        keys = tuple(self._keys)
+        rules = tuple(map(self._rule_by_key.__getitem__, keys))
+        if self._rebuild:
+            return CompiledRuleSet(version, rules, self.function_rules, self._prebuilt_indexes, keys)
+        
+        base = self.base
+        removed = []
+        added = []
+        for name in self._changed:
+            old_key = base.key_by_name.get(name)
+            old = (old_key, base.rule_by_key[old_key]) if old_key is not None else None
+            new_key = self._key_by_name.get(name)
+            new = (new_key, self._rule_by_key[new_key]) if new_key is not None else None
+            if old == new:
+                continue
+            if old is not None:
+                removed.append(old)
+            if new is not None:
+                added.append(new)
+        
+        indexes = update_rule_indexes(base, rules, keys, removed, added)
+        return CompiledRuleSet(version, rules, self.function_rules, indexes, keys)
+
+def _min_ordinal(*hits: Optional[int]) -> Optional[int]:
+    """
+    合并各匹配层的命中结果
+    :param hits: 各层命中的规则序号
+    :return: 最小序号，全部未命中返回None
+    """
+    best = None
+    for hit in hits:
+        if hit is not None and (best is None or hit < best):
+            best = hit
+    return best
 
 class ReplyRuleManager:
     """回复规则管理器"""
     
-    def __init__(self):
-        """初始化规则管理器"""
-        self.rules: List[ReplyRule] = []
-        self.function_rules: Dict[str, Callable] = {}
+    def __init__(self, intent_table: Optional[IntentTable] = None,
+                 function_executor: Optional[FunctionRuleExecutor] = None,
+                 sessions: Optional[SessionStore] = None):
+        """
+        初始化规则管理器
+        :param intent_table: 智能问答使用的意图表，默认从配置文件加载
+        :param function_executor: 函数规则执行器，默认按配置创建
+        :param sessions: 状态规则使用的会话存储，默认按配置创建
+        """
+        self.intent_table = intent_table if intent_table is not None else get_default_intent_table()
+        self.stats = RuleStats()
+        self.function_executor = function_executor if function_executor is not None else FunctionRuleExecutor(
+            max_workers=Config.FUNCTION_RULE_WORKERS,
+            timeout=Config.FUNCTION_RULE_TIMEOUT,
+            budget=Config.FUNCTION_RULE_BUDGET,
+            failure_threshold=Config.FUNCTION_RULE_FAILURE_THRESHOLD,
+            reset_timeout=Config.FUNCTION_RULE_RESET_TIMEOUT
+        )
+        self.sessions = sessions if sessions is not None else SessionStore(
+            ttl=Config.SESSION_TTL,
+            max_sessions=Config.SESSION_MAX_COUNT,
+            max_bytes=Config.SESSION_MAX_MEMORY_MB * 1024 * 1024
+        )
+        # 当前生效的规则集快照，发布新快照只需替换这一个引用
+        self._rule_set = CompiledRuleSet(0, (), {})
+        # 写操作互斥，读操作不加锁
+        self._write_lock = threading.RLock()
+        self._draft: Optional[RuleDraft] = None
         self._load_default_rules()
     
+    @property
+    def rules(self) -> Tuple[ReplyRule, ...]:
+        """当前生效的回复规则（只读）"""
+        return self._rule_set.rules
+    
+    @property
+    def function_rules(self) -> Mapping[str, FunctionRule]:
+        """当前生效的函数规则（只读）"""
+        return self._rule_set.function_rules
+    
+    @property
+    def version(self) -> int:
+        """当前规则集快照的版本号"""
+        return self._rule_set.version
+    
+    def get_rule_set(self) -> CompiledRuleSet:
+        """
+        获取当前规则集快照
+        :return: 不可变的已编译规则集
+        """
+        return self._rule_set
+    
+    def get_rule(self, name: str) -> Optional[ReplyRule]:
+        """
+        按名称查找当前生效的规则
+        :param name: 规则名称
+        :return: 规则或None
+        """
+        return self._rule_set.get_rule(name)
+    
+    @contextmanager
+    def batch_update(self):
+        """
+        批量修改规则（事务），退出时只编译和发布一次新快照
+        可以嵌套使用，由最外层负责发布；执行出错时放弃全部修改。
+        发布时只更新发生变化的规则所在的匹配层
+        :return: 规则集草稿
+        """
+        with self._write_lock:
+            if self._draft is not None:
+                yield self._draft
+                return
+            
+            current = self._rule_set
+            self._draft = RuleDraft(current)
+            try:
+                yield self._draft
+                # 新快照在写线程中编译完成后再替换引用，读取方始终看到完整的规则集
+                self._rule_set = self._draft.compile(current.version + 1)
+            finally:
+                self._draft = None
+    
     def _load_default_rules(self):
         """加载默认回复规则"""
+        with self.batch_update() as draft:
+            self._add_default_rules()
+            rule_count = len(draft)
+        
+        logger.info(f"已加载 {rule_count} 条默认回复规则")
+    
+    def _add_default_rules(self):
+        """添加默认回复规则"""
         # 精确匹配规则
         self.add_rule("问候回复", "你好", "你好+1", "exact")
         self.add_rule("再见回复", "再见", "再见，期待下次见面！", "exact")
@@ -52,98 +718,215 @@ class ReplyRuleManager:
         
         # 包含匹配规则
         self.add_rule("天气询问", "天气", "抱歉，我暂时无法提供天气信息，请查看天气预报应用。", "contains")
-        self.add_rule("时间询问", "时间", "请查看您的设备时间，或者说'现在几点'获取当前时间。", "contains")
+        self.add_rule("时间询问", "时间", "现在是 {date} {time}。", "contains")
         
         # 正则表达式规则
         self.add_rule("电话号码", r"1[3-9]\d{9}", "检测到电话号码，请注意保护个人隐私信息。", "regex")
         self.add_rule("邮箱地址", r"\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b", "检测到邮箱地址，请注意保护个人隐私信息。", "regex")
         
-        # 注册函数规则
-        self.register_function_rule("智能问答", self._smart_qa_handler)
-        
-        logger.info(f"已加载 {len(self.rules)} 条默认回复规则")
+        # 注册函数规则（意图表匹配只做内存扫描，直接在请求线程中执行）
+        self.register_function_rule("智能问答", self._smart_qa_handler, inline=True)
     
-    def add_rule(self, name: str, pattern: str, reply: str, rule_type: str = 'exact'):
+    def add_rule(self, name: str, pattern: str, reply: str, rule_type: str = 'exact', dynamic: bool = False,
+                 state: str = '', next_state: str = ''):
         """
-        添加回复规则
+        添加回复规则，放在最低优先级；同名规则已存在时原位替换
         :param name: 规则名称
         :param pattern: 匹配模式
         :param reply: 回复内容
         :param rule_type: 规则类型
+        :param dynamic: 回复是否随时间或用户变化
+        :param state: 状态规则要求用户所处的状态
+        :param next_state: 状态规则命中后用户进入的状态
+        """
+        self.upsert_rule(name, pattern, reply, rule_type, dynamic, state=state, next_state=next_state)
+    
+    def add_state_rule(self, name: str, state: str, pattern: str, reply: str, next_state: str = ''):
         """
-        rule = ReplyRule(name, pattern, reply, rule_type)
-        self.rules.append(rule)
-        logger.info(f"添加回复规则: {name} ({rule_type})")
+        添加状态规则：用户处于 state 且输入与 pattern 相同时回复，并进入 next_state
+        :param name: 规则名称
+        :param state: 用户所处的状态，空字符串表示用户不在任何流程中（流程入口）
+        :param pattern: 用户输入，"*" 匹配该状态下的任意输入
+        :param reply: 回复内容
+        :param next_state: 命中后进入的状态，空字符串表示结束流程
+        """
+        self.upsert_rule(name, pattern, reply, 'state', state=state, next_state=next_state)
     
-    def register_function_rule(self, name: str, handler: Callable):
+    def upsert_rule(self, name: str, pattern: str, reply: str, rule_type: str = 'exact', dynamic: bool = False,
+                    before: Optional[str] = None, position: Optional[int] = None,
+                    state: str = '', next_state: str = '') -> bool:
+        """
+        添加或替换回复规则
+        同名规则已存在时原位替换，否则放在最低优先级；指定 before 或 position 时放到该位置
+        :param name: 规则名称
+        :param pattern: 匹配模式
+        :param reply: 回复内容
+        :param rule_type: 规则类型
+        :param dynamic: 回复是否随时间或用户变化
+        :param before: 放在该名称的规则之前
+        :param position: 放在第几位（从0开始）
+        :param state: 状态规则要求用户所处的状态
+        :param next_state: 状态规则命中后用户进入的状态
+        :return: 是否为新加入的规则
+        """
+        rule = ReplyRule(name, pattern, reply, rule_type, dynamic, state, next_state)
+        with self.batch_update() as draft:
+            added = draft.upsert(rule, before, position)
+        logger.info(f"{'添加' if added else '更新'}回复规则: {name} ({rule_type})")
+        return added
+    
+    def move_rule(self, name: str, before: Optional[str] = None, position: Optional[int] = None) -> bool:
+        """
+        调整规则优先级
+        :param name: 规则名称
+        :param before: 移到该名称的规则之前
+        :param position: 移到第几位（从0开始），两者都不指定时移到末尾
+        :return: 规则是否存在
+        """
+        with self.batch_update() as draft:
+            moved = draft.move(name, before, position)
+        if moved:
+            logger.info(f"调整规则优先级: {name}")
+        return moved
+    
+    def replace_rules(self, rules: Tuple[ReplyRule, ...],
+                      indexes: Optional[RuleIndexes] = None):
+        """
+        整体替换回复规则（函数规则保留），用于从规则文件加载
+        :param rules: 按优先级排列的回复规则，名称不能重复
+        :param indexes: 已为这组规则按默认优先级键编译好的索引，默认重新编译
+        """
+        with self.batch_update() as draft:
+            draft.replace_all(rules, indexes)
+        logger.info(f"替换回复规则，共 {len(rules)} 条")
+    
+    def register_function_rule(self, name: str, handler: Callable, dynamic: bool = False,
+                               timeout: Optional[float] = None, inline: bool = False):
         """
         注册函数规则
         :param name: 规则名称
         :param handler: 处理函数
+        :param dynamic: 回复是否随时间或用户变化，如查询实时数据的处理函数
+        :param timeout: 处理函数的超时时间（秒），超时后继续检查下一条函数规则
+        :param inline: 是否在请求线程中直接执行，仅用于不会阻塞的内置处理函数
         """
-        self.function_rules[name] = handler
+        with self.batch_update() as draft:
+            draft.function_rules[name] = FunctionRule(name, handler, dynamic, timeout, inline)
         logger.info(f"注册函数规则: {name}")
     
-    def find_reply(self, user_content: str) -> Optional[str]:
+    def find_reply(self, user_content: str, user_id: Optional[str] = None) -> Optional[str]:
         """
         根据用户输入查找匹配的回复
         :param user_content: 用户输入内容
+        :param user_id: 用户OpenID，提供时检查状态规则并切换用户的状态
         :return: 回复内容或None
         """
         if not user_content:
             return None
+        return self.find_match(user_content, user_id).reply
+    
+    def has_session(self, user_id: Optional[str]) -> bool:
+        """
+        用户是否处于多轮流程中，流程中的回复取决于状态，不能使用回复缓存
+        :param user_id: 用户OpenID
+        :return: 是否有未过期的会话
+        """
+        return bool(user_id) and self.sessions.get_state(user_id) is not None
+    
+    def find_match(self, user_content: str, user_id: Optional[str] = None) -> ReplyMatch:
+        """
+        根据用户输入查找匹配的规则，并给出结果是否可以缓存
+        提供用户OpenID时先检查状态规则，命中后切换用户的状态
+        :param user_content: 用户输入内容
+        :param user_id: 用户OpenID
+        :return: 查找结果，未命中时规则名称和回复为None
+        """
+        # 整个查找过程使用同一个快照，不受并发的规则变更影响
+        rule_set = self._rule_set
+        
+        if not user_content:
+            return ReplyMatch(None, None, True, rule_set.version)
         
         user_content = user_content.strip()
         logger.info(f"查找回复规则，用户输入: {user_content}")
         
-        # 按优先级顺序检查规则
-        for rule in self.rules:
-            reply = self._check_rule(rule, user_content)
-            if reply:
-                logger.info(f"匹配到规则: {rule.name}")
-                return reply
+        # 流程中的用户的所有结果都取决于状态，不缓存；
+        # 没有用户OpenID时不检查状态规则，结果也不缓存，以免流程入口的输入缓存了普通规则的结果
+        state = None
+        cacheable = True
+        if len(rule_set.state_index):
+            if user_id:
+                state = self.sessions.get_state(user_id) or ''
+            cacheable = state == ''
         
-        # 检查函数规则
-        for name, handler in self.function_rules.items():
-            try:
-                reply = handler(user_content)
-                if reply:
-                    logger.info(f"匹配到函数规则: {name}")
-                    return reply
-            except Exception as e:
-                logger.error(f"函数规则 {name} 执行失败: {str(e)}")
+        rule = rule_set.match_rule(user_content, self.stats, state)
+        if rule is not None:
+            logger.info(f"匹配到规则: {rule.name}")
+            if rule.rule_type == 'state':
+                # 状态规则命中即切换状态，结果不能缓存，否则缓存命中时会跳过状态切换
+                self.sessions.set_state(user_id, rule.next_state)
+                logger.info(f"用户状态切换: {state or '-'} -> {rule.next_state or '-'}")
+                return ReplyMatch(rule.name, rule.render(user_content, user_id), False, rule_set.version)
+            return ReplyMatch(rule.name, rule.render(user_content, user_id), cacheable and not rule.dynamic,
+                              rule_set.version)
+        
+        # 检查函数规则，所有函数规则共享同一个时间预算
+        failed = False
+        deadline = self.function_executor.new_deadline()
+        for name, function_rule in rule_set.function_rules.items():
+            start = time.perf_counter()
+            reply, completed = self.function_executor.call(
+                name, function_rule.handler, user_content, deadline,
+                timeout=function_rule.timeout, inline=function_rule.inline
+            )
+            self.stats.record_rule(name, hits=1 if completed and reply else 0,
+                                   seconds=time.perf_counter() - start)
+            if not completed:
+                failed = True
+            elif reply:
+                logger.info(f"匹配到函数规则: {name}")
+                return ReplyMatch(name, reply, cacheable and not function_rule.dynamic, rule_set.version)
         
+        # 函数规则超时、失败或被熔断属于偶发情况，未命中的结果不缓存
         logger.info("未找到匹配的回复规则")
-        return None
+        cacheable = cacheable and not (failed or rule_set.has_dynamic_functions)
+        return ReplyMatch(None, None, cacheable, rule_set.version)
     
-    def _check_rule(self, rule: ReplyRule, user_content: str) -> Optional[str]:
+    def find_replies(self, messages: Iterable[str], processes: Optional[int] = None,
+                     chunksize: int = 256) -> Iterator[Tuple[Optional[str], Optional[str]]]:
         """
-        检查单个规则是否匹配
-        :param rule: 回复规则
-        :param user_content: 用户输入
-        :return: 回复内容或None
+        批量查找回复，用于离线评估历史消息
+        按输入顺序流式返回结果，不记录逐条日志和统计；
+        多进程时工作进程通过 fork 共享当前规则集快照，不支持 fork 的平台在本进程内执行
+        :param messages: 用户消息序列，可以是惰性读取的迭代器
+        :param processes: 工作进程数，默认为CPU核数，1 表示在本进程内执行
+        :param chunksize: 每次分发给工作进程的消息条数
+        :return: (规则名称, 回复内容) 迭代器，未命中时均为None
         """
-        try:
-            if rule.rule_type == 'exact':
-                # 精确匹配
-                if user_content == rule.pattern:
-                    return rule.reply
-            
-            elif rule.rule_type == 'contains':
-                # 包含匹配
-                if rule.pattern.lower() in user_content.lower():
-                    return rule.reply
-            
-            elif rule.rule_type == 'regex':
-                # 正则表达式匹配
-                if rule.compiled_pattern and rule.compiled_pattern.search(user_content):
-                    return rule.reply
-            
-            return None
-            
-        except Exception as e:
-            logger.error(f"规则检查失败 {rule.name}: {str(e)}")
-            return None
+        # 整批消息使用同一个快照
+        rule_set = self._rule_set
+        if processes is None:
+            processes = os.cpu_count() or 1
+        
+        if processes <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+            for user_content in messages:
+                yield rule_set.evaluate(user_content)
+            return
+        
+        # 按块分发，最多保留每个进程两块未取回的结果，输入再大内存占用也有上限
+        context = multiprocessing.get_context('fork')
+        with context.Pool(processes, initializer=_init_batch_worker, initargs=(rule_set,)) as pool:
+            pending = deque()
+            iterator = iter(messages)
+            while True:
+                chunk = list(islice(iterator, chunksize))
+                if not chunk:
+                    break
+                pending.append(pool.apply_async(_evaluate_batch_chunk, (chunk,)))
+                if len(pending) >= processes * 2:
+                    yield from pending.popleft().get()
+            while pending:
+                yield from pending.popleft().get()
     
     def _smart_qa_handler(self, user_content: str) -> Optional[str]:
         """
@@ -151,43 +934,62 @@ class ReplyRuleManager:
         :param user_content: 用户输入
         :return: 回复内容或None
         """
-        # 简单的智能问答逻辑
-        content_lower = user_content.lower()
-        
-        # 问候相关
-        greetings = ['hi', 'hello', '您好', '你好啊', '早上好', '下午好', '晚上好']
-        if any(greeting in content_lower for greeting in greetings):
-            return "您好！很高兴为您服务，有什么可以帮助您的吗？"
-        
-        # 感谢相关
-        thanks = ['谢谢', '感谢', 'thank', '多谢']
-        if any(thank in content_lower for thank in thanks):
-            return "不客气！很高兴能帮助到您。"
-        
-        # 询问功能
-        functions = ['功能', '能做什么', '怎么用', '使用方法']
-        if any(func in content_lower for func in functions):
-            return "我是智能客服机器人，可以：\n1. 回答常见问题\n2. 提供帮助信息\n3. 进行简单对话\n发送'帮助'了解更多功能。"
-        
-        return None
+        intent = self.intent_table.match(user_content)
+        if intent is None:
+            return None
+        return intent.reply
     
     def get_rules_info(self) -> Dict:
         """
-        获取规则信息
+        获取规则信息和运行统计
+        精确和包含规则的执行次数即所在匹配层的执行次数，正则规则只统计通过预过滤的次数。
+        正则规则的耗时只记录单独执行的情况（唯一通过预过滤的规则和不可组合的规则），
+        多条规则组合成一个正则执行时只计入 regex 匹配层的耗时
         :return: 规则信息字典
         """
+        rule_set = self._rule_set
+        stats = self.stats.snapshot()
+        rule_stats = stats['rules']
+        tier_stats = stats['tiers']
+        breaker_states = self.function_executor.get_breaker_states()
+        
+        def rule_entry_stats(name: str, tier: Optional[str] = None) -> Dict:
+            entry = rule_stats.get(name, {})
+            evaluations = entry.get('evaluations', 0)
+            if tier is not None:
+                evaluations = tier_stats.get(tier, {}).get('evaluations', 0)
+            return {
+                'hits': entry.get('hits', 0),
+                'evaluations': evaluations,
+                'total_time_ms': entry.get('total_time_ms', 0.0),
+                'latency_histogram': entry.get('latency_histogram', {})
+            }
+        
         return {
-            'total_rules': len(self.rules),
-            'function_rules': len(self.function_rules),
+            'version': rule_set.version,
+            'total_rules': len(rule_set.rules),
+            'function_rules': len(rule_set.function_rules),
             'rules': [
                 {
                     'name': rule.name,
                     'pattern': rule.pattern,
                     'type': rule.rule_type,
-                    'reply_preview': rule.reply[:50] + '...' if len(rule.reply) > 50 else rule.reply
+                    'reply_preview': rule.reply[:50] + '...' if len(rule.reply) > 50 else rule.reply,
+                    'stats': rule_entry_stats(
+                        rule.name, rule.rule_type if rule.rule_type in ('exact', 'contains', 'fuzzy', 'state') else None
+                    )
+                }
+                for rule in rule_set.rules
+            ],
+            'function_rule_stats': [
+                {
+                    'name': name,
+                    'circuit': breaker_states.get(name, 'inline' if function_rule.inline else 'closed'),
+                    'stats': rule_entry_stats(name)
                 }
-                for rule in self.rules
-            ]
+                for name, function_rule in rule_set.function_rules.items()
+            ],
+            'tiers': tier_stats
         }
     
     def remove_rule(self, name: str) -> bool:
@@ -196,29 +998,31 @@ class ReplyRuleManager:
         :param name: 规则名称
         :return: 是否删除成功
         """
-        for i, rule in enumerate(self.rules):
-            if rule.name == name:
-                del self.rules[i]
+        with self.batch_update() as draft:
+            if draft.remove(name) is not None:
                 logger.info(f"删除规则: {name}")
                 return True
-        
-        if name in self.function_rules:
-            del self.function_rules[name]
-            logger.info(f"删除函数规则: {name}")
-            return True
+            
+            if name in draft.function_rules:
+                del draft.function_rules[name]
+                logger.info(f"删除函数规则: {name}")
+                return True
         
         return False
     
     def clear_rules(self):
         """清空所有规则"""
-        self.rules.clear()
-        self.function_rules.clear()
+        with self.batch_update() as draft:
+            draft.clear()
+            draft.function_rules.clear()
         logger.info("已清空所有回复规则")
     
     def reload_default_rules(self):
         """重新加载默认规则"""
-        self.clear_rules()
-        self._load_default_rules()
+        # 清空和加载在同一次发布中完成，读取方不会看到空规则集
+        with self.batch_update():
+            self.clear_rules()
+            self._load_default_rules()
         logger.info("已重新加载默认回复规则")
 
 # 全局规则管理器实例
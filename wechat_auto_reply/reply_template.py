@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+回复模板
+回复内容中可以引用时间、用户和正则分组等变量，添加规则时编译一次，回复时直接渲染
+"""
+
+import re
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from typing import Callable, List, NamedTuple, Optional, Pattern, Tuple
+from config import Config
+
+# 渲染时间变量使用的时区，默认北京时间
+REPLY_TIMEZONE = timezone(timedelta(hours=Config.REPLY_UTC_OFFSET))
+
+# {{ 和 }} 为转义的花括号；{变量} 或 {变量:格式}
+_PLACEHOLDER_RE = re.compile(r'\{\{|\}\}|\{(\w+)(?::([^{}]*))?\}')
+
+_WEEKDAYS = ('一', '二', '三', '四', '五', '六', '日')
+
+# 时间变量及其默认格式（strftime）
+_TIME_FORMATS = {
+    'time': '%H:%M',
+    'date': '%Y-%m-%d',
+    'datetime': '%Y-%m-%d %H:%M',
+}
+
+class RenderContext(NamedTuple):
+    """模板渲染的上下文"""
+    content: str
+    user_id: str
+    match: Optional['re.Match']
+    now: Optional[datetime]
+
+# 以下取值函数均为模块级函数，编译好的模板可以随规则一起写入编译缓存
+
+def _format_time(spec: str, context: RenderContext) -> str:
+    return context.now.strftime(spec)
+
+def _weekday(context: RenderContext) -> str:
+    return '星期' + _WEEKDAYS[context.now.weekday()]
+
+def _user(context: RenderContext) -> str:
+    return context.user_id
+
+def _content(context: RenderContext) -> str:
+    return context.content
+
+def _group(group, context: RenderContext) -> str:
+    if context.match is None:
+        return ''
+    return context.match.group(group) or ''
+
+class ReplyTemplate:
+    """
+    已编译的回复模板
+    模板编译为 str.format 格式串和一组取值函数，渲染时只调用取值函数和一次 format
+    """
+
+    __slots__ = ('source', '_format', '_getters', 'uses_time', 'uses_groups')
+
+    def __init__(self, source: str, fmt: str, getters: Tuple[Callable[[RenderContext], str], ...],
+                 uses_time: bool, uses_groups: bool):
+        """
+        :param source: 模板原文
+        :param fmt: 变量位置为 {} 的格式串
+        :param getters: 与格式串中的变量一一对应的取值函数
+        :param uses_time: 是否引用时间变量
+        :param uses_groups: 是否引用正则分组
+        """
+        self.source = source
+        self._format = fmt
+        self._getters = getters
+        self.uses_time = uses_time
+        self.uses_groups = uses_groups
+
+    def render(self, content: str = '', user_id: Optional[str] = None, match: Optional['re.Match'] = None,
+               now: Optional[datetime] = None) -> str:
+        """
+        渲染模板
+        :param content: 用户输入
+        :param user_id: 用户OpenID
+        :param match: 正则规则的匹配结果，用于分组变量
+        :param now: 当前时间，默认取配置时区的当前时间
+        :return: 回复内容
+        """
+        if now is None and self.uses_time:
+            now = datetime.now(REPLY_TIMEZONE)
+        context = RenderContext(content, user_id or '', match, now)
+        return self._format.format(*[getter(context) for getter in self._getters])
+
+    def __repr__(self):
+        return f"ReplyTemplate({self.source!r})"
+
+def _resolve(name: str, spec: Optional[str], pattern: Optional[Pattern]) -> Optional[Tuple[Callable, str]]:
+    """
+    解析一个变量
+    :param name: 变量名
+    :param spec: 冒号后的格式，只用于时间变量
+    :param pattern: 正则规则的已编译模式，用于解析分组变量
+    :return: (取值函数, 变量类别)，不是已知变量时返回None
+    """
+    if name in _TIME_FORMATS:
+        return partial(_format_time, spec or _TIME_FORMATS[name]), 'time'
+    if spec is not None:
+        return None
+    if name == 'weekday':
+        return _weekday, 'time'
+    if name == 'user':
+        return _user, 'user'
+    if name == 'content':
+        return _content, 'content'
+    if pattern is not None:
+        if name.isdigit() and int(name) <= pattern.groups:
+            return partial(_group, int(name)), 'group'
+        if name in pattern.groupindex:
+            return partial(_group, name), 'group'
+    return None
+
+def compile_template(text: str, pattern: Optional[Pattern] = None) -> Optional[ReplyTemplate]:
+    """
+    编译回复模板
+    支持 {time}、{date}、{datetime}（可写作 {time:%H点%M分} 指定格式）、{weekday}、{user}（OpenID）、
+    {content}（用户输入），正则规则还支持 {0}、{1} 等分组序号和命名分组。
+    不是已知变量的花括号原样保留；包含变量的模板中 {{ 和 }} 表示花括号本身
+    :param text: 回复内容
+    :param pattern: 正则规则的已编译模式
+    :return: 已编译的模板，不含变量时返回None（按固定回复处理）
+    """
+    if not text or '{' not in text:
+        return None
+
+    pieces: List[str] = []
+    getters = []
+    kinds = set()
+    position = 0
+    for match in _PLACEHOLDER_RE.finditer(text):
+        pieces.append(text[position:match.start()].replace('{', '{{').replace('}', '}}'))
+        position = match.end()
+        token = match.group(0)
+        if token in ('{{', '}}'):
+            pieces.append(token)
+            continue
+        resolved = _resolve(match.group(1), match.group(2), pattern)
+        if resolved is None:
+            pieces.append(token.replace('{', '{{').replace('}', '}}'))
+            continue
+        getter, kind = resolved
+        getters.append(getter)
+        kinds.add(kind)
+        pieces.append('{}')
+    pieces.append(text[position:].replace('{', '{{').replace('}', '}}'))
+
+    if not getters:
+        return None
+    return ReplyTemplate(text, ''.join(pieces), tuple(getters), 'time' in kinds, 'group' in kinds)
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+规则文件加载器
+从 JSON/CSV/SQLite 文件加载规则目录，并把编译好的匹配索引缓存到磁盘，
+工作进程启动时校验源文件哈希后直接映射缓存文件，省去重新编译
+"""
+
+import csv
+import hashlib
+import json
+import logging
+import mmap
+import os
+import pickle
+import sqlite3
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+from reply_rules import ReplyRule, RULE_TYPES, build_rule_indexes
+
+logger = logging.getLogger(__name__)
+
+# 缓存文件格式版本，匹配索引的数据结构变化时递增
+CACHE_FORMAT_VERSION = 7
+
+_CACHE_MAGIC = b'WXRULES'
+
+SQLITE_SUFFIXES = ('.db', '.sqlite', '.sqlite3')
+
+class RuleFileError(ValueError):
+    """规则文件内容错误"""
+
+def read_rule_specs(path: str) -> List[Dict]:
+    """
+    读取规则文件，按文件中的顺序返回规则定义
+    JSON 文件为规则对象列表（或 {"rules": [...]}）；CSV 文件首行为表头；
+    SQLite 文件读取 rules 表，按 rowid 排序。
+    字段：name（不能重复）、pattern、reply，可选 type（默认 exact）和 dynamic；
+    状态规则（type 为 state）另有 state 和 next_state，空值表示不在流程中或结束流程
+    :param path: 规则文件路径
+    :return: 规则定义列表
+    """
+    suffix = os.path.splitext(path)[1].lower()
+    if suffix == '.json':
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        rows = data.get('rules', []) if isinstance(data, dict) else data
+    elif suffix == '.csv':
+        with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+            rows = list(csv.DictReader(f))
+    elif suffix in SQLITE_SUFFIXES:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            conn.row_factory = sqlite3.Row
+            rows = [dict(row) for row in conn.execute("SELECT * FROM rules ORDER BY rowid")]
+        finally:
+            conn.close()
+    else:
+        raise RuleFileError(f"不支持的规则文件格式: {path}")
+    
+    specs = [_normalize_spec(row, line) for line, row in enumerate(rows, 1)]
+    
+    # 规则按名称索引，名称必须唯一
+    seen = set()
+    for line, spec in enumerate(specs, 1):
+        if spec['name'] in seen:
+            raise RuleFileError(f"第 {line} 条规则名称重复: {spec['name']}")
+        seen.add(spec['name'])
+    return specs
+
+def _normalize_spec(row: Dict, line: int) -> Dict:
+    """
+    校验并规范化一条规则定义
+    :param row: 原始规则定义
+    :param line: 规则在文件中的序号，用于错误提示
+    :return: 规范化后的规则定义
+    """
+    if not isinstance(row, dict):
+        raise RuleFileError(f"第 {line} 条规则格式错误")
+    
+    name = row.get('name')
+    pattern = row.get('pattern')
+    reply = row.get('reply')
+    if not name or not pattern or reply is None:
+        raise RuleFileError(f"第 {line} 条规则缺少 name、pattern 或 reply 字段")
+    
+    rule_type = row.get('type') or 'exact'
+    if rule_type not in RULE_TYPES:
+        raise RuleFileError(f"第 {line} 条规则类型不支持: {rule_type}")
+    
+    dynamic = row.get('dynamic')
+    if isinstance(dynamic, str):
+        dynamic = dynamic.strip().lower() in ('1', 'true', 'yes')
+    
+    return {
+        'name': str(name),
+        'pattern': str(pattern),
+        'reply': str(reply),
+        'type': rule_type,
+        'dynamic': bool(dynamic),
+        'state': str(row.get('state') or ''),
+        'next_state': str(row.get('next_state') or '')
+    }
+
+def file_sha256(path: str) -> str:
+    """
+    计算文件内容的SHA256
+    :param path: 文件路径
+    :return: 十六进制摘要
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _cache_header(source_hash: str) -> bytes:
+    """
+    生成缓存文件头，源文件、缓存格式或Python版本任一变化都会使缓存失效
+    :param source_hash: 源文件哈希
+    :return: 文件头字节串
+    """
+    python_version = f"{sys.version_info[0]}.{sys.version_info[1]}"
+    return b' '.join([
+        _CACHE_MAGIC,
+        str(CACHE_FORMAT_VERSION).encode(),
+        python_version.encode(),
+        source_hash.encode()
+    ]) + b'\n'
+
+def compile_rules(specs: List[Dict]) -> Tuple[Tuple[ReplyRule, ...], Tuple]:
+    """
+    把规则定义编译为规则和匹配索引
+    :param specs: 规则定义列表
+    :return: (规则元组, 匹配索引)
+    """
+    rules = tuple(
+        ReplyRule(spec['name'], spec['pattern'], spec['reply'], spec['type'], spec['dynamic'],
+                  spec['state'], spec['next_state'])
+        for spec in specs
+    )
+    return rules, build_rule_indexes(rules)
+
+def save_compiled_cache(cache_path: str, source_hash: str, rules: Tuple[ReplyRule, ...], indexes: Tuple):
+    """
+    写入编译缓存文件，先写临时文件再原子替换，其他进程不会读到半个文件
+    :param cache_path: 缓存文件路径
+    :param source_hash: 源文件哈希
+    :param rules: 规则元组
+    :param indexes: 匹配索引
+    """
+    cache_dir = os.path.dirname(os.path.abspath(cache_path))
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, prefix='.rules-cache-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(_cache_header(source_hash))
+            pickle.dump((rules, indexes), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def load_compiled_cache(cache_path: str, source_hash: str) -> Optional[Tuple[Tuple[ReplyRule, ...], Tuple]]:
+    """
+    映射并加载编译缓存文件，文件头与源文件哈希不一致时返回None
+    缓存文件使用pickle格式，只能放在可信目录中
+    :param cache_path: 缓存文件路径
+    :param source_hash: 源文件哈希
+    :return: (规则元组, 匹配索引) 或None
+    """
+    if not os.path.exists(cache_path):
+        return None
+    
+    try:
+        with open(cache_path, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                header = _cache_header(source_hash)
+                if mapped[:len(header)] != header:
+                    return None
+                view = memoryview(mapped)
+                try:
+                    return pickle.loads(view[len(header):])
+                finally:
+                    view.release()
+    except (OSError, ValueError, pickle.UnpicklingError, EOFError, AttributeError, ImportError) as e:
+        logger.warning(f"读取规则编译缓存失败: {cache_path}, 错误: {str(e)}")
+        return None
+
+def load_rules_file(manager, path: str, cache_path: Optional[str] = None) -> int:
+    """
+    从文件加载规则目录，替换规则管理器中的全部回复规则（函数规则保留）
+    :param manager: 规则管理器
+    :param path: 规则文件路径
+    :param cache_path: 编译缓存文件路径，默认为规则文件路径加 .cache 后缀，传空字符串禁用缓存
+    :return: 加载的规则数量
+    """
+    start = time.perf_counter()
+    if cache_path is None:
+        cache_path = path + '.cache'
+    
+    source_hash = file_sha256(path)
+    compiled = load_compiled_cache(cache_path, source_hash) if cache_path else None
+    from_cache = compiled is not None
+    
+    if compiled is None:
+        compiled = compile_rules(read_rule_specs(path))
+        if cache_path:
+            try:
+                save_compiled_cache(cache_path, source_hash, *compiled)
+            except OSError as e:
+                logger.warning(f"写入规则编译缓存失败: {cache_path}, 错误: {str(e)}")
+    
+    rules, indexes = compiled
+    manager.replace_rules(rules, indexes)
+    
+    elapsed = time.perf_counter() - start
+    source = "编译缓存" if from_cache else "规则文件"
+    logger.info(f"从{source}加载 {len(rules)} 条规则: {path}，耗时 {elapsed:.3f}秒")
+    return len(rules)
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+规则统计
+记录每条规则的命中次数、执行次数和耗时分布
+"""
+
+import threading
+import weakref
+from bisect import bisect_left
+from typing import Dict, Hashable, List, Optional, Tuple
+
+# 耗时直方图的桶上限（毫秒），最后一个桶收集超出上限的样本
+LATENCY_BUCKETS_MS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000)
+
+# 计数数组的布局：[执行次数, 命中次数, 累计耗时(秒), 各耗时桶...]
+_EVALUATIONS, _HITS, _TOTAL_SECONDS, _BUCKETS = 0, 1, 2, 3
+
+class _ShardHolder:
+    """线程本地的分片持有者，线程结束时被回收，触发分片的归档"""
+    
+    __slots__ = ('shard', '__weakref__')
+    
+    def __init__(self, shard: Dict[Hashable, List]):
+        self.shard = shard
+
+def _retire_shard(stats_ref: "weakref.ref[RuleStats]", shard: Dict[Hashable, List]):
+    """线程结束后把它的分片并入归档计数"""
+    stats = stats_ref()
+    if stats is not None:
+        stats._retire(shard)
+
+class RuleStats:
+    """
+    规则统计计数器
+    每个线程写自己的分片，写入时不加锁；读取时合并所有分片。
+    线程结束后分片并入归档计数，线程不断新建（如 Flask 每个请求一个线程）时分片数不会增长
+    """
+    
+    def __init__(self, buckets_ms: Tuple[float, ...] = LATENCY_BUCKETS_MS):
+        """
+        初始化统计计数器
+        :param buckets_ms: 耗时直方图的桶上限（毫秒）
+        """
+        self.buckets_ms = tuple(buckets_ms)
+        self._bounds = [bound / 1000.0 for bound in self.buckets_ms]
+        self._local = threading.local()
+        # 存活线程的分片，按分片的 id 索引
+        self._shards: Dict[int, Dict[Hashable, List]] = {}
+        # 已结束线程的计数
+        self._retired: Dict[Hashable, List] = {}
+        self._lock = threading.Lock()
+    
+    def _get_shard(self) -> Dict[Hashable, List]:
+        """
+        获取当前线程的计数分片
+        :return: {统计键: 计数数组}
+        """
+        try:
+            return self._local.holder.shard
+        except AttributeError:
+            shard = {}
+            holder = _ShardHolder(shard)
+            with self._lock:
+                self._shards[id(shard)] = shard
+            weakref.finalize(holder, _retire_shard, weakref.ref(self), shard)
+            self._local.holder = holder
+            return shard
+    
+    def _retire(self, shard: Dict[Hashable, List]):
+        """
+        分片所属的线程已结束，把分片并入归档计数
+        :param shard: 计数分片
+        """
+        with self._lock:
+            if self._shards.pop(id(shard), None) is None:
+                return
+            self._merge_into(self._retired, shard)
+    
+    @staticmethod
+    def _merge_into(merged: Dict[Hashable, List], shard: Dict[Hashable, List]):
+        """
+        把一个分片的计数累加到合并结果
+        :param merged: 合并结果
+        :param shard: 计数分片
+        """
+        for key, counters in dict(shard).items():
+            total = merged.get(key)
+            if total is None:
+                merged[key] = list(counters)
+            else:
+                for i, value in enumerate(counters):
+                    total[i] += value
+    
+    def _record(self, key: Hashable, evaluations: int, hits: int, seconds: Optional[float]):
+        """
+        写入一次统计
+        :param key: 统计键
+        :param evaluations: 执行次数增量
+        :param hits: 命中次数增量
+        :param seconds: 本次耗时（秒），None表示不记录耗时
+        """
+        shard = self._get_shard()
+        counters = shard.get(key)
+        if counters is None:
+            counters = [0, 0, 0.0] + [0] * (len(self._bounds) + 1)
+            shard[key] = counters
+        
+        counters[_EVALUATIONS] += evaluations
+        counters[_HITS] += hits
+        if seconds is not None:
+            counters[_TOTAL_SECONDS] += seconds
+            counters[_BUCKETS + bisect_left(self._bounds, seconds)] += 1
+    
+    def record_rule(self, name: str, evaluations: int = 1, hits: int = 0, seconds: Optional[float] = None):
+        """
+        记录规则的执行情况
+        :param name: 规则名称
+        :param evaluations: 执行次数增量
+        :param hits: 命中次数增量
+        :param seconds: 本次耗时（秒）
+        """
+        self._record(('rule', name), evaluations, hits, seconds)
+    
+    def record_tier(self, tier: str, seconds: float, hit: bool):
+        """
+        记录匹配层的执行情况
+        :param tier: 匹配层名称（exact/contains/regex）
+        :param seconds: 本次耗时（秒）
+        :param hit: 是否命中
+        """
+        self._record(('tier', tier), 1, 1 if hit else 0, seconds)
+    
+    def _merged(self) -> Dict[Hashable, List]:
+        """
+        合并所有线程的计数分片
+        :return: {统计键: 计数数组}
+        """
+        with self._lock:
+            shards = list(self._shards.values())
+            merged = {key: list(counters) for key, counters in self._retired.items()}
+        
+        for shard in shards:
+            self._merge_into(merged, shard)
+        return merged
+    
+    def _format(self, counters: List) -> Dict:
+        """
+        把计数数组转换为统计信息
+        :param counters: 计数数组
+        :return: 统计信息字典
+        """
+        labels = [f"<={bound}ms" for bound in self.buckets_ms] + [f">{self.buckets_ms[-1]}ms"]
+        timed = sum(counters[_BUCKETS:])
+        return {
+            'evaluations': counters[_EVALUATIONS],
+            'hits': counters[_HITS],
+            'total_time_ms': round(counters[_TOTAL_SECONDS] * 1000, 3),
+            'avg_time_ms': round(counters[_TOTAL_SECONDS] * 1000 / timed, 4) if timed else 0.0,
+            'latency_histogram': dict(zip(labels, counters[_BUCKETS:]))
+        }
+    
+    def snapshot(self) -> Dict[str, Dict[str, Dict]]:
+        """
+        获取统计快照
+        :return: {'rules': {规则名称: 统计}, 'tiers': {匹配层: 统计}}
+        """
+        result = {'rules': {}, 'tiers': {}}
+        for (kind, name), counters in self._merged().items():
+            result[kind + 's'][name] = self._format(counters)
+        return result
+    
+    def reset(self):
+        """清空所有统计"""
+        with self._lock:
+            for shard in self._shards.values():
+                shard.clear()
+            self._retired.clear()
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+规则文件热加载
+后台线程轮询规则文件的状态，文件变化后在后台编译新规则集并原子发布
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+from rule_loader import load_rules_file
+
+logger = logging.getLogger(__name__)
+
+class RuleFileWatcher:
+    """
+    规则文件监视器
+    编译和发布都在监视线程中完成，请求线程只会在某次查找开始时读到新快照，不会等待编译
+    """
+    
+    def __init__(self, manager, path: str, cache_path: Optional[str] = None, interval: float = 2.0):
+        """
+        初始化监视器
+        :param manager: 规则管理器
+        :param path: 规则文件路径
+        :param cache_path: 编译缓存文件路径，规则同 load_rules_file
+        :param interval: 轮询间隔（秒）
+        """
+        self.manager = manager
+        self.path = path
+        self.cache_path = cache_path
+        self.interval = interval
+        self._signature = self._stat_signature()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._status_lock = threading.Lock()
+        self.reload_count = 0
+        self.last_reload: Dict = {}
+    
+    def _stat_signature(self) -> Optional[Tuple[int, int, int]]:
+        """
+        获取文件状态签名，文件被替换或修改后签名变化
+        :return: (inode, 大小, 修改时间纳秒)，文件不存在时返回None
+        """
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_ino, st.st_size, st.st_mtime_ns
+    
+    def start(self):
+        """启动监视线程，并在fork出的子进程中自动重新启动"""
+        self._start_thread()
+        if hasattr(os, 'register_at_fork'):
+            # 线程不会被fork继承，gunicorn --preload 时需要在每个工作进程中重新启动
+            os.register_at_fork(after_in_child=self._restart_after_fork)
+    
+    def _start_thread(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='rule-file-watcher', daemon=True)
+        self._thread.start()
+        logger.info(f"开始监视规则文件: {self.path}，轮询间隔 {self.interval} 秒")
+    
+    def _restart_after_fork(self):
+        if self._thread is not None and not self._stop.is_set():
+            self._status_lock = threading.Lock()
+            self._start_thread()
+    
+    def stop(self, timeout: Optional[float] = None):
+        """
+        停止监视线程
+        :param timeout: 等待线程退出的时间
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+    
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.check()
+    
+    def check(self) -> bool:
+        """
+        检查规则文件是否变化，变化时重新加载
+        :return: 是否执行了重新加载
+        """
+        signature = self._stat_signature()
+        if signature is None or signature == self._signature:
+            return False
+        
+        # 无论加载是否成功都记录签名，文件损坏时等待下一次修改，而不是每次轮询都重试
+        self._signature = signature
+        self.reload()
+        return True
+    
+    def reload(self):
+        """编译并发布规则文件中的规则，失败时保留当前规则集"""
+        start = time.perf_counter()
+        try:
+            rule_count = load_rules_file(self.manager, self.path, self.cache_path)
+        except Exception as e:
+            logger.error(f"热加载规则文件失败，继续使用当前规则: {self.path}, 错误: {str(e)}")
+            with self._status_lock:
+                self.last_reload = {
+                    'time': time.time(),
+                    'success': False,
+                    'error': str(e)
+                }
+            return
+        
+        duration_ms = round((time.perf_counter() - start) * 1000, 3)
+        with self._status_lock:
+            self.reload_count += 1
+            self.last_reload = {
+                'time': time.time(),
+                'success': True,
+                'duration_ms': duration_ms,
+                'rule_count': rule_count,
+                'version': self.manager.version
+            }
+        logger.info(f"热加载规则文件完成: {rule_count} 条规则，耗时 {duration_ms} 毫秒，版本 {self.manager.version}")
+    
+    def get_status(self) -> Dict:
+        """
+        获取热加载状态
+        :return: 状态字典
+        """
+        with self._status_lock:
+            return {
+                'path': self.path,
+                'interval': self.interval,
+                'running': self._thread is not None and self._thread.is_alive(),
+                'reload_count': self.reload_count,
+                'last_reload': dict(self.last_reload)
+            }
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+用户会话状态存储
+按 FromUserName（OpenID）记录多轮对话所处的状态，支持过期时间、LRU淘汰和内存上限，
+供状态规则（state）在多轮流程中读取和切换状态
+"""
+
+import math
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Set
+
+# 单个会话除OpenID字符串外的内存占用（字节，按 tracemalloc 实测）：
+# 会话对象、LRU链表节点、哈希表项、时间轮中的集合项和驻留字符串表项
+SESSION_ENTRY_OVERHEAD = 288
+
+class Session:
+    """会话条目，只保存状态和所在的时间轮槽位"""
+
+    __slots__ = ('state', 'slot')
+
+    def __init__(self, state: str, slot: int):
+        self.state = state
+        self.slot = slot
+
+class SessionStore:
+    """
+    有界会话状态存储
+    会话按最近使用顺序排列，超出条数或内存上限时淘汰最久未使用的会话；
+    过期由时间轮处理：每个槽位是一个时间刻度内到期的会话集合，时间前进时整槽清除，
+    过期和续期都是 O(1)，不需要扫描全部会话
+    """
+
+    def __init__(self, ttl: float = 300.0, max_sessions: int = 1000000, max_bytes: int = 256 * 1024 * 1024,
+                 resolution: float = 1.0, clock: Callable[[], float] = time.monotonic):
+        """
+        初始化会话存储
+        :param ttl: 会话的默认（也是最长）有效期（秒），写入状态时续期
+        :param max_sessions: 最大会话数
+        :param max_bytes: 会话占用内存的上限（字节，按估算值计算）
+        :param resolution: 时间轮的刻度（秒），即过期时间的精度
+        :param clock: 单调时钟，测试时可以替换
+        """
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.resolution = resolution
+        self._clock = clock
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        # 槽位数覆盖最长有效期加一个刻度，会话到期前时间轮不会转回它所在的槽位
+        self._wheel: List[Set[str]] = [set() for _ in range(int(math.ceil(ttl / resolution)) + 1)]
+        self._tick = self._current_tick()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.expirations = 0
+        self.evictions = 0
+
+    def _current_tick(self) -> int:
+        return int(self._clock() / self.resolution)
+
+    def _advance(self):
+        """时间前进到当前刻度，清除途经槽位中的会话"""
+        tick = self._current_tick()
+        steps = min(tick - self._tick, len(self._wheel))
+        for offset in range(1, steps + 1):
+            slot = self._wheel[(self._tick + offset) % len(self._wheel)]
+            for user_id in slot:
+                del self._sessions[user_id]
+                self._bytes -= sys.getsizeof(user_id) + SESSION_ENTRY_OVERHEAD
+            self.expirations += len(slot)
+            slot.clear()
+        if tick > self._tick:
+            self._tick = tick
+
+    def _discard(self, user_id: str):
+        session = self._sessions.pop(user_id)
+        self._wheel[session.slot].discard(user_id)
+        self._bytes -= sys.getsizeof(user_id) + SESSION_ENTRY_OVERHEAD
+
+    def get_state(self, user_id: str) -> Optional[str]:
+        """
+        查询用户当前的状态，不续期
+        :param user_id: 用户OpenID
+        :return: 状态，没有会话或已过期时返回None
+        """
+        with self._lock:
+            self._advance()
+            session = self._sessions.get(user_id)
+            if session is None:
+                return None
+            self._sessions.move_to_end(user_id)
+            return session.state
+
+    def set_state(self, user_id: str, state: Optional[str], ttl: Optional[float] = None):
+        """
+        设置用户的状态并续期
+        :param user_id: 用户OpenID
+        :param state: 新状态，为None或空字符串时结束会话
+        :param ttl: 本次的有效期（秒），默认且最长为存储的有效期
+        """
+        if not state:
+            self.clear_state(user_id)
+            return
+
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        # 状态名数量很少，驻留后所有会话共用同一个字符串；OpenID驻留后与请求中的字符串共用
+        state = sys.intern(state)
+        user_id = sys.intern(user_id)
+        with self._lock:
+            self._advance()
+            # 到期刻度按当前刻度的起点向后取整，会话最多晚一个刻度过期，不会提前过期
+            slot = (self._tick + int(math.ceil(ttl / self.resolution)) + 1) % len(self._wheel)
+            session = self._sessions.get(user_id)
+            if session is None:
+                self._sessions[user_id] = Session(state, slot)
+                self._bytes += sys.getsizeof(user_id) + SESSION_ENTRY_OVERHEAD
+            else:
+                self._wheel[session.slot].discard(user_id)
+                session.state = state
+                session.slot = slot
+                self._sessions.move_to_end(user_id)
+            self._wheel[slot].add(user_id)
+
+            while self._sessions and (len(self._sessions) > self.max_sessions or self._bytes > self.max_bytes):
+                self._discard(next(iter(self._sessions)))
+                self.evictions += 1
+
+    def clear_state(self, user_id: str) -> bool:
+        """
+        结束用户的会话
+        :param user_id: 用户OpenID
+        :return: 会话是否存在
+        """
+        with self._lock:
+            if user_id not in self._sessions:
+                return False
+            self._discard(user_id)
+            return True
+
+    def expire(self) -> int:
+        """
+        立即清除已过期的会话（读写时也会顺带清除）
+        :return: 当前会话数
+        """
+        with self._lock:
+            self._advance()
+            return len(self._sessions)
+
+    def clear(self):
+        """清空全部会话，保留统计计数"""
+        with self._lock:
+            self._sessions.clear()
+            for slot in self._wheel:
+                slot.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict:
+        """
+        获取会话统计信息
+        :return: 统计信息字典
+        """
+        with self._lock:
+            self._advance()
+            return {
+                'size': len(self._sessions),
+                'max_sessions': self.max_sessions,
+                'memory_bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                'expirations': self.expirations,
+                'evictions': self.evictions
+            }
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, user_id: str) -> bool:
+        return self.get_state(user_id) is not None
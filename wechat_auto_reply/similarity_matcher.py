@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+相似问题匹配器
+把标准问题编译为字符 n-gram TF-IDF 矩阵，按余弦相似度匹配用户的改写和错别字，
+可作为函数规则注册到回复规则管理器
+"""
+
+import logging
+import math
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from faq_engine import read_faq_file
+from text_normalizer import normalize_message
+
+try:
+    import numpy as np
+except ImportError:  # 未安装 numpy 时不能使用相似问题匹配
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# 切分 n-gram 时的分隔字符：空白、标点和符号
+_SEPARATOR_RE = re.compile(r'[\W_]+')
+# 批量匹配时一块得分矩阵 (查询数 x 问题数) 的最大单元数，float64 下约256KB，保持在CPU缓存内
+_BATCH_SCORE_CELLS = 32768
+# 每块少于该条数时逐条匹配更快
+_MIN_BATCH_ROWS = 8
+
+def char_ngrams(text: str, ngram_range: Tuple[int, int] = (1, 2)) -> List[str]:
+    """
+    把文本切分为字符 n-gram，标点和空白处断开
+    :param text: 已规范化的文本
+    :param ngram_range: (最小长度, 最大长度)
+    :return: n-gram 列表（含重复）
+    """
+    low, high = ngram_range
+    grams = []
+    for piece in _SEPARATOR_RE.split(text):
+        for n in range(low, min(high, len(piece)) + 1):
+            grams.extend(piece[i:i + n] for i in range(len(piece) - n + 1))
+    return grams
+
+class SimilarityMatcher:
+    """
+    基于 TF-IDF 余弦相似度的相似问题匹配器
+    文档矩阵按列压缩存储（每个 n-gram 对应一段问题序号和权重），
+    单条查询把命中列的权重用 bincount 一次累加成全部问题的得分；
+    批量查询把一块查询命中的列段一起展开，用一次 bincount 算出整块得分
+    """
+
+    def __init__(self, entries: Iterable[Tuple[str, str]], threshold: float = 0.6,
+                 ngram_range: Tuple[int, int] = (1, 2)):
+        """
+        编译 TF-IDF 矩阵
+        :param entries: (标准问题, 回复) 序列
+        :param threshold: 最低余弦相似度，低于该值不回复
+        :param ngram_range: n-gram 长度范围
+        """
+        if np is None:
+            raise ImportError("相似问题匹配需要安装 numpy: pip install numpy")
+
+        entries = list(entries)
+        self.questions = [question for question, _ in entries]
+        self.replies = [reply for _, reply in entries]
+        self.threshold = threshold
+        self.ngram_range = ngram_range
+
+        doc_terms = [Counter(self._ngrams(question)) for question in self.questions]
+        document_frequency = Counter()
+        for terms in doc_terms:
+            document_frequency.update(terms.keys())
+
+        count = len(doc_terms)
+        self._vocabulary: Dict[str, int] = {term: col for col, term in enumerate(sorted(document_frequency))}
+        self._idf = np.array(
+            [self._smooth_idf(document_frequency[term]) for term in sorted(document_frequency)],
+            dtype=np.float64
+        )
+        # 查询中未出现在问题里的 n-gram 仍计入查询向量的长度，降低相似度
+        self._unseen_idf = self._smooth_idf(0)
+
+        # 先按行收集 L2 归一化的权重，再转为按列压缩的存储
+        rows, cols, values = [], [], []
+        for doc_id, terms in enumerate(doc_terms):
+            weights = {self._vocabulary[term]: tf * self._idf[self._vocabulary[term]] for term, tf in terms.items()}
+            norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+            for col, weight in weights.items():
+                rows.append(doc_id)
+                cols.append(col)
+                values.append(weight / norm)
+
+        rows = np.array(rows, dtype=np.int32)
+        cols = np.array(cols, dtype=np.int32)
+        values = np.array(values, dtype=np.float32)
+        order = np.argsort(cols, kind='stable')
+        self._row_index = rows[order]
+        self._values = values[order]
+        self._col_ptr = np.zeros(len(self._vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(cols, minlength=len(self._vocabulary)), out=self._col_ptr[1:])
+
+        logger.info(f"相似问题矩阵编译完成: {count} 个问题, {len(self._vocabulary)} 个n-gram")
+
+    def _smooth_idf(self, df: int) -> float:
+        """
+        平滑的逆文档频率
+        :param df: 文档频率
+        :return: IDF值
+        """
+        return math.log((1 + len(self.questions)) / (1 + df)) + 1
+
+    def _ngrams(self, text: str) -> List[str]:
+        return char_ngrams(normalize_message(text).folded, self.ngram_range)
+
+    def _query_vector(self, query: str) -> Tuple[List[int], List[float]]:
+        """
+        计算 L2 归一化的查询向量
+        :param query: 用户输入
+        :return: (已知 n-gram 的列号, 对应权重)
+        """
+        cols, weights = [], []
+        norm = 0.0
+        for term, tf in Counter(self._ngrams(query)).items():
+            col = self._vocabulary.get(term)
+            weight = tf * (self._idf[col] if col is not None else self._unseen_idf)
+            norm += weight * weight
+            if col is not None:
+                cols.append(col)
+                weights.append(weight)
+        if not norm:
+            return [], []
+        norm = math.sqrt(norm)
+        return cols, [weight / norm for weight in weights]
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs) -> 'SimilarityMatcher':
+        """
+        从问答库文件加载，格式与FAQ检索相同
+        :param path: 文件路径
+        :return: 相似问题匹配器
+        """
+        return cls(read_faq_file(path), **kwargs)
+
+    def match(self, query: str) -> Optional[Tuple[int, float]]:
+        """
+        查找最相似的标准问题
+        :param query: 用户输入
+        :return: (问题序号, 余弦相似度)，低于阈值返回None
+        """
+        cols, weights = self._query_vector(query)
+        if not cols:
+            return None
+
+        col_ptr = self._col_ptr
+        segments = [slice(col_ptr[col], col_ptr[col + 1]) for col in cols]
+        index = np.concatenate([self._row_index[s] for s in segments])
+        data = np.concatenate([self._values[s] * weight for s, weight in zip(segments, weights)])
+        scores = np.bincount(index, weights=data, minlength=len(self.questions))
+
+        best = int(scores.argmax())
+        score = float(scores[best])
+        if score < self.threshold:
+            return None
+        return best, score
+
+    def match_batch(self, queries: Sequence[str], chunk_size: int = 64) -> List[Optional[Tuple[int, float]]]:
+        """
+        批量查找最相似的标准问题，用于离线评估
+        每块查询命中的所有列一次取出，按 (查询, 问题) 用一次 bincount 稀疏累加，不展开稠密的文档矩阵。
+        得分矩阵超出CPU缓存后散列写入变慢，每块的行数按 _BATCH_SCORE_CELLS 收紧；
+        问题库大到每块不足 _MIN_BATCH_ROWS 条查询时批量累加没有收益，逐条调用 match()
+        :param queries: 用户输入列表
+        :param chunk_size: 每块最多的查询条数
+        :return: 与输入一一对应的 (问题序号, 余弦相似度) 或None
+        """
+        results: List[Optional[Tuple[int, float]]] = []
+        count = len(self.questions)
+        chunk_size = min(chunk_size, _BATCH_SCORE_CELLS // max(count, 1))
+        if chunk_size < _MIN_BATCH_ROWS:
+            return [self.match(query) for query in queries]
+        for start in range(0, len(queries), chunk_size):
+            vectors = [self._query_vector(query) for query in queries[start:start + chunk_size]]
+            cols = np.array([col for cols, _ in vectors for col in cols], dtype=np.int64)
+            if not len(cols) or not count:
+                results.extend(None for _ in vectors)
+                continue
+            weights = np.array([weight for _, weights in vectors for weight in weights], dtype=np.float32)
+            query_of_col = np.repeat(np.arange(len(vectors)), [len(cols) for cols, _ in vectors])
+
+            # 展开每个 (查询, 列) 对应的列段，得到逐项的问题序号和乘积
+            starts = self._col_ptr[cols]
+            lengths = self._col_ptr[cols + 1] - starts
+            ends = np.cumsum(lengths)
+            positions = np.arange(int(ends[-1])) + np.repeat(starts - (ends - lengths), lengths)
+            slots = np.repeat(query_of_col * count, lengths) + self._row_index[positions]
+            data = self._values[positions] * np.repeat(weights, lengths)
+            scores = np.bincount(slots, weights=data, minlength=len(vectors) * count).reshape(len(vectors), count)
+
+            best = scores.argmax(axis=1)
+            best_scores = scores[np.arange(len(vectors)), best]
+            for doc_id, score in zip(best.tolist(), best_scores.tolist()):
+                results.append((doc_id, score) if score >= self.threshold else None)
+
+        return results
+
+    def answer(self, user_content: str) -> Optional[str]:
+        """
+        函数规则处理函数：返回最相似问题的回复
+        :param user_content: 用户输入
+        :return: 回复内容或None
+        """
+        result = self.match(user_content)
+        if result is None:
+            return None
+        return self.replies[result[0]]
+
+    def answer_batch(self, queries: Sequence[str], chunk_size: int = 64) -> List[Optional[str]]:
+        """
+        批量返回回复内容
+        :param queries: 用户输入列表
+        :param chunk_size: 每块的查询条数
+        :return: 与输入一一对应的回复内容或None
+        """
+        return [None if result is None else self.replies[result[0]]
+                for result in self.match_batch(queries, chunk_size)]
+
+    def register(self, manager, name: str = '相似问题匹配'):
+        """
+        注册为函数规则，在请求线程内直接执行
+        :param manager: 回复规则管理器
+        :param name: 函数规则名称
+        """
+        manager.register_function_rule(name, self.answer, inline=True)
+
+    def get_info(self) -> Dict:
+        """
+        获取矩阵概况
+        :return: 问题数、n-gram 数和非零元素数
+        """
+        return {
+            'entries': len(self.questions),
+            'ngrams': len(self._vocabulary),
+            'nonzeros': int(len(self._values)),
+            'threshold': self.threshold
+        }
+
+    def __len__(self):
+        return len(self.questions)
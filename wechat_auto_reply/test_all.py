@@ -42,7 +42,7 @@ def check_dependencies():
     """检查依赖包是否安装"""
     print("=== 检查依赖包 ===")
     
-    required_packages = ['flask', 'werkzeug']
+    required_packages = ['flask', 'werkzeug', 'numpy', 'cryptography']
     missing_packages = []
     
     for package in required_packages:
@@ -70,6 +70,7 @@ def check_file_structure():
         'reply_rules.py',
         'logger_config.py',
         'config.py',
+        'intents.json',
         'requirements.txt',
         'README.md'
     ]
@@ -97,6 +98,24 @@ def run_unit_tests():
         ('签名验证测试', 'test_verification.py'),
         ('XML解析测试', 'test_xml_parser.py'),
         ('回复规则测试', 'test_reply_rules.py'),
+        ('规则匹配索引测试', 'test_matchers.py'),
+        ('回复缓存测试', 'test_reply_cache.py'),
+        ('意图表测试', 'test_intents.py'),
+        ('函数规则执行器测试', 'test_function_executor.py'),
+        ('规则统计测试', 'test_rule_stats.py'),
+        ('规则文件加载测试', 'test_rule_loader.py'),
+        ('规则热加载测试', 'test_rule_watcher.py'),
+        ('文本规范化测试', 'test_text_normalizer.py'),
+        ('规则离线评估测试', 'test_evaluate_rules.py'),
+        ('FAQ检索测试', 'test_faq_engine.py'),
+        ('会话状态测试', 'test_session_store.py'),
+        ('回复模板测试', 'test_reply_template.py'),
+        ('回复构造测试', 'test_reply_builder.py'),
+        ('消息幂等处理测试', 'test_idempotency.py'),
+        ('异步回复测试', 'test_async_reply.py'),
+        ('消息分发测试', 'test_message_router.py'),
+        ('安全模式加解密测试', 'test_wechat_crypto.py'),
+        ('相似问题匹配测试', 'test_similarity_matcher.py'),
         ('异常处理测试', 'test_exception_handling.py')
     ]
     
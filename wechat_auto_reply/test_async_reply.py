@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+异步回复测试脚本
+用本地HTTP服务模拟客服消息接口，测试截止时间、客服消息投递、队列反压和处理器的异步回复模式
+"""
+
+import json
+import os
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from flask import Flask, request
+from async_reply import AsyncReplyQueue, DeliveryError, HTTPCustomerServiceSender
+from idempotency import MemoryIdempotencyStore
+from wechat_handler import WeChatHandler
+import xml_samples
+
+class CustomerServiceStub:
+    """本地客服消息接口，记录收到的消息"""
+
+    def __init__(self, errcode: int = 0):
+        self.messages = []
+        self.received = threading.Event()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                stub.messages.append((query.get('access_token', [''])[0], body))
+                stub.received.set()
+                payload = json.dumps({'errcode': errcode, 'errmsg': 'ok' if errcode == 0 else 'invalid'}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/cgi-bin/message/custom/send"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+def test_sender():
+    """测试客服消息发送"""
+    print("=== 客服消息发送测试 ===")
+
+    stub = CustomerServiceStub()
+    try:
+        HTTPCustomerServiceSender(lambda: 'TOKEN', stub.url).send_text('oUser', '你好+1')
+        token, body = stub.messages[0]
+        assert token == 'TOKEN', "应该携带调用凭证"
+        assert body == {'touser': 'oUser', 'msgtype': 'text', 'text': {'content': '你好+1'}}, f"消息格式不正确: {body}"
+    finally:
+        stub.close()
+
+    stub = CustomerServiceStub(errcode=40001)
+    try:
+        HTTPCustomerServiceSender('BAD', stub.url).send_text('oUser', 'x')
+        raise AssertionError("接口返回错误时应该抛出异常")
+    except DeliveryError:
+        pass
+    finally:
+        stub.close()
+
+    print("✅ 客服消息发送测试通过！")
+
+def test_deadline_and_delivery():
+    """测试按时回复和超时后的客服消息投递"""
+    print("\n=== 截止时间和投递测试 ===")
+
+    stub = CustomerServiceStub()
+    replies = AsyncReplyQueue(HTTPCustomerServiceSender('TOKEN', stub.url), workers=2, max_pending=8)
+    try:
+        assert replies.run(lambda: '快速回复', 'oFast', timeout=1.0) == (True, '快速回复'), "按时完成应该被动回复"
+
+        def slow():
+            time.sleep(0.2)
+            return '慢速回复'
+
+        assert replies.run(slow, 'oSlow', timeout=0.02) == (False, None), "超过截止时间应该立即返回"
+        assert stub.received.wait(2.0), "超时的回复应该通过客服消息发送"
+        assert stub.messages[0][1]['touser'] == 'oSlow' and stub.messages[0][1]['text']['content'] == '慢速回复'
+
+        # 超时后生成失败或没有回复时不发送
+        assert replies.run(lambda: time.sleep(0.05), 'oNone', timeout=0.01) == (False, None)
+        time.sleep(0.1)
+        stats = replies.stats()
+        assert (stats['on_time'], stats['deferred'], stats['delivered']) == (1, 2, 1), f"统计不正确: {stats}"
+        assert stats['delivery_latency']['max'] >= 0.2, "投递延迟应该从收到消息起计算"
+    finally:
+        replies.shutdown()
+        stub.close()
+
+    print("✅ 截止时间和投递测试通过！")
+
+def test_backpressure():
+    """测试队列满时丢弃新任务，不在请求线程中生成"""
+    print("\n=== 队列反压测试 ===")
+
+    class RecordingSender:
+        def __init__(self):
+            self.messages = []
+
+        def send_text(self, to_user, content):
+            self.messages.append((to_user, content))
+
+    sender = RecordingSender()
+    replies = AsyncReplyQueue(sender, workers=1, max_pending=1)
+    release = threading.Event()
+    try:
+        # 第一个任务占住唯一的工作线程，第二个任务占满队列
+        assert replies.run(lambda: release.wait() and '一', 'u1', timeout=0.01) == (False, None)
+        assert replies.run(lambda: '二', 'u2', timeout=0.01) == (False, None)
+        assert replies.stats()['queue_depth'] == 1, "队列中应该有一个等待的任务"
+        called = []
+        start = time.monotonic()
+        assert replies.run(lambda: called.append(1) or '三', 'u3', timeout=5) == (False, None), "队列满时应该丢弃任务"
+        assert time.monotonic() - start < 1, "队列满时应该立即返回，不等待截止时间"
+        assert not called, "队列满时不应该在请求线程中生成回复"
+        assert replies.stats()['dropped'] == 1
+
+        release.set()
+        replies.shutdown()
+        assert sorted(sender.messages) == [('u1', '一'), ('u2', '二')], f"排队的任务应该全部发送: {sender.messages}"
+    finally:
+        release.set()
+
+    print("✅ 队列反压测试通过！")
+
+def test_workers_after_fork():
+    """测试 fork 出的子进程（gunicorn --preload）中任务仍然被处理"""
+    print("\n=== fork 后的工作线程测试 ===")
+
+    if not hasattr(os, 'fork'):
+        print("当前平台不支持 fork，跳过")
+        return
+
+    replies = AsyncReplyQueue(None, workers=1)
+    assert replies._pid is None, "创建时不应启动工作线程"
+    try:
+        # 父进程中已经启动了工作线程，fork 之前和之后两种情况都要覆盖
+        for started_in_parent in (False, True):
+            if started_in_parent:
+                assert replies.run(lambda: '父进程', 'u', timeout=1.0) == (True, '父进程')
+            pid = os.fork()
+            if pid == 0:
+                code = 1
+                try:
+                    if replies.run(lambda: '子进程', 'u', timeout=2.0) == (True, '子进程'):
+                        code = 0
+                    replies.shutdown()
+                finally:
+                    os._exit(code)
+            _, status = os.waitpid(pid, 0)
+            assert os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0, \
+                f"子进程中的任务应该被处理（fork 前{'已' if started_in_parent else '未'}启动工作线程）"
+    finally:
+        replies.shutdown()
+
+    print("✅ fork 后的工作线程测试通过！")
+
+def test_handler_async_mode():
+    """测试处理器的异步回复模式"""
+    print("\n=== 处理器异步回复测试 ===")
+
+    stub = CustomerServiceStub()
+    replies = AsyncReplyQueue(HTTPCustomerServiceSender('TOKEN', stub.url), workers=1)
+    handler = WeChatHandler("test_token", idempotency=MemoryIdempotencyStore(), async_replies=replies)
+    handler.reply_deadline = 0.05
+    generate_reply = handler._generate_reply
+
+    def slow_generate(user_content, user_id=None):
+        time.sleep(0.2)
+        return generate_reply(user_content, user_id)
+
+    app = Flask(__name__)
+    payload = xml_samples.TEXT_MESSAGE_SAMPLE.encode('utf-8')
+    try:
+        with app.test_request_context('/wechat', method='POST', data=payload):
+            start = time.perf_counter()
+            handler._generate_reply = slow_generate
+            response = handler.handle_message(request)
+            assert response.get_data() == b'success', "超过截止时间应该先回复 success"
+            assert time.perf_counter() - start < 0.2, "不应该等待回复生成完成"
+
+        assert stub.received.wait(2.0), "回复应该通过客服消息发送"
+        assert stub.messages[0][1]['touser'] == 'oUser123456789' and stub.messages[0][1]['text']['content'] == '你好+1'
+
+        # 微信的重试不会再次生成或发送回复
+        with app.test_request_context('/wechat', method='POST', data=payload):
+            assert handler.handle_message(request).get_data() == b'success'
+        time.sleep(0.3)
+        assert len(stub.messages) == 1, "重试不应该重复发送客服消息"
+
+        # 按时完成时仍然被动回复
+        handler._generate_reply = generate_reply
+        with app.test_request_context('/wechat', method='POST', data=payload.replace(b'1234567890123456', b'2')):
+            assert '你好+1'.encode('utf-8') in handler.handle_message(request).get_data(), "按时完成应该被动回复"
+    finally:
+        replies.shutdown()
+        stub.close()
+
+    print("✅ 处理器异步回复测试通过！")
+
+if __name__ == "__main__":
+    try:
+        test_sender()
+        test_deadline_and_delivery()
+        test_backpressure()
+        test_workers_after_fork()
+        test_handler_async_mode()
+
+        print("\n🎉 所有异步回复测试通过！")
+    except Exception as e:
+        print(f"\n❌ 测试失败: {str(e)}")
+        import traceback
+        traceback.print_exc()
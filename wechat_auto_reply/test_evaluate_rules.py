@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+规则离线评估测试脚本
+用于测试 JSONL 消息的批量匹配和覆盖率报告
+"""
+
+import io
+import json
+import os
+import tempfile
+from evaluate_rules import evaluate, main
+from reply_rules import ReplyRuleManager, reply_manager
+
+def _jsonl(*records):
+    return '\n'.join(json.dumps(record, ensure_ascii=False) for record in records) + '\n'
+
+def test_coverage_report():
+    """测试覆盖率报告统计"""
+    print("=== 覆盖率报告测试 ===")
+
+    manager = ReplyRuleManager()
+    manager.clear_rules()
+    manager.add_rule("问候", "你好", "您好！", "exact")
+    manager.add_rule("订单", "订单", "订单回复", "contains")
+    manager.add_rule("未使用", "从来不会出现", "无", "exact")
+
+    stream = io.StringIO(_jsonl({"content": "你好"}, {"content": "查询订单"}, "我的订单呢",
+                                {"content": "无关内容"}, {"content": "无关内容"}, {"other": "缺少字段"})
+                         + "不是JSON\n")
+    output = io.StringIO()
+
+    report = evaluate(manager, stream, processes=1, output=output)
+
+    assert report['total'] == 5, f"消息总数不正确: {report['total']}"
+    assert report['matched'] == 3 and report['unmatched'] == 2, "命中统计不正确"
+    assert report['coverage'] == 0.6, f"覆盖率不正确: {report['coverage']}"
+    assert report['invalid_lines'] == 2, "无效行应该被跳过并计数"
+    assert report['rule_hits'] == {"订单": 2, "问候": 1}, f"规则命中统计不正确: {report['rule_hits']}"
+    assert report['unused_rules'] == ["未使用"], f"未使用规则不正确: {report['unused_rules']}"
+    assert report['top_unmatched'] == [{"content": "无关内容", "count": 2}], "高频未命中消息不正确"
+
+    results = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert [r['rule'] for r in results] == ["问候", "订单", "订单", None, None], "逐条结果顺序不正确"
+    assert results[1]['content'] == "查询订单", "逐条结果应该与输入消息对应"
+
+    print("✅ 覆盖率报告测试通过！")
+
+def test_command_line():
+    """测试命令行入口"""
+    print("\n=== 命令行测试 ===")
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        messages_path = os.path.join(tmpdir, "messages.jsonl")
+        rules_path = os.path.join(tmpdir, "rules.json")
+        report_path = os.path.join(tmpdir, "report.json")
+
+        with open(messages_path, 'w', encoding='utf-8') as f:
+            for i in range(100):
+                f.write(json.dumps({"text": f"第{i}个订单"} if i % 2 else {"text": "随便聊聊"},
+                                   ensure_ascii=False) + '\n')
+        with open(rules_path, 'w', encoding='utf-8') as f:
+            json.dump([{"name": "订单", "pattern": "订单", "reply": "订单回复", "type": "contains"}],
+                      f, ensure_ascii=False)
+
+        try:
+            main([messages_path, '--rules', rules_path, '--field', 'text',
+                  '--report', report_path, '--processes', '2', '--chunksize', '8'])
+        finally:
+            # 命令行会替换全局规则管理器的规则，测试结束后恢复
+            reply_manager.reload_default_rules()
+
+        with open(report_path, 'r', encoding='utf-8') as f:
+            report = json.load(f)
+
+    assert report['total'] == 100, "命令行评估的消息总数不正确"
+    assert report['rule_hits'].get("订单") == 50, f"规则命中统计不正确: {report['rule_hits']}"
+
+    print(f"✅ 命令行测试通过！覆盖率 {report['coverage']:.0%}")
+
+if __name__ == "__main__":
+    try:
+        test_coverage_report()
+        test_command_line()
+
+        print("\n🎉 所有规则离线评估测试通过！")
+    except Exception as e:
+        print(f"\n❌ 测试失败: {str(e)}")
+        import traceback
+        traceback.print_exc()
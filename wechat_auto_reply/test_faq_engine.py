@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+FAQ 检索引擎测试脚本
+用于测试二元组切分、BM25 检索、剪枝结果的正确性和函数规则注册
+"""
+
+from faq_engine import FAQEngine, char_bigrams
+from reply_rules import ReplyRuleManager
+from benchmark_faq import generate_faq, generate_queries
+
+FAQ = [
+    ("如何修改密码", "请在 设置-账号安全 中修改密码"),
+    ("怎么申请退款", "在订单详情页点击申请退款"),
+    ("发票怎么开", "请联系客服开具发票"),
+    ("运费是多少", "满99元包邮"),
+    ("如何修改收货地址", "在地址管理中修改收货地址"),
+]
+
+def test_char_bigrams():
+    """测试字符二元组切分"""
+    print("=== 二元组切分测试 ===")
+
+    assert char_bigrams("修改密码") == ["修改", "改密", "密码"], "中文应该按相邻字符切分"
+    assert char_bigrams("密码，好") == ["密码", "好"], "标点处应该断开，单字片段保留"
+    assert char_bigrams("") == [], "空文本没有二元组"
+
+    print("✅ 二元组切分测试通过！")
+
+def test_faq_search():
+    """测试检索与置信度阈值"""
+    print("\n=== FAQ检索测试 ===")
+
+    engine = FAQEngine(FAQ)
+
+    assert engine.answer("修改密码怎么弄") == FAQ[0][1], "改写的问题应该命中"
+    assert engine.answer("怎么修改收货地址呢") == FAQ[4][1], "应该命中最相近的问题"
+    assert engine.answer("运费多少？！") == FAQ[3][1], "标点不应影响检索"
+    assert engine.answer("今天天气怎么样") is None, "置信度不足时不应回复"
+
+    hits = engine.search("修改", top_k=5, min_confidence=0)
+    assert len(hits) == 2, f"应该返回全部包含“修改”的问题: {hits}"
+    assert hits[0].score >= hits[1].score, "结果应该按得分从高到低排列"
+    assert hits[0].entry.question == "如何修改密码", "较短的问题得分应该更高"
+
+    assert FAQEngine([]).search("密码") == [], "空问答库不应报错"
+
+    print("✅ FAQ检索测试通过！")
+
+def test_pruning_matches_exhaustive():
+    """测试剪枝后的结果与穷举打分一致"""
+    print("\n=== 剪枝正确性测试 ===")
+
+    entries = generate_faq(2000)
+    engine = FAQEngine(entries)
+    queries = generate_queries(entries, 300)
+
+    for query in queries:
+        terms = {}
+        for term in char_bigrams(query):
+            terms[term] = terms.get(term, 0) + 1
+        ideal = sum(qtf * engine._idf_of.get(term, engine._unseen_idf) for term, qtf in terms.items())
+
+        # 穷举：累加所有倒排项
+        scores = {}
+        for term, qtf in terms.items():
+            for doc_id, impact in engine._postings.get(term, {}).items():
+                scores[doc_id] = scores.get(doc_id, 0.0) + qtf * impact
+
+        for top_k in (1, 3):
+            expected = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:top_k]
+            expected = [score for _, score in expected if score >= engine.min_confidence * ideal]
+            actual = [hit.score for hit in engine.search(query, top_k=top_k)]
+            assert len(actual) == len(expected), f"查询 {query!r} 的结果数量不一致"
+            for a, e in zip(actual, expected):
+                assert abs(a - e) < 1e-9, f"查询 {query!r} 的得分不一致: {a} != {e}"
+
+    print(f"✅ {len(queries)} 条查询的剪枝结果与穷举一致")
+
+def test_register_function_rule():
+    """测试注册为函数规则"""
+    print("\n=== 函数规则注册测试 ===")
+
+    manager = ReplyRuleManager()
+    manager.clear_rules()
+    FAQEngine(FAQ).register(manager)
+
+    assert "FAQ检索" in manager.function_rules, "应该注册为函数规则"
+    match = manager.find_match("退款怎么申请")
+    assert match.rule_name == "FAQ检索" and match.reply == FAQ[1][1], f"应该通过函数规则回复: {match}"
+    assert manager.find_reply("今天天气怎么样") is None, "置信度不足时应该不回复"
+
+    print("✅ 函数规则注册测试通过！")
+
+if __name__ == "__main__":
+    try:
+        test_char_bigrams()
+        test_faq_search()
+        test_pruning_matches_exhaustive()
+        test_register_function_rule()
+
+        print("\n🎉 所有FAQ检索测试通过！")
+    except Exception as e:
+        print(f"\n❌ 测试失败: {str(e)}")
+        import traceback
+        traceback.print_exc()
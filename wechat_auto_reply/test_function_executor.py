@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+函数规则执行器测试脚本
+用于测试超时回退、熔断和线程池容量限制
+"""
+
+import threading
+import time
+from function_executor import CircuitBreaker, FunctionRuleExecutor
+from reply_rules import ReplyRuleManager
+
+def test_timeout_falls_through():
+    """测试超时的函数规则回退到下一条规则"""
+    print("=== 函数规则超时测试 ===")
+    
+    executor = FunctionRuleExecutor(max_workers=2, timeout=0.05, budget=1.0)
+    manager = ReplyRuleManager(function_executor=executor)
+    manager.clear_rules()
+    
+    release = threading.Event()
+    manager.register_function_rule("慢规则", lambda content: release.wait(1) and "慢回复")
+    manager.register_function_rule("快规则", lambda content: "快回复")
+    
+    start = time.monotonic()
+    match = manager.find_match("测试")
+    elapsed = time.monotonic() - start
+    release.set()
+    
+    print(f"查找结果: {match}, 耗时: {elapsed:.3f}秒")
+    assert match.reply == "快回复", "超时后应该继续检查下一条函数规则"
+    assert elapsed < 0.5, "调用方不应等待超时的处理函数结束"
+    
+    executor.shutdown(wait=True)
+    print("✅ 函数规则超时测试通过！")
+
+def test_circuit_breaker_opens():
+    """测试持续失败的处理函数被熔断"""
+    print("\n=== 熔断器测试 ===")
+    
+    executor = FunctionRuleExecutor(max_workers=2, timeout=1.0, failure_threshold=2, reset_timeout=60)
+    manager = ReplyRuleManager(function_executor=executor)
+    manager.clear_rules()
+    
+    calls = []
+    def broken_handler(content):
+        calls.append(content)
+        raise RuntimeError("模拟处理函数故障")
+    
+    manager.register_function_rule("故障规则", broken_handler)
+    for _ in range(5):
+        match = manager.find_match("测试")
+        assert match.reply is None and not match.cacheable, "失败的查找结果不应缓存"
+    
+    print(f"处理函数调用次数: {len(calls)}")
+    assert len(calls) == 2, "熔断后不应再调用处理函数"
+    assert executor.get_breaker_states()["故障规则"] == CircuitBreaker.OPEN, "熔断器应该处于打开状态"
+    
+    executor.shutdown(wait=True)
+    print("✅ 熔断器测试通过！")
+
+def test_circuit_breaker_recovery():
+    """测试熔断器冷却后试探恢复"""
+    print("\n=== 熔断恢复测试 ===")
+    
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    assert breaker.record_failure(), "达到阈值应该打开熔断器"
+    assert not breaker.allow(), "冷却期内应该跳过调用"
+    
+    time.sleep(0.06)
+    assert breaker.allow(), "冷却结束后应该放行一次试探调用"
+    assert not breaker.allow(), "试探调用完成前不应放行更多调用"
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow(), "试探成功后应该恢复"
+    
+    print("✅ 熔断恢复测试通过！")
+
+def test_skipped_probe():
+    """测试冷却结束后试探调用因名额或预算不足被跳过时，熔断器仍能恢复"""
+    print("\n=== 试探调用跳过测试 ===")
+    
+    executor = FunctionRuleExecutor(max_workers=1, timeout=0.02, budget=1.0, failure_threshold=1, reset_timeout=0.05)
+    release = threading.Event()
+    blocking = lambda content: release.wait(1) and "阻塞回复"
+    
+    # 超时打开熔断器，超时的任务继续占用唯一的名额
+    reply, completed = executor.call("慢规则", blocking, "测试", executor.new_deadline())
+    assert not completed and executor.get_breaker_states()["慢规则"] == CircuitBreaker.OPEN
+    
+    time.sleep(0.06)
+    reply, completed = executor.call("慢规则", lambda content: "回复", "测试", executor.new_deadline())
+    assert not completed, "名额耗尽时应该跳过"
+    assert executor.get_breaker_states()["慢规则"] != CircuitBreaker.HALF_OPEN, "跳过的调用不应占用试探机会"
+    
+    reply, completed = executor.call("慢规则", lambda content: "回复", "测试", time.monotonic() - 1)
+    assert not completed, "超出预算时应该跳过"
+    assert executor.get_breaker_states()["慢规则"] != CircuitBreaker.HALF_OPEN, "跳过的调用不应占用试探机会"
+    
+    # 名额释放、冷却结束后试探调用成功，熔断器恢复
+    release.set()
+    time.sleep(0.06)
+    reply, completed = executor.call("慢规则", lambda content: "回复", "测试", executor.new_deadline())
+    assert reply == "回复" and completed, "冷却结束后应该放行试探调用"
+    assert executor.get_breaker_states()["慢规则"] == CircuitBreaker.CLOSED, "试探成功后应该恢复"
+    
+    # 放行后没有执行的试探调用重新打开熔断器
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.cancel_probe()
+    assert breaker.state == CircuitBreaker.OPEN and not breaker.allow(), "取消试探后应该重新冷却"
+    time.sleep(0.06)
+    assert breaker.allow(), "新的冷却期结束后应该再次放行试探调用"
+    
+    executor.shutdown(wait=True)
+    print("✅ 试探调用跳过测试通过！")
+
+def test_pool_saturation():
+    """测试线程池占满时直接跳过"""
+    print("\n=== 线程池容量测试 ===")
+    
+    executor = FunctionRuleExecutor(max_workers=1, timeout=0.02, budget=1.0, failure_threshold=100)
+    release = threading.Event()
+    blocking = lambda content: release.wait(1) and "阻塞回复"
+    
+    reply, completed = executor.call("阻塞规则", blocking, "测试", executor.new_deadline())
+    assert reply is None and not completed, "第一次调用应该超时"
+    
+    start = time.monotonic()
+    reply, completed = executor.call("其他规则", lambda content: "回复", "测试", executor.new_deadline())
+    elapsed = time.monotonic() - start
+    assert reply is None and not completed, "名额被超时任务占用时应该跳过"
+    assert elapsed < 0.01, "名额耗尽时不应等待"
+    
+    release.set()
+    executor.shutdown(wait=True)
+    print("✅ 线程池容量测试通过！")
+
+if __name__ == "__main__":
+    try:
+        test_timeout_falls_through()
+        test_circuit_breaker_opens()
+        test_circuit_breaker_recovery()
+        test_skipped_probe()
+        test_pool_saturation()
+        
+        print("\n🎉 所有函数规则执行器测试通过！")
+    except Exception as e:
+        print(f"\n❌ 测试失败: {str(e)}")
+        import traceback
+        traceback.print_exc()
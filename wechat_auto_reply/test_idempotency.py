@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+消息幂等处理测试脚本
+用于测试幂等键、处理中标记、回复重放、过期接管，以及SQLite共享存储和处理器对重试消息的处理
+"""
+
+import os
+import tempfile
+import threading
+import time
+from flask import Flask, request
+from idempotency import MemoryIdempotencyStore, SQLiteIdempotencyStore, message_key
+from wechat_handler import WeChatHandler
+import xml_samples
+
+class FakeClock:
+    """可手动拨动的时钟"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def test_message_key():
+    """测试幂等键"""
+    print("=== 幂等键测试 ===")
+
+    assert message_key({'MsgId': '123', 'FromUserName': 'u', 'CreateTime': '1'}) == '123', "普通消息应该使用MsgId"
+    assert message_key({'MsgId': '', 'FromUserName': 'u', 'CreateTime': '1'}) == 'u:1', "事件应该使用发送者和时间"
+    assert message_key({'MsgId': '', 'FromUserName': '', 'CreateTime': ''}) is None, "缺少字段时不做幂等处理"
+
+    print("✅ 幂等键测试通过！")
+
+def check_store(store, clock):
+    """两种存储共用的行为检查"""
+    claim = store.acquire('m1')
+    assert claim.owner and claim.reply is None, "第一次登记应该由本次请求处理"
+    claim = store.acquire('m1')
+    assert not claim.owner and claim.reply is None, "处理中的消息不等待时应该返回超时"
+
+    store.complete('m1', b'<xml>reply</xml>')
+    claim = store.acquire('m1')
+    assert not claim.owner and claim.reply == b'<xml>reply</xml>', "重试应该取回第一次的回复"
+    store.complete('m2', b'')
+    assert store.acquire('m2').reply == b'', "不回复的结果也应该重放"
+
+    # 处理失败后释放标记，重试重新处理
+    assert store.acquire('m3').owner
+    store.release('m3')
+    assert store.acquire('m3').owner, "释放后应该可以重新处理"
+
+    # 处理中标记过期后由重试接管；回复过期后按新消息处理
+    clock.now += store.inflight_timeout + 1
+    assert store.acquire('m3').owner, "处理中标记过期后应该可以接管"
+    clock.now += store.ttl
+    assert store.acquire('m1').owner, "回复过期后应该按新消息处理"
+    assert store.stats()['replays'] == 2, "重放次数统计不正确"
+
+def test_memory_store():
+    """测试进程内存储"""
+    print("\n=== 进程内幂等存储测试 ===")
+
+    clock = FakeClock()
+    check_store(MemoryIdempotencyStore(ttl=30, inflight_timeout=15, clock=clock), clock)
+
+    store = MemoryIdempotencyStore(max_entries=2, clock=clock)
+    for key in ('a', 'b', 'c'):
+        store.acquire(key)
+        store.complete(key, key.encode())
+    assert len(store) == 2 and store.stats()['evictions'] == 1, "超出容量时应该淘汰最旧的条目"
+
+    # 先完成的回复（30秒）比后登记的处理中标记（15秒）晚到期，处理中标记过期后仍应该被清除
+    store = MemoryIdempotencyStore(ttl=30, inflight_timeout=15, clock=clock)
+    store.acquire('done')
+    store.complete('done', b'reply')
+    clock.now += 1
+    store.acquire('stuck')
+    clock.now += 15
+    assert store.stats()['size'] == 1, "过期的处理中标记不应该被未过期的回复挡住"
+    assert store.acquire('stuck').owner, "处理中标记过期后应该可以接管"
+    assert store.acquire('done').reply == b'reply', "未过期的回复应该保留"
+
+    # 重试请求等待第一次处理完成
+    store = MemoryIdempotencyStore()
+    assert store.acquire('slow').owner
+    timer = threading.Timer(0.1, store.complete, ('slow', b'done'))
+    timer.start()
+    start = time.perf_counter()
+    claim = store.acquire('slow', wait=2.0)
+    assert claim.reply == b'done' and time.perf_counter() - start < 1.0, "等待中的请求应该在完成时被唤醒"
+    timer.join()
+
+    print("✅ 进程内幂等存储测试通过！")
+
+def test_sqlite_store():
+    """测试多进程共享的SQLite存储"""
+    print("\n=== SQLite幂等存储测试 ===")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, 'idempotency.db')
+        clock = FakeClock()
+        check_store(SQLiteIdempotencyStore(path, ttl=30, inflight_timeout=15, clock=clock), clock)
+
+        # 模拟多个工作进程：各自打开同一个文件，同一条消息只有一个能登记成功
+        stores = [SQLiteIdempotencyStore(path) for _ in range(4)]
+        owners = []
+        barrier = threading.Barrier(len(stores))
+
+        def worker(store):
+            barrier.wait()
+            claim = store.acquire('shared', wait=2.0)
+            if claim.owner:
+                owners.append(store)
+                time.sleep(0.1)
+                store.complete('shared', b'first')
+            else:
+                assert claim.reply == b'first', "其他进程应该取回第一次的回复"
+
+        threads = [threading.Thread(target=worker, args=(store,)) for store in stores]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(owners) == 1, f"同一条消息应该只处理一次，实际 {len(owners)} 次"
+        assert sum(store.stats()['replays'] for store in stores) == len(stores) - 1, "其余请求都应该重放回复"
+
+    print("✅ SQLite幂等存储测试通过！")
+
+def test_handler_retries():
+    """测试处理器对微信重试的处理"""
+    print("\n=== 重试消息处理测试 ===")
+
+    app = Flask(__name__)
+    handler = WeChatHandler("test_token", idempotency=MemoryIdempotencyStore())
+    calls = []
+    process_message = handler._process_message
+
+    def slow_process(msg_dict, deadline=None):
+        calls.append(msg_dict['MsgId'])
+        time.sleep(0.2)
+        return process_message(msg_dict, deadline)
+
+    handler._process_message = slow_process
+    payload = xml_samples.TEXT_MESSAGE_SAMPLE.encode('utf-8')
+    responses = []
+
+    def post():
+        with app.test_request_context('/wechat', method='POST', data=payload):
+            responses.append(handler.handle_message(request).get_data())
+
+    # 第一次请求处理期间到达的重试等待第一次的结果，处理完成后的重试直接重放
+    threads = [threading.Thread(target=post) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.02)
+    for thread in threads:
+        thread.join()
+    post()
+
+    assert len(calls) == 1, f"重试的消息不应该重复处理，实际处理 {len(calls)} 次"
+    assert len(set(responses)) == 1 and '你好+1'.encode('utf-8') in responses[0], "重试应该得到相同的回复"
+    assert handler.idempotency.stats()['replays'] == 3, "重放次数统计不正确"
+
+    print("✅ 重试消息处理测试通过！")
+
+if __name__ == "__main__":
+    try:
+        test_message_key()
+        test_memory_store()
+        test_sqlite_store()
+        test_handler_retries()
+
+        print("\n🎉 所有消息幂等处理测试通过！")
+    except Exception as e:
+        print(f"\n❌ 测试失败: {str(e)}")
+        import traceback
+        traceback.print_exc()
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+意图表测试脚本
+用于测试意图表的加载、匹配优先级和与规则管理器的集成
+"""
+
+import json
+import os
+import tempfile
+from intents import Intent, IntentTable, get_default_intent_table
+from reply_rules import ReplyRuleManager
+
+def test_default_intents():
+    """测试默认意图表"""
+    print("=== 默认意图表测试 ===")
+    
+    table = get_default_intent_table()
+    assert len(table) >= 3, "默认意图表应该包含问候、感谢和功能询问"
+    
+    assert table.match("Hello there").intent == "greeting", "英文问候应该忽略大小写"
+    assert table.match("非常感谢").intent == "thanks", "感谢意图应该命中"
+    assert table.match("这个怎么用").intent == "functions", "功能询问意图应该命中"
+    assert table.match("随便说点什么") is None, "无关内容不应命中"
+    
+    print("✅ 默认意图表测试通过！")
+
+def test_intent_priority():
+    """测试表中靠前的意图优先"""
+    print("\n=== 意图优先级测试 ===")
+    
+    table = IntentTable([
+        Intent("first", ["退款"], "退款回复"),
+        Intent("second", ["申请退款", "订单"], "订单回复"),
+    ])
+    
+    assert table.match("我要申请退款").intent == "first", "靠前的意图应该优先"
+    assert table.match("订单退款").intent == "first", "与关键词位置无关，只看意图顺序"
+    assert table.match("查订单").intent == "second", "后面的意图应该能够命中"
+    
+    print("✅ 意图优先级测试通过！")
+
+def test_intent_file_loading():
+    """测试从文件加载意图表并接入规则管理器"""
+    print("\n=== 意图文件加载测试 ===")
+    
+    items = [{"intent": "shipping", "keywords": ["快递", "物流"], "reply": "物流信息请查看订单详情。"}]
+    with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False, encoding='utf-8') as f:
+        json.dump(items, f, ensure_ascii=False)
+        path = f.name
+    
+    try:
+        table = IntentTable.from_file(path)
+    finally:
+        os.remove(path)
+    
+    manager = ReplyRuleManager(intent_table=table)
+    assert manager.find_reply("我的快递到哪了") == "物流信息请查看订单详情。", "自定义意图应该生效"
+    assert manager.find_reply("谢谢") is None, "未配置的意图不应命中"
+    
+    print("✅ 意图文件加载测试通过！")
+
+if __name__ == "__main__":
+    try:
+        test_default_intents()
+        test_intent_priority()
+        test_intent_file_loading()
+        
+        print("\n🎉 所有意图表测试通过！")
+    except Exception as e:
+        print(f"\n❌ 测试失败: {str(e)}")
+        import traceback
+        traceback.print_exc()
@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""
+规则匹配索引测试脚本
+用于测试预编译匹配结构与逐条匹配结果的一致性
+"""
+
+import re
+import random
+from matchers import (AhoCorasickAutomaton, ExactMatchIndex, RegexPrefilterTier, RegexRuleEntry,
+                      SymmetricDeleteIndex, edit_distance)
+from reply_rules import ReplyRuleManager
+
+def test_aho_corasick_basic():
+    """测试自动机基本匹配"""
+    print("=== 自动机基本匹配测试 ===")
+
+    automaton = AhoCorasickAutomaton([("he", 3), ("she", 1), ("his", 2), ("hers", 0)])
+
+    assert automaton.search("ushers") == 0, "hers 的序号最小，应该优先命中"
+    assert automaton.search("ushe") == 1, "she 应该通过失败指针命中"
+    assert automaton.search("this") == 2, "his 应该命中"
+    assert automaton.search("xyz") is None, "无命中时应该返回None"
+    assert len(automaton) == 4, "模式数量不正确"
+
+    print("✅ 自动机基本匹配测试通过！")
+
+def test_aho_corasick_chinese():
+    """测试中文模式与重复模式"""
+    print("\n=== 自动机中文匹配测试 ===")
+
+    automaton = AhoCorasickAutomaton([("天气", 5), ("时间", 2), ("天气", 1), ("气", 9)])
+
+    assert automaton.search("今天天气怎么样") == 1, "重复模式应该保留最小序号"
+    assert automaton.search("空气") == 9, "单字模式应该命中"
+    assert automaton.search("现在什么时间，天气如何") == 1, "应该返回全部命中中的最小序号"
+
+    print("✅ 自动机中文匹配测试通过！")
+
+def test_contains_priority_with_other_rules():
+    """测试包含规则与其他规则的优先级"""
+    print("\n=== 包含规则优先级测试 ===")
+
+    manager = ReplyRuleManager()
+    manager.clear_rules()
+    manager.add_rule("包含规则", "订单", "包含回复", "contains")
+    manager.add_rule("精确规则", "查询订单", "精确回复", "exact")
+    manager.add_rule("大小写规则", "VIP", "会员回复", "contains")
+
+    assert manager.find_reply("查询订单") == "包含回复", "先添加的包含规则应该优先"
+    assert manager.find_reply("我是vip用户") == "会员回复", "包含匹配应该忽略大小写"
+
+    manager.remove_rule("包含规则")
+    assert manager.find_reply("查询订单") == "精确回复", "删除规则后自动机应该重建"
+
+    print("✅ 包含规则优先级测试通过！")
+
+def test_exact_match_index():
+    """测试精确匹配哈希索引"""
+    print("\n=== 精确匹配索引测试 ===")
+
+    index = ExactMatchIndex([("你好", 4), ("帮助", 2), ("你好", 1)])
+
+    assert index.lookup("你好") == 1, "重复模式应该保留最小序号"
+    assert index.lookup("帮助") == 2, "应该直接查到规则序号"
+    assert index.lookup("你好啊") is None, "非完全相同的文本不应命中"
+    assert len(index) == 2, "索引键数量不正确"
+
+    print("✅ 精确匹配索引测试通过！")
+
+def test_exact_priority_across_tiers():
+    """测试精确匹配与其他规则类型的优先级合并"""
+    print("\n=== 跨层优先级测试 ===")
+
+    manager = ReplyRuleManager()
+    manager.clear_rules()
+    manager.add_rule("正则规则", r"^\d+$", "数字回复", "regex")
+    manager.add_rule("精确数字", "123", "精确数字回复", "exact")
+    manager.add_rule("精确问候", "你好", "问候回复", "exact")
+    manager.add_rule("包含问候", "你好", "包含回复", "contains")
+    manager.add_rule("空回复", "再见", "", "exact")
+    manager.add_rule("包含再见", "再见", "包含再见回复", "contains")
+
+    assert manager.find_reply("123") == "数字回复", "先添加的正则规则应该优先于精确规则"
+    assert manager.find_reply("你好") == "问候回复", "精确规则应该优先于后添加的包含规则"
+    assert manager.find_reply(" 你好 ") == "问候回复", "精确匹配应该使用去除空白后的文本"
+    assert manager.find_reply("再见") == "包含再见回复", "空回复的规则不应被选中"
+
+    print("✅ 跨层优先级测试通过！")
+
+def test_regex_prefilter_analysis():
+    """测试正则预过滤信息提取"""
+    print("\n=== 正则预过滤分析测试 ===")
+
+    phone = RegexRuleEntry(0, r"1[3-9]\d{9}", re.compile(r"1[3-9]\d{9}", re.IGNORECASE))
+    assert phone.min_length == 11, "电话号码正则的最小长度应为11"
+    assert phone.literals == ("1",), f"必需字面量不正确: {phone.literals}"
+    assert not phone.accepts("12345"), "过短的文本应该被过滤"
+
+    email_pattern = r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}"
+    email = RegexRuleEntry(1, email_pattern, re.compile(email_pattern, re.IGNORECASE))
+    assert "@" in email.literals, "邮箱正则应该要求包含@"
+    assert not email.accepts("没有邮箱的一句很长的话而已"), "不含@的文本应该被过滤"
+    assert email.combinable, "普通正则应该可以组合"
+
+    named = RegexRuleEntry(2, r"(?P<word>ab)c", re.compile(r"(?P<word>ab)c", re.IGNORECASE))
+    backref = RegexRuleEntry(3, r"(a)\1", re.compile(r"(a)\1", re.IGNORECASE))
+    assert not named.combinable, "含命名分组的正则不应组合"
+    assert not backref.combinable, "含反向引用的正则不应组合"
+    assert "c" not in named.literals, "有大小写变体的字符不应作为字面量"
+
+    print("✅ 正则预过滤分析测试通过！")
+
+def test_regex_tier_priority():
+    """测试组合正则的优先级与逐条匹配一致"""
+    print("\n=== 正则匹配层优先级测试 ===")
+
+    patterns = [r"订单\d+", r"(a)\1", r"\d{3}", r"(?P<w>xy)z", r"^hello", r"abc|订单"]
+    rules = [(ordinal, p, re.compile(p, re.IGNORECASE)) for ordinal, p in enumerate(patterns)]
+    tier = RegexPrefilterTier(rules)
+
+    samples = ["查询订单", "订单123", "aa 订单", "456", "xyz 789", "HELLO 123", "Hello", "abc", "", "abcxyz"]
+    for text in samples:
+        expected = next((o for o, _, c in rules if c.search(text)), None)
+        assert tier.search(text) == expected, f"输入 {text!r} 期望 {expected}，实际 {tier.search(text)}"
+        limited = expected if expected is not None and expected < 2 else None
+        assert tier.search(text, limit=2) == limited, f"输入 {text!r} 的序号限制不正确"
+
+    print("✅ 正则匹配层优先级测试通过！")
+
+def test_edit_distance():
+    """测试编辑距离"""
+    print("\n=== 编辑距离测试 ===")
+
+    assert edit_distance("帮助", "帮助") == 0, "相同文本距离为0"
+    assert edit_distance("帮助", "帮主") == 1, "替换一个字符距离为1"
+    assert edit_distance("帮助", "帮助啊") == 1, "多一个字符距离为1"
+    assert edit_distance("kitten", "sitting") == 3, "经典示例距离为3"
+    assert edit_distance("abcdef", "a", limit=2) == 3, "超过上限时返回上限加1"
+
+    print("✅ 编辑距离测试通过！")
+
+def test_symmetric_delete_index():
+    """测试模糊匹配索引与逐条计算编辑距离的结果一致"""
+    print("\n=== 模糊匹配索引测试 ===")
+
+    rng = random.Random(3)
+    alphabet = "帮助再见订单查询abc12"
+    patterns = sorted({''.join(rng.choice(alphabet) for _ in range(rng.randint(1, 5))) for _ in range(300)})
+
+    for k in (1, 2):
+        index = SymmetricDeleteIndex([(p, i) for i, p in enumerate(patterns)], max_distance=k)
+        for _ in range(300):
+            text = ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 7)))
+            expected = None
+            for ordinal, pattern in enumerate(patterns):
+                limit = min(k, len(pattern) - 1)
+                distance = edit_distance(text, pattern)
+                if distance <= limit and (expected is None or (distance, ordinal) < expected):
+                    expected = (distance, ordinal)
+            assert index.search(text) == expected, f"输入 {text!r} 期望 {expected}，实际 {index.search(text)}"
+
+    index = SymmetricDeleteIndex([("帮助", 3), ("帮助", 1), ("a", 0)], max_distance=1)
+    assert index.search("帮主") == (1, 1), "重复模式应该保留最小序号"
+    assert index.search("b") is None, "单字符模式只允许完全相同"
+
+    print("✅ 模糊匹配索引测试通过！")
+
+def test_symmetric_delete_index_updated():
+    """测试模糊匹配索引的增量修改与重新编译结果一致，且不修改原索引"""
+    print("\n=== 模糊匹配索引增量修改测试 ===")
+
+    rng = random.Random(5)
+    alphabet = "帮助再见订单查询abc12"
+    entries = [(''.join(rng.choice(alphabet) for _ in range(rng.randint(1, 5))), i) for i in range(200)]
+    queries = [''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 7))) for _ in range(300)]
+
+    index = SymmetricDeleteIndex(entries, max_distance=1)
+    before = [index.search(text) for text in queries]
+    current = list(entries)
+    for step in range(20):
+        removed = rng.sample(current, 5)
+        added = [(''.join(rng.choice(alphabet) for _ in range(rng.randint(1, 6))), 1000 + step * 10 + i)
+                 for i in range(5)]
+        # 有时加入与已有模式相同的串，删除后应由剩余的序号接替
+        added.append((rng.choice(current)[0], 2000 + step))
+        current = [entry for entry in current if entry not in removed] + added
+        updated = index.updated(removed, added)
+        rebuilt = SymmetricDeleteIndex(current, max_distance=1)
+        assert (updated.min_length, updated.max_length, len(updated)) == \
+               (rebuilt.min_length, rebuilt.max_length, len(rebuilt)), "长度范围和模式数应该与重新编译一致"
+        for text in queries:
+            assert updated.search(text) == rebuilt.search(text), f"输入 {text!r} 的增量结果与重新编译不一致"
+        if step == 0:
+            assert [index.search(text) for text in queries] == before, "增量修改不应该改变原索引"
+        index = updated
+
+    print("✅ 模糊匹配索引增量修改测试通过！")
+
+def test_fuzzy_rules():
+    """测试模糊规则与其他规则类型的配合"""
+    print("\n=== 模糊规则测试 ===")
+
+    manager = ReplyRuleManager()
+    manager.clear_rules()
+    manager.add_rule("模糊帮助", "帮助", "帮助回复", "fuzzy")
+    manager.add_rule("模糊编码", "SKU1024", "商品回复", "fuzzy")
+    manager.add_rule("精确帮主", "帮主", "帮主回复", "exact")
+
+    assert manager.find_reply("帮助") == "帮助回复", "与模式相同时应该命中"
+    assert manager.find_reply("帮住") == "帮助回复", "错一个字时应该命中"
+    assert manager.find_reply("帮助啊") == "帮助回复", "多一个字时应该命中"
+    assert manager.find_reply("帮主") == "帮主回复", "其他规则完全命中时优先于有误差的模糊命中"
+    assert manager.find_reply("sku1O24") == "商品回复", "商品编码错一个字符时应该命中"
+    assert manager.find_reply("帮帮忙吧") is None, "误差过大时不应命中"
+    assert manager.get_rules_info()['tiers']['fuzzy']['hits'] >= 3, "应该记录模糊匹配层统计"
+
+    print("✅ 模糊规则测试通过！")
+
+if __name__ == "__main__":
+    try:
+        test_aho_corasick_basic()
+        test_aho_corasick_chinese()
+        test_contains_priority_with_other_rules()
+        test_exact_match_index()
+        test_exact_priority_across_tiers()
+        test_regex_prefilter_analysis()
+        test_regex_tier_priority()
+        test_edit_distance()
+        test_symmetric_delete_index()
+        test_symmetric_delete_index_updated()
+        test_fuzzy_rules()
+
+        print("\n🎉 所有规则匹配索引测试通过！")
+    except Exception as e:
+        print(f"\n❌ 测试失败: {str(e)}")
+        import traceback
+        traceback.print_exc()
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+消息分发测试脚本
+用于测试按 (MsgType, Event) 分发、语音识别结果、关注欢迎语、菜单点击和自定义处理函数的注册
+"""
+
+import xml.etree.ElementTree as ET
+import xml_samples
+from message_router import MessageRouter, create_default_router, message_router
+from reply_builder import build_image_reply
+from reply_rules import ReplyRuleManager
+from xml_parser import parse_message
+from wechat_handler import WeChatHandler
+import wechat_handler
+
+def reply_content(reply_xml):
+    """取出文本回复的内容"""
+    return ET.fromstring(reply_xml).find('Content').text if reply_xml else None
+
+def test_router_registry():
+    """测试分发表的注册和查找"""
+    print("=== 分发表测试 ===")
+
+    router = MessageRouter()
+    calls = []
+
+    @router.register('event', 'CLICK')
+    def on_click(handler, msg_dict, deadline):
+        calls.append(msg_dict['EventKey'])
+        return '点击'
+
+    assert ('event', 'click') in router and ('event', 'CLICK') in router, "事件名不应该区分大小写"
+    assert router.get_handler({'MsgType': 'event', 'Event': 'click'}) is on_click
+    assert router.dispatch(None, parse_message(xml_samples.CLICK_EVENT_SAMPLE)) == '点击'
+    assert calls == ['MENU_KEY_1']
+    assert router.dispatch(None, {'MsgType': 'text', 'Content': 'x'}) is None, "未注册的类型应该返回None"
+    assert router.unregister('event', 'click') and len(router) == 0
+
+    default = create_default_router()
+    for sample in ('TEXT', 'IMAGE', 'VOICE', 'VIDEO', 'SHORT_VIDEO', 'LOCATION', 'LINK'):
+        message = parse_message(getattr(xml_samples, f'{sample}_MESSAGE_SAMPLE'))
+        assert default.get_handler(message) is not None, f"{sample} 消息应该有处理函数"
+    for sample in ('SUBSCRIBE', 'UNSUBSCRIBE', 'CLICK'):
+        assert default.get_handler(parse_message(getattr(xml_samples, f'{sample}_EVENT_SAMPLE'))) is not None
+
+    print("✅ 分发表测试通过！")
+
+def test_builtin_handlers():
+    """测试内置的语音、关注、取消关注和菜单点击处理"""
+    print("\n=== 内置处理函数测试 ===")
+
+    manager = ReplyRuleManager()
+    manager.add_rule("菜单1", "MENU_KEY_1", "这是菜单一", "exact")
+    manager.add_state_rule("进入客服", "", "客服", "请选择", next_state="menu")
+    original = wechat_handler.reply_manager
+    wechat_handler.reply_manager = manager
+    try:
+        handler = WeChatHandler("test_token")
+
+        voice = parse_message(xml_samples.VOICE_MESSAGE_SAMPLE)
+        voice['Recognition'] = '你好。'
+        assert reply_content(handler._process_message(voice)) == '你好+1', "语音识别结果应该交给规则引擎"
+        voice['Recognition'] = ''
+        assert handler._process_message(voice) is None, "没有识别结果时不回复"
+
+        welcome = reply_content(handler._process_message(parse_message(xml_samples.SUBSCRIBE_EVENT_SAMPLE)))
+        assert welcome and '感谢关注' in welcome, f"关注事件应该回复欢迎语: {welcome}"
+
+        click = parse_message(xml_samples.CLICK_EVENT_SAMPLE)
+        assert reply_content(handler._process_message(click)) == '这是菜单一', "菜单点击应该按EventKey匹配规则"
+
+        # 取消关注时结束多轮会话
+        assert handler.generate_text_reply('客服', 'oUser123456789') == '请选择'
+        assert manager.has_session('oUser123456789')
+        assert handler._process_message(parse_message(xml_samples.UNSUBSCRIBE_EVENT_SAMPLE)) is None
+        assert not manager.has_session('oUser123456789'), "取消关注后应该结束会话"
+
+        for sample in ('IMAGE', 'LOCATION', 'LINK'):
+            assert handler._process_message(parse_message(getattr(xml_samples, f'{sample}_MESSAGE_SAMPLE'))) is None
+    finally:
+        wechat_handler.reply_manager = original
+
+    print("✅ 内置处理函数测试通过！")
+
+def test_custom_handler():
+    """测试不修改处理器注册新的处理函数"""
+    print("\n=== 自定义处理函数测试 ===")
+
+    router = create_default_router()
+
+    @router.register('image')
+    def echo_image(handler, msg_dict, deadline):
+        return build_image_reply(msg_dict['FromUserName'], msg_dict['ToUserName'], msg_dict['MediaId'])
+
+    handler = WeChatHandler("test_token", router=router)
+    reply = handler._process_message(parse_message(xml_samples.IMAGE_MESSAGE_SAMPLE))
+    root = ET.fromstring(reply)
+    assert root.find('MsgType').text == 'image' and root.find('Image/MediaId').text == 'media_id_123', "应该直接返回处理函数生成的XML"
+    assert message_router.get_handler({'MsgType': 'image'}) is not echo_image, "不应该影响全局分发表"
+
+    print("✅ 自定义处理函数测试通过！")
+
+if __name__ == "__main__":
+    try:
+        test_router_registry()
+        test_builtin_handlers()
+        test_custom_handler()
+
+        print("\n🎉 所有消息分发测试通过！")
+    except Exception as e:
+        print(f"\n❌ 测试失败: {str(e)}")
+        import traceback
+        traceback.print_exc()
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+回复XML构造测试脚本
+用于测试文本、图片、语音、图文回复的字节构造、CDATA拆分和响应头
+"""
+
+import xml.etree.ElementTree as ET
+import xml_samples
+from reply_builder import (
+    Article, build_image_reply, build_news_reply, build_text_reply, build_voice_reply, reply_headers
+)
+from xml_parser import parse_xml_fields
+from wechat_handler import WeChatHandler
+
+TO_USER = 'oUser123456789'
+FROM_USER = 'gh_123456789abc'
+
+def test_reply_types():
+    """测试各类回复的格式"""
+    print("=== 回复类型测试 ===")
+
+    body = build_text_reply(TO_USER, FROM_USER, '你好+1', create_time=1234567890)
+    assert isinstance(body, bytes), "回复应该是字节"
+    assert body == xml_samples.TEXT_REPLY_SAMPLE.encode('utf-8'), "文本回复应该与样例一致"
+
+    root = ET.fromstring(build_image_reply(TO_USER, FROM_USER, 'media_1'))
+    assert root.find('MsgType').text == 'image' and root.find('Image/MediaId').text == 'media_1', "图片回复格式不正确"
+    assert int(root.find('CreateTime').text) > 0, "默认应该使用当前时间"
+
+    root = ET.fromstring(build_voice_reply(TO_USER, FROM_USER, 'media_2'))
+    assert root.find('MsgType').text == 'voice' and root.find('Voice/MediaId').text == 'media_2', "语音回复格式不正确"
+
+    body = build_news_reply(TO_USER, FROM_USER, [
+        Article('标题', '描述', 'http://example.com/pic.jpg', 'http://example.com')
+    ], create_time=1234567890)
+    assert body == xml_samples.NEWS_REPLY_SAMPLE.encode('utf-8'), "图文回复应该与样例一致"
+
+    root = ET.fromstring(build_news_reply(TO_USER, FROM_USER, [Article('一'), Article('二', url='http://b')]))
+    assert root.find('ArticleCount').text == '2', "文章数不正确"
+    assert [item.find('Title').text for item in root.iter('item')] == ['一', '二'], "文章顺序不正确"
+
+    for articles in ([], [Article('x')] * 9):
+        try:
+            build_news_reply(TO_USER, FROM_USER, articles)
+        except ValueError:
+            continue
+        raise AssertionError(f"{len(articles)} 篇文章应该报错")
+
+    print("✅ 回复类型测试通过！")
+
+def test_cdata_split():
+    """测试内容中的 ]]> 不会破坏XML"""
+    print("\n=== CDATA拆分测试 ===")
+
+    content = '数组 a[b[0]]>1，结尾]]>'
+    body = build_text_reply(TO_USER, FROM_USER, content)
+    assert ET.fromstring(body).find('Content').text == content, "]]> 应该原样还原"
+    assert parse_xml_fields(body)['Content'] == content, "单次扫描解析器也应该还原 ]]>"
+
+    root = ET.fromstring(build_news_reply(TO_USER, FROM_USER, [Article(']]>', ']]>]]>')]))
+    assert root.find('.//Title').text == ']]>' and root.find('.//Description').text == ']]>]]>', "图文字段应该拆分CDATA"
+
+    print("✅ CDATA拆分测试通过！")
+
+def test_handler_response():
+    """测试处理器返回字节响应和正确的长度"""
+    print("\n=== 响应头测试 ===")
+
+    body = build_text_reply(TO_USER, FROM_USER, '你好')
+    headers = reply_headers(body)
+    assert headers['Content-Length'] == str(len(body)), "Content-Length 应该是字节长度"
+    assert headers['Content-Type'].startswith('application/xml'), "Content-Type 不正确"
+
+    handler = WeChatHandler("test_token")
+    reply = handler._process_message({
+        'MsgType': 'text', 'Content': '你好', 'FromUserName': TO_USER, 'ToUserName': FROM_USER
+    })
+    assert isinstance(reply, bytes) and ET.fromstring(reply).find('Content').text == '你好+1', "处理器应该返回回复字节"
+
+    print("✅ 响应头测试通过！")
+
+if __name__ == "__main__":
+    try:
+        test_reply_types()
+        test_cdata_split()
+        test_handler_response()
+
+        print("\n🎉 所有回复构造测试通过！")
+    except Exception as e:
+        print(f"\n❌ 测试失败: {str(e)}")
+        import traceback
+        traceback.print_exc()
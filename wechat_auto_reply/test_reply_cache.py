@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+回复缓存测试脚本
+用于测试LRU淘汰、统计计数和动态规则的缓存绕过
+"""
+
+from reply_cache import ReplyCache
+from reply_rules import reply_manager
+from wechat_handler import WeChatHandler
+
+def test_lru_eviction():
+    """测试LRU淘汰和统计计数"""
+    print("=== LRU淘汰测试 ===")
+    
+    cache = ReplyCache(maxsize=2)
+    cache.put("你好", 1, "你好+1")
+    cache.put("帮助", 1, "帮助信息")
+    
+    # 访问"你好"后，"帮助"成为最久未使用的条目
+    assert cache.get("你好", 1) == (True, "你好+1"), "应该命中缓存"
+    cache.put("再见", 1, None)
+    
+    assert cache.get("帮助", 1) == (False, None), "最久未使用的条目应该被淘汰"
+    assert cache.get("再见", 1) == (True, None), "空回复也应该被缓存"
+    assert cache.get("你好", 2) == (False, None), "不同版本的规则集不应命中"
+    
+    stats = cache.stats()
+    print(f"缓存统计: {stats}")
+    assert stats['hits'] == 2, "命中次数不正确"
+    assert stats['misses'] == 2, "未命中次数不正确"
+    assert stats['evictions'] == 1, "淘汰次数不正确"
+    assert stats['size'] == 2, "缓存大小不正确"
+    
+    print("✅ LRU淘汰测试通过！")
+
+def test_disabled_cache():
+    """测试容量为0时禁用缓存"""
+    print("\n=== 禁用缓存测试 ===")
+    
+    cache = ReplyCache(maxsize=0)
+    cache.put("你好", 1, "你好+1")
+    assert cache.get("你好", 1) == (False, None), "禁用的缓存不应保存条目"
+    
+    print("✅ 禁用缓存测试通过！")
+
+def test_handler_cache():
+    """测试处理器使用缓存，且动态规则不进入缓存"""
+    print("\n=== 处理器缓存测试 ===")
+    
+    handler = WeChatHandler("test_token", reply_cache=ReplyCache(maxsize=16))
+    
+    assert handler._generate_reply("你好") == "你好+1", "首次查询应该返回规则回复"
+    assert handler._generate_reply(" 你好 ") == "你好+1", "规范化后的相同消息应该命中缓存"
+    assert handler.reply_cache.hits == 1, "第二次查询应该命中缓存"
+    
+    calls = []
+    def counter_handler(user_content):
+        calls.append(user_content)
+        return f"第{len(calls)}次调用" if user_content == "计数" else None
+    
+    reply_manager.register_function_rule("计数规则", counter_handler, dynamic=True)
+    try:
+        assert handler._generate_reply("计数") == "第1次调用", "动态函数规则应该被执行"
+        assert handler._generate_reply("计数") == "第2次调用", "动态函数规则不应被缓存"
+    finally:
+        reply_manager.remove_rule("计数规则")
+    
+    assert handler._generate_reply("你好") == "你好+1", "规则更新后应该重新查找"
+    
+    print("✅ 处理器缓存测试通过！")
+
+if __name__ == "__main__":
+    try:
+        test_lru_eviction()
+        test_disabled_cache()
+        test_handler_cache()
+        
+        print("\n🎉 所有回复缓存测试通过！")
+    except Exception as e:
+        print(f"\n❌ 测试失败: {str(e)}")
+        import traceback
+        traceback.print_exc()
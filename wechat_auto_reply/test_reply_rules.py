@@ -4,7 +4,9 @@
 用于测试自动回复规则的匹配和处理功能
 """
 
-from reply_rules import ReplyRuleManager, reply_manager
+import random
+import threading
+from reply_rules import CompiledRuleSet, ReplyRuleManager, reply_manager
 
 def test_exact_match_rules():
     """测试精确匹配规则"""
@@ -159,6 +161,193 @@ def test_priority_order():
     
     print("✅ 规则优先级测试通过！")
 
+def test_rule_set_snapshots():
+    """测试规则集快照的版本和隔离性"""
+    print("\n=== 规则集快照测试 ===")
+    
+    test_manager = ReplyRuleManager()
+    snapshot = test_manager.get_rule_set()
+    version = test_manager.version
+    
+    test_manager.add_rule("快照规则", "快照", "快照回复", "exact")
+    assert test_manager.version == version + 1, "每次修改应该发布新版本"
+    assert snapshot.match_rule("快照") is None, "旧快照不应受后续修改影响"
+    assert test_manager.find_reply("快照") == "快照回复", "新快照应该生效"
+    
+    # 批量修改只发布一次
+    version = test_manager.version
+    with test_manager.batch_update():
+        test_manager.add_rule("批量1", "批量一", "回复一", "exact")
+        test_manager.add_rule("批量2", "批量二", "回复二", "exact")
+        assert test_manager.find_reply("批量一") != "回复一", "批量修改完成前不应生效"
+    assert test_manager.version == version + 1, "批量修改应该只发布一个版本"
+    assert test_manager.find_reply("批量二") == "回复二", "批量修改完成后应该生效"
+    
+    # 出错的批量修改全部放弃
+    version = test_manager.version
+    try:
+        with test_manager.batch_update():
+            test_manager.add_rule("失败规则", "失败", "失败回复", "exact")
+            raise RuntimeError("模拟批量修改失败")
+    except RuntimeError:
+        pass
+    assert test_manager.version == version, "失败的批量修改不应发布"
+    assert test_manager.find_reply("失败") != "失败回复", "失败的批量修改不应生效"
+    
+    print("✅ 规则集快照测试通过！")
+
+def test_concurrent_reload():
+    """测试重新加载规则时并发读取不受影响"""
+    print("\n=== 并发重新加载测试 ===")
+    
+    test_manager = ReplyRuleManager()
+    errors = []
+    stop = threading.Event()
+    
+    def reader():
+        while not stop.is_set():
+            reply = test_manager.find_reply("你好")
+            if reply != "你好+1":
+                errors.append(reply)
+    
+    readers = [threading.Thread(target=reader) for _ in range(4)]
+    for thread in readers:
+        thread.start()
+    for _ in range(50):
+        test_manager.reload_default_rules()
+    stop.set()
+    for thread in readers:
+        thread.join()
+    
+    assert not errors, f"重新加载期间读取到错误回复: {errors[:3]}"
+    
+    print("✅ 并发重新加载测试通过！")
+
+def test_find_replies():
+    """测试批量查找与逐条查找结果一致"""
+    print("\n=== 批量查找测试 ===")
+    
+    test_manager = ReplyRuleManager()
+    messages = ["你好", "帮助", "今天天气怎么样", "13812345678", "完全无关的内容", "", "  再见  "] * 50
+    expected = [test_manager.find_match(message) for message in messages]
+    expected = [(match.rule_name, match.reply) for match in expected]
+    
+    serial = list(test_manager.find_replies(messages, processes=1))
+    assert serial == expected, "单进程批量查找结果与逐条查找不一致"
+    
+    parallel = list(test_manager.find_replies(iter(messages), processes=2, chunksize=16))
+    assert parallel == expected, "多进程批量查找结果与逐条查找不一致"
+    
+    print(f"✅ 批量查找 {len(messages)} 条消息，结果与逐条查找一致")
+
+def test_rule_registry():
+    """测试按名称索引的规则增删改和优先级调整"""
+    print("\n=== 规则注册表测试 ===")
+    
+    test_manager = ReplyRuleManager()
+    test_manager.clear_rules()
+    test_manager.add_rule("包含订单", "订单", "包含回复", "contains")
+    test_manager.add_rule("精确订单", "查询订单", "精确回复", "exact")
+    
+    assert test_manager.find_reply("查询订单") == "包含回复", "先添加的规则优先"
+    
+    # 原位替换不改变优先级
+    assert not test_manager.upsert_rule("包含订单", "订单", "新包含回复", "contains"), "同名规则应该原位替换"
+    assert test_manager.find_reply("查询订单") == "新包含回复", "替换后应该使用新回复"
+    assert [rule.name for rule in test_manager.rules] == ["包含订单", "精确订单"], "原位替换不应改变顺序"
+    
+    # 调整优先级
+    assert test_manager.move_rule("精确订单", before="包含订单"), "调整优先级应该成功"
+    assert test_manager.find_reply("查询订单") == "精确回复", "移到前面的规则应该优先"
+    assert test_manager.move_rule("精确订单"), "不指定位置时移到末尾"
+    assert test_manager.find_reply("查询订单") == "新包含回复", "移到末尾后优先级最低"
+    assert not test_manager.move_rule("不存在的规则", position=0), "不存在的规则无法移动"
+    
+    # 按位置插入
+    assert test_manager.upsert_rule("最高优先级", "订单", "最高回复", "contains", position=0), "应该作为新规则加入"
+    assert test_manager.find_reply("我的订单") == "最高回复", "插入到第0位的规则应该优先"
+    test_manager.upsert_rule("中间规则", "订单", "中间回复", "contains", before="包含订单")
+    assert [rule.name for rule in test_manager.rules] == ["最高优先级", "中间规则", "包含订单", "精确订单"], \
+        "插入位置不正确"
+    
+    try:
+        test_manager.upsert_rule("无效位置", "x", "x", before="不存在的规则")
+        assert False, "指定不存在的规则作为位置时应该报错"
+    except KeyError:
+        pass
+    
+    assert test_manager.get_rule("中间规则").reply == "中间回复", "应该可以按名称查找规则"
+    assert test_manager.remove_rule("最高优先级"), "删除规则应该成功"
+    assert test_manager.get_rule("最高优先级") is None, "删除后不应再找到规则"
+    assert test_manager.find_reply("我的订单") == "中间回复", "删除后下一条规则应该生效"
+    
+    # 批量操作作为一个事务发布
+    version = test_manager.version
+    with test_manager.batch_update():
+        test_manager.remove_rule("中间规则")
+        test_manager.upsert_rule("批量规则", "订单", "批量回复", "contains", position=0)
+    assert test_manager.version == version + 1, "批量操作应该只发布一个版本"
+    assert test_manager.find_reply("我的订单") == "批量回复", "批量操作应该一起生效"
+    
+    print("✅ 规则注册表测试通过！")
+
+def test_incremental_indexes():
+    """测试增量更新的索引与整体重新编译的结果一致"""
+    print("\n=== 增量索引测试 ===")
+    
+    rng = random.Random(5)
+    words = ["订单", "退款", "帮助", "你好", "发票", "运费", "查询", "地址"]
+    patterns = {
+        'exact': lambda: rng.choice(words),
+        'contains': lambda: rng.choice(words),
+        'regex': lambda: rng.choice([r"\d{3}", r"订单\d+", r"^帮", r"(退|查)款", r"[a-z]+"]),
+        'fuzzy': lambda: rng.choice(words) + rng.choice(["", "码"]),
+        'state': lambda: rng.choice(words + ["*"]),
+    }
+    states = ["", "menu"]
+    messages = [a + b for a in words + ["", "123", "abc"] for b in words + ["", "456"]] + ["帮助码", "退款吗"]
+    
+    test_manager = ReplyRuleManager()
+    test_manager.clear_rules()
+    names = []
+    for step in range(300):
+        action = rng.random()
+        if action < 0.5 or not names:
+            name = f"规则{rng.randrange(40)}"
+            rule_type = rng.choice(list(patterns))
+            before = rng.choice(names) if names and rng.random() < 0.3 else None
+            position = rng.randrange(len(names) + 1) if before is None and rng.random() < 0.3 else None
+            test_manager.upsert_rule(name, patterns[rule_type](), f"{name}回复{step}", rule_type,
+                                     before=before, position=position, state=rng.choice(states))
+        elif action < 0.7:
+            test_manager.move_rule(rng.choice(names), position=rng.randrange(len(names) + 1))
+        elif action < 0.85:
+            test_manager.remove_rule(rng.choice(names))
+        else:
+            with test_manager.batch_update():
+                for _ in range(3):
+                    test_manager.upsert_rule(f"规则{rng.randrange(40)}", rng.choice(words), "批量回复", "contains",
+                                             position=rng.randrange(len(names) + 1))
+        names = [rule.name for rule in test_manager.rules]
+        
+        snapshot = test_manager.get_rule_set()
+        rebuilt = CompiledRuleSet(0, snapshot.rules, {})
+        for message in messages:
+            for state in [None] + states:
+                actual = snapshot.match_rule(message, state=state)
+                expected = rebuilt.match_rule(message, state=state)
+                assert actual is expected, f"第{step}步输入 {message!r} 增量结果与重新编译不一致"
+    
+    # 只修改精确规则时，其他匹配层直接沿用
+    before = test_manager.get_rule_set()
+    test_manager.upsert_rule("新精确规则", "新关键词", "新回复", "exact")
+    after = test_manager.get_rule_set()
+    assert after.contains_automaton is before.contains_automaton, "包含匹配层不应重建"
+    assert after.regex_tier is before.regex_tier, "正则匹配层不应重建"
+    assert test_manager.find_reply("新关键词") == "新回复", "新规则应该生效"
+    
+    print(f"✅ {len(names)} 条规则经过300步随机修改，增量索引与重新编译一致")
+
 if __name__ == "__main__":
     try:
         test_exact_match_rules()
@@ -168,6 +357,11 @@ if __name__ == "__main__":
         test_rule_management()
         test_edge_cases()
         test_priority_order()
+        test_rule_set_snapshots()
+        test_concurrent_reload()
+        test_find_replies()
+        test_rule_registry()
+        test_incremental_indexes()
         
         print("\n🎉 所有回复规则测试通过！消息内容匹配和自动回复逻辑工作正常。")
     except Exception as e:
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+回复模板测试脚本
+用于测试模板编译、变量渲染、正则分组和模板规则的缓存绕过
+"""
+
+import pickle
+import re
+from datetime import datetime
+from reply_template import compile_template
+from reply_rules import ReplyRule, ReplyRuleManager
+from reply_cache import ReplyCache
+
+NOW = datetime(2024, 5, 20, 9, 5)
+
+def test_compile_template():
+    """测试模板编译和渲染"""
+    print("=== 模板编译测试 ===")
+
+    assert compile_template("固定回复") is None, "不含变量的回复不应编译为模板"
+    assert compile_template("{未知变量} 和 {{x}}") is None, "只有未知变量时按固定回复处理"
+
+    template = compile_template("{date} {time}，{weekday}")
+    assert template.render(now=NOW) == "2024-05-20 09:05，星期一", "时间变量渲染不正确"
+    template = compile_template("现在{time:%H点%M分}")
+    assert template.render(now=NOW) == "现在09点05分", "应该支持自定义时间格式"
+
+    template = compile_template("您好 {user}，您说的是“{content}”，{{原样}} {未知}")
+    assert template.render("查询", "oUSER") == "您好 oUSER，您说的是“查询”，{原样} {未知}", "用户变量或转义不正确"
+    assert template.render("查询") == "您好 ，您说的是“查询”，{原样} {未知}", "没有用户时应该为空字符串"
+
+    pattern = re.compile(r"订单(\d+)(?P<suffix>[a-z]*)")
+    template = compile_template("订单{1}{suffix}已发货，{2}", pattern)
+    match = pattern.search("查询订单123abc")
+    assert template.render(match=match) == "订单123abc已发货，abc", "正则分组渲染不正确"
+    assert compile_template("订单{3}", pattern) is None, "不存在的分组不应作为变量"
+
+    # 编译好的模板随规则写入编译缓存
+    restored = pickle.loads(pickle.dumps(compile_template("{date}{user}")))
+    assert restored.render("", "u", now=NOW) == "2024-05-20u", "模板应该可以序列化"
+
+    print("✅ 模板编译测试通过！")
+
+def test_template_rules():
+    """测试模板规则的回复和缓存"""
+    print("\n=== 模板规则测试 ===")
+
+    rule = ReplyRule("订单查询", r"订单(\d+)", "订单{1}正在处理", "regex")
+    assert rule.dynamic and rule.template is not None, "模板规则应该是动态规则"
+    assert not ReplyRule("固定", "你好", "你好+1").dynamic, "固定回复不应标记为动态"
+
+    manager = ReplyRuleManager()
+    manager.add_rule("订单查询", r"订单(\d+)", "订单{1}正在处理，{user}", "regex")
+    match = manager.find_match("我的订单１２３", "oUSER")
+    assert match.reply == "订单１２３正在处理，oUSER", f"分组应该取自原文: {match.reply}"
+    assert not match.cacheable, "模板规则的结果不能缓存"
+    manager.add_rule("自我介绍", r"我叫(\w+)", "你好 {1}", "regex")
+    assert manager.find_reply("我叫Tom") == "你好 Tom", "回显的分组应该保留原文的大小写"
+    manager.add_rule("编号查询", r"编号([a-z]\d+)", "编号{1}", "regex")
+    assert manager.find_reply("编号Ａ１２３") == "编号a123", "原文匹配不上时分组取自规范化后的消息"
+    assert manager.get_rule_set().evaluate("订单456") == ("订单查询", "订单456正在处理，"), "离线评估也应该渲染模板"
+
+    reply = manager.find_reply("现在什么时间")
+    assert re.fullmatch(r"现在是 \d{4}-\d{2}-\d{2} \d{2}:\d{2}。", reply), f"默认的时间询问规则应该回复当前时间: {reply}"
+
+    import wechat_handler
+    from wechat_handler import WeChatHandler
+
+    original = wechat_handler.reply_manager
+    wechat_handler.reply_manager = manager
+    try:
+        handler = WeChatHandler("test_token", reply_cache=ReplyCache(maxsize=16))
+        assert handler._generate_reply("订单1", "oA") == "订单1正在处理，oA", "应该渲染第一个用户"
+        assert handler._generate_reply("订单1", "oB") == "订单1正在处理，oB", "模板回复不应命中缓存"
+        assert len(handler.reply_cache) == 0, "模板回复不应写入缓存"
+    finally:
+        wechat_handler.reply_manager = original
+
+    print("✅ 模板规则测试通过！")
+
+if __name__ == "__main__":
+    try:
+        test_compile_template()
+        test_template_rules()
+
+        print("\n🎉 所有回复模板测试通过！")
+    except Exception as e:
+        print(f"\n❌ 测试失败: {str(e)}")
+        import traceback
+        traceback.print_exc()
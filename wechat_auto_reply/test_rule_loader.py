@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+规则文件加载测试脚本
+用于测试 JSON/CSV/SQLite 规则目录的加载和编译缓存的校验
+"""
+
+import csv
+import json
+import os
+import sqlite3
+import tempfile
+import rule_loader
+from rule_loader import RuleFileError, load_rules_file, read_rule_specs
+from reply_rules import ReplyRuleManager
+
+RULES = [
+    {"name": "问候", "pattern": "你好", "reply": "文件问候", "type": "exact"},
+    {"name": "物流", "pattern": "快递", "reply": "文件物流", "type": "contains"},
+    {"name": "订单号", "pattern": r"DD\d{6}", "reply": "文件订单", "type": "regex"},
+]
+
+def _write_json(directory, rules=RULES):
+    path = os.path.join(directory, 'rules.json')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(rules, f, ensure_ascii=False)
+    return path
+
+def test_load_formats():
+    """测试三种文件格式读出相同的规则"""
+    print("=== 规则文件格式测试 ===")
+    
+    with tempfile.TemporaryDirectory() as directory:
+        json_path = _write_json(directory)
+        
+        csv_path = os.path.join(directory, 'rules.csv')
+        with open(csv_path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=['name', 'pattern', 'reply', 'type'])
+            writer.writeheader()
+            writer.writerows(RULES)
+        
+        db_path = os.path.join(directory, 'rules.db')
+        conn = sqlite3.connect(db_path)
+        conn.execute("CREATE TABLE rules (name TEXT, pattern TEXT, reply TEXT, type TEXT)")
+        conn.executemany("INSERT INTO rules VALUES (:name, :pattern, :reply, :type)", RULES)
+        conn.commit()
+        conn.close()
+        
+        expected = read_rule_specs(json_path)
+        assert [spec['name'] for spec in expected] == ["问候", "物流", "订单号"], "规则顺序应与文件一致"
+        assert read_rule_specs(csv_path) == expected, "CSV 与 JSON 应读出相同规则"
+        assert read_rule_specs(db_path) == expected, "SQLite 与 JSON 应读出相同规则"
+    
+    print("✅ 规则文件格式测试通过！")
+
+def test_invalid_rule_file():
+    """测试格式错误的规则文件"""
+    print("\n=== 规则文件校验测试 ===")
+    
+    with tempfile.TemporaryDirectory() as directory:
+        path = _write_json(directory, [{"name": "缺少回复", "pattern": "x"}])
+        try:
+            read_rule_specs(path)
+            assert False, "缺少字段的规则应该报错"
+        except RuleFileError as e:
+            print(f"捕获到预期错误: {e}")
+        
+        path = _write_json(directory, [{"name": "未知类型", "pattern": "x", "reply": "y", "type": "magic"}])
+        try:
+            read_rule_specs(path)
+            assert False, "未知类型的规则应该报错"
+        except RuleFileError as e:
+            print(f"捕获到预期错误: {e}")
+    
+    print("✅ 规则文件校验测试通过！")
+
+def test_compiled_cache():
+    """测试编译缓存的复用与失效"""
+    print("\n=== 编译缓存测试 ===")
+    
+    with tempfile.TemporaryDirectory() as directory:
+        path = _write_json(directory)
+        manager = ReplyRuleManager()
+        
+        assert load_rules_file(manager, path) == 3, "应该加载3条规则"
+        assert os.path.exists(path + '.cache'), "首次加载应该写入编译缓存"
+        assert manager.find_reply("你好") == "文件问候", "文件规则应该替换默认规则"
+        assert manager.find_reply("我的快递呢") == "文件物流", "包含规则应该生效"
+        assert manager.find_reply("查询dd123456") == "文件订单", "正则规则应该生效"
+        assert manager.find_reply("谢谢") is not None, "函数规则应该保留"
+        
+        # 源文件未变化时直接使用缓存，不再解析规则文件
+        original = rule_loader.read_rule_specs
+        rule_loader.read_rule_specs = lambda p: (_ for _ in ()).throw(AssertionError("不应重新解析规则文件"))
+        try:
+            other = ReplyRuleManager()
+            assert load_rules_file(other, path) == 3, "应该从缓存加载3条规则"
+            assert other.find_reply("查询DD654321") == "文件订单", "缓存中的正则索引应该可用"
+        finally:
+            rule_loader.read_rule_specs = original
+        
+        # 源文件变化后缓存失效
+        _write_json(directory, RULES[:1])
+        assert load_rules_file(manager, path) == 1, "源文件变化后应该重新编译"
+        assert manager.find_reply("我的快递呢") != "文件物流", "已删除的规则不应生效"
+    
+    print("✅ 编译缓存测试通过！")
+
+def test_state_rule_fields():
+    """测试状态规则的 state 和 next_state 字段"""
+    print("\n=== 状态规则字段测试 ===")
+    
+    rules = [
+        {"name": "进入客服", "pattern": "客服", "reply": "回复1查询账单", "type": "state", "next_state": "menu"},
+        {"name": "账单", "pattern": "1", "reply": "账单100元", "type": "state", "state": "menu"},
+    ]
+    with tempfile.TemporaryDirectory() as directory:
+        path = _write_json(directory, rules)
+        specs = read_rule_specs(path)
+        assert specs[0]['state'] == "" and specs[0]['next_state'] == "menu", "缺省的状态应为空字符串"
+        
+        manager = ReplyRuleManager()
+        load_rules_file(manager, path)
+        other = ReplyRuleManager()
+        load_rules_file(other, path)
+        for target in (manager, other):
+            assert target.find_reply("客服", "oUSER") == "回复1查询账单", "应该进入流程"
+            assert target.find_reply("1", "oUSER") == "账单100元", "缓存加载的状态规则应该生效"
+    
+    print("✅ 状态规则字段测试通过！")
+
+if __name__ == "__main__":
+    try:
+        test_load_formats()
+        test_invalid_rule_file()
+        test_compiled_cache()
+        test_state_rule_fields()
+        
+        print("\n🎉 所有规则文件加载测试通过！")
+    except Exception as e:
+        print(f"\n❌ 测试失败: {str(e)}")
+        import traceback
+        traceback.print_exc()
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+规则统计测试脚本
+用于测试多线程计数、耗时直方图和规则信息中的统计输出
+"""
+
+import threading
+from rule_stats import RuleStats
+from reply_rules import ReplyRuleManager
+
+def test_concurrent_counters():
+    """测试多线程写入计数不丢失"""
+    print("=== 多线程计数测试 ===")
+    
+    stats = RuleStats()
+    
+    def worker():
+        for i in range(1000):
+            stats.record_rule("规则A", hits=i % 2, seconds=0.0002)
+    
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    entry = stats.snapshot()['rules']['规则A']
+    print(f"统计结果: {entry}")
+    assert entry['evaluations'] == 8000, "执行次数不应丢失"
+    assert entry['hits'] == 4000, "命中次数不应丢失"
+    assert entry['latency_histogram']['<=0.5ms'] == 8000, "耗时应该落入对应的桶"
+    
+    stats.reset()
+    assert stats.snapshot()['rules'] == {}, "重置后应该没有统计"
+    
+    print("✅ 多线程计数测试通过！")
+
+def test_thread_churn():
+    """测试线程结束后分片并入归档计数，分片数不随线程数增长"""
+    print("\n=== 线程更替测试 ===")
+    
+    stats = RuleStats()
+    for _ in range(50):
+        threads = [threading.Thread(target=stats.record_rule, args=("规则A",), kwargs={'hits': 1}) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    
+    print(f"存活分片数: {len(stats._shards)}")
+    assert len(stats._shards) <= 10, "已结束线程的分片应该被归档"
+    entry = stats.snapshot()['rules']['规则A']
+    assert entry['evaluations'] == 500 and entry['hits'] == 500, "归档时计数不应丢失"
+    
+    stats.reset()
+    assert stats.snapshot()['rules'] == {}, "重置后应该没有统计"
+    
+    print("✅ 线程更替测试通过！")
+
+def test_rules_info_stats():
+    """测试规则信息中的命中统计"""
+    print("\n=== 规则信息统计测试 ===")
+    
+    manager = ReplyRuleManager()
+    manager.find_reply("你好")
+    manager.find_reply("你好")
+    manager.find_reply("今天天气怎么样")
+    manager.find_reply("我的电话是13812345678")
+    manager.find_reply("谢谢")
+    
+    info = manager.get_rules_info()
+    rules = {rule['name']: rule['stats'] for rule in info['rules']}
+    functions = {rule['name']: rule for rule in info['function_rule_stats']}
+    
+    assert rules['问候回复']['hits'] == 2, "精确规则命中次数不正确"
+    assert rules['问候回复']['evaluations'] == 5, "精确规则执行次数应为精确匹配层的执行次数"
+    assert rules['天气询问']['hits'] == 1, "包含规则命中次数不正确"
+    assert rules['再见回复']['hits'] == 0, "未触发的规则命中次数应为0"
+    assert rules['电话号码']['hits'] == 1, "正则规则命中次数不正确"
+    assert rules['电话号码']['evaluations'] == 1, "只有通过预过滤的消息才计入正则执行次数"
+    assert sum(rules['电话号码']['latency_histogram'].values()) == 1, "单独执行的正则规则应该记录耗时"
+    assert functions['智能问答']['stats']['hits'] == 1, "函数规则命中次数不正确"
+    assert info['tiers']['exact']['evaluations'] == 5, "匹配层执行次数不正确"
+    
+    print("✅ 规则信息统计测试通过！")
+
+if __name__ == "__main__":
+    try:
+        test_concurrent_counters()
+        test_thread_churn()
+        test_rules_info_stats()
+        
+        print("\n🎉 所有规则统计测试通过！")
+    except Exception as e:
+        print(f"\n❌ 测试失败: {str(e)}")
+        import traceback
+        traceback.print_exc()
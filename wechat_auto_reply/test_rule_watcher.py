@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+规则文件热加载测试脚本
+用于测试文件变化检测、后台发布和加载失败时的回退
+"""
+
+import json
+import os
+import tempfile
+import time
+from reply_rules import ReplyRuleManager
+from rule_loader import load_rules_file
+from rule_watcher import RuleFileWatcher
+
+def _write_rules(path, reply):
+    # 先写临时文件再替换，模拟运维发布规则文件的方式
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump([{"name": "问候", "pattern": "你好", "reply": reply}], f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def test_reload_on_change():
+    """测试文件变化后重新加载"""
+    print("=== 规则文件变化检测测试 ===")
+    
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'rules.json')
+        _write_rules(path, "版本一")
+        manager = ReplyRuleManager()
+        load_rules_file(manager, path)
+        watcher = RuleFileWatcher(manager, path)
+        
+        assert not watcher.check(), "文件未变化时不应重新加载"
+        
+        _write_rules(path, "版本二")
+        assert watcher.check(), "文件变化后应该重新加载"
+        assert manager.find_reply("你好") == "版本二", "新规则应该生效"
+        
+        status = watcher.get_status()
+        print(f"热加载状态: {status}")
+        assert status['reload_count'] == 1, "重新加载次数不正确"
+        assert status['last_reload']['rule_count'] == 1, "应该报告规则数量"
+        assert status['last_reload']['duration_ms'] >= 0, "应该报告加载耗时"
+        
+        # 损坏的文件不影响当前规则
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write("[{")
+        assert watcher.check(), "文件变化后应该尝试重新加载"
+        assert manager.find_reply("你好") == "版本二", "加载失败时应该保留当前规则"
+        assert not watcher.get_status()['last_reload']['success'], "应该报告加载失败"
+    
+    print("✅ 规则文件变化检测测试通过！")
+
+def test_background_thread():
+    """测试后台线程自动热加载"""
+    print("\n=== 后台热加载测试 ===")
+    
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'rules.json')
+        _write_rules(path, "旧回复")
+        manager = ReplyRuleManager()
+        load_rules_file(manager, path)
+        
+        watcher = RuleFileWatcher(manager, path, interval=0.02)
+        watcher.start()
+        try:
+            _write_rules(path, "新回复")
+            deadline = time.monotonic() + 2
+            while manager.find_reply("你好") != "新回复" and time.monotonic() < deadline:
+                time.sleep(0.01)
+            assert manager.find_reply("你好") == "新回复", "后台线程应该发布新规则"
+        finally:
+            watcher.stop(timeout=1)
+    
+    print("✅ 后台热加载测试通过！")
+
+if __name__ == "__main__":
+    try:
+        test_reload_on_change()
+        test_background_thread()
+        
+        print("\n🎉 所有规则文件热加载测试通过！")
+    except Exception as e:
+        print(f"\n❌ 测试失败: {str(e)}")
+        import traceback
+        traceback.print_exc()
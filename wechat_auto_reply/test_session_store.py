@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+会话状态存储测试脚本
+用于测试状态读写、时间轮过期、LRU淘汰、内存上限和多轮流程的状态规则
+"""
+
+from session_store import SessionStore, SESSION_ENTRY_OVERHEAD
+from reply_rules import ReplyRuleManager
+from reply_cache import ReplyCache
+
+class FakeClock:
+    """可手动拨动的时钟"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def test_state_and_expiry():
+    """测试状态读写和按时间轮过期"""
+    print("=== 状态读写和过期测试 ===")
+
+    clock = FakeClock()
+    store = SessionStore(ttl=10, clock=clock)
+
+    store.set_state("user_a", "menu")
+    assert store.get_state("user_a") == "menu", "应该读到刚写入的状态"
+    assert store.get_state("user_b") is None, "没有会话的用户应该返回None"
+
+    clock.now += 5
+    store.set_state("user_b", "billing", ttl=3)
+    clock.now += 4
+    assert store.get_state("user_b") is None, "自定义有效期到期后应该过期"
+    assert store.get_state("user_a") == "menu", "未到期的会话应该保留"
+
+    # 写入状态会续期，读取不续期
+    store.set_state("user_a", "shipping")
+    clock.now += 9
+    assert store.get_state("user_a") == "shipping", "续期后的会话不应过期"
+    clock.now += 2
+    assert store.get_state("user_a") is None, "超过有效期的会话应该过期"
+
+    # 长时间无访问后，时间轮一次清空全部过期会话
+    for i in range(100):
+        store.set_state(f"user_{i}", "menu")
+    clock.now += 3600
+    assert store.expire() == 0, "全部会话都应该过期"
+    assert store.stats()['memory_bytes'] == 0, "过期后内存计数应该归零"
+
+    store.set_state("user_c", "menu")
+    store.set_state("user_c", None)
+    assert store.get_state("user_c") is None, "状态为空时应该结束会话"
+
+    print("✅ 状态读写和过期测试通过！")
+
+def test_bounded_size():
+    """测试条数和内存上限下的LRU淘汰"""
+    print("\n=== 容量上限测试 ===")
+
+    store = SessionStore(ttl=60, max_sessions=3)
+    for user_id in ("a", "b", "c"):
+        store.set_state(user_id, "menu")
+    store.get_state("a")
+    store.set_state("d", "menu")
+    assert store.get_state("b") is None, "最久未使用的会话应该被淘汰"
+    assert store.get_state("a") == "menu", "最近读取过的会话应该保留"
+    assert len(store) == 3 and store.evictions == 1, "会话数不应超过上限"
+
+    # 内存上限按估算值计算，写入再多会话内存计数也不超过上限
+    max_bytes = 50 * (SESSION_ENTRY_OVERHEAD + 80)
+    store = SessionStore(ttl=60, max_bytes=max_bytes)
+    for i in range(10000):
+        store.set_state(f"oUSER{i:023d}", "menu")
+    stats = store.stats()
+    print(f"会话统计: {stats}")
+    assert stats['memory_bytes'] <= max_bytes, "内存计数不应超过上限"
+    assert stats['size'] <= 50 and stats['evictions'] == 10000 - stats['size'], "超出内存上限的会话应该被淘汰"
+
+    print("✅ 容量上限测试通过！")
+
+def test_state_rules():
+    """测试状态规则驱动的多轮流程"""
+    print("\n=== 状态规则测试 ===")
+
+    manager = ReplyRuleManager(sessions=SessionStore(ttl=60))
+    manager.add_rule("一号", "1", "普通规则回复1", "exact")
+    manager.add_state_rule("进入客服", "", "客服", "回复1查询账单，回复2查询物流", next_state="menu")
+    manager.add_state_rule("账单", "menu", "1", "您本月账单为100元", next_state="")
+    manager.add_state_rule("物流", "menu", "2", "请输入订单号", next_state="tracking")
+    manager.add_state_rule("物流查询", "tracking", "*", "订单正在配送中")
+    manager.add_state_rule("菜单兜底", "menu", "*", "请回复1或2", next_state="menu")
+
+    user = "oUSER_1"
+    assert manager.find_reply("客服", user).startswith("回复1"), "入口输入应该进入流程"
+    assert manager.sessions.get_state(user) == "menu", "应该进入菜单状态"
+    assert manager.find_reply("3", user) == "请回复1或2", "菜单状态下的其他输入应该命中通配规则"
+    assert manager.find_reply("１", user) == "您本月账单为100元", "状态规则的输入应该规范化"
+    assert manager.sessions.get_state(user) is None, "下一状态为空时应该结束流程"
+    assert manager.find_reply("1", user) == "普通规则回复1", "流程结束后应该使用普通规则"
+
+    manager.find_reply("客服", user)
+    manager.find_reply("2", user)
+    match = manager.find_match("SF123456", user)
+    assert match.reply == "订单正在配送中" and not match.cacheable, "状态规则的结果不能缓存"
+
+    assert manager.find_reply("客服") is None, "没有用户OpenID时不检查状态规则"
+    assert not manager.find_match("你好").cacheable, "存在状态规则时匿名查询的结果不应缓存"
+    assert manager.find_match("你好", "oUSER_2").cacheable, "不在流程中的用户的普通结果可以缓存"
+
+    rule_set = manager.get_rule_set()
+    assert rule_set.evaluate("客服")[0] == "进入客服", "离线评估应该按不在流程中的用户处理"
+
+    print("✅ 状态规则测试通过！")
+
+def test_handler_skips_cache_in_flow():
+    """测试流程中的用户不使用回复缓存"""
+    print("\n=== 流程中绕过缓存测试 ===")
+
+    import wechat_handler
+    from wechat_handler import WeChatHandler
+
+    manager = ReplyRuleManager(sessions=SessionStore(ttl=60))
+    manager.add_rule("一号", "1", "普通规则回复1", "exact")
+    manager.add_state_rule("进入客服", "", "客服", "回复1查询账单", next_state="menu")
+    manager.add_state_rule("账单", "menu", "1", "您本月账单为100元")
+
+    original = wechat_handler.reply_manager
+    wechat_handler.reply_manager = manager
+    try:
+        handler = WeChatHandler("test_token", reply_cache=ReplyCache(maxsize=16))
+        assert handler._generate_reply("1", "oUSER_1") == "普通规则回复1", "不在流程中时命中普通规则"
+        assert handler._generate_reply("客服", "oUSER_2") == "回复1查询账单", "应该进入流程"
+        assert handler._generate_reply("1", "oUSER_2") == "您本月账单为100元", "流程中不应命中缓存的普通回复"
+        assert handler._generate_reply("客服", "oUSER_3") == "回复1查询账单", "流程入口的回复不应被缓存跳过"
+    finally:
+        wechat_handler.reply_manager = original
+
+    print("✅ 流程中绕过缓存测试通过！")
+
+if __name__ == "__main__":
+    try:
+        test_state_and_expiry()
+        test_bounded_size()
+        test_state_rules()
+        test_handler_skips_cache_in_flow()
+
+        print("\n🎉 所有会话状态测试通过！")
+    except Exception as e:
+        print(f"\n❌ 测试失败: {str(e)}")
+        import traceback
+        traceback.print_exc()
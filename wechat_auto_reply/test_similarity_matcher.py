@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+相似问题匹配测试脚本
+用于测试 n-gram 切分、相似度匹配、批量路径与单条路径的一致性
+"""
+
+from similarity_matcher import SimilarityMatcher, char_ngrams
+from reply_rules import ReplyRuleManager
+from benchmark_faq import generate_faq, generate_queries
+
+FAQ = [
+    ("如何修改密码", "请在 设置-账号安全 中修改密码"),
+    ("怎么申请退款", "在订单详情页点击申请退款"),
+    ("发票怎么开", "请联系客服开具发票"),
+    ("运费是多少", "满99元包邮"),
+]
+
+def test_char_ngrams():
+    """测试字符 n-gram 切分"""
+    print("=== n-gram 切分测试 ===")
+
+    assert char_ngrams("密码") == ["密", "码", "密码"], "应该同时包含单字和二元组"
+    assert char_ngrams("a，b", (1, 2)) == ["a", "b"], "标点处应该断开"
+    assert char_ngrams("修改密码", (2, 2)) == ["修改", "改密", "密码"], "应该支持指定长度范围"
+
+    print("✅ n-gram 切分测试通过！")
+
+def test_similarity_match():
+    """测试错别字和改写的匹配"""
+    print("\n=== 相似度匹配测试 ===")
+
+    matcher = SimilarityMatcher(FAQ)
+
+    doc_id, score = matcher.match("如何修改密码")
+    assert doc_id == 0 and abs(score - 1.0) < 1e-5, f"相同问题的相似度应为1: {score}"
+    assert matcher.answer("如何修改蜜码") == FAQ[0][1], "含错别字的问题应该命中"
+    assert matcher.answer("发票怎么开呀") == FAQ[2][1], "加语气词的问题应该命中"
+    assert matcher.answer("今天天气怎么样") is None, "相似度不足时不应回复"
+    assert matcher.answer("？？？") is None, "没有有效字符时不应回复"
+    assert SimilarityMatcher([]).match("密码") is None, "空问答库不应报错"
+
+    print("✅ 相似度匹配测试通过！")
+
+def test_batch_matches_single():
+    """测试批量路径与单条路径结果一致"""
+    print("\n=== 批量匹配一致性测试 ===")
+
+    entries = generate_faq(2000)
+    matcher = SimilarityMatcher(entries)
+    queries = generate_queries(entries, 300) + ["", "！！"]
+
+    single = [matcher.match(query) for query in queries]
+    batch = matcher.match_batch(queries, chunk_size=37)
+    assert len(batch) == len(queries), "批量结果应该与输入一一对应"
+    for query, a, b in zip(queries, single, batch):
+        assert (a is None) == (b is None), f"查询 {query!r} 的命中结果不一致"
+        if a is not None:
+            assert a[0] == b[0] and abs(a[1] - b[1]) < 1e-4, f"查询 {query!r} 的匹配结果不一致: {a} != {b}"
+
+    answers = matcher.answer_batch(queries[:10])
+    assert answers == [matcher.answer(query) for query in queries[:10]], "批量回复应该与逐条回复一致"
+
+    print(f"✅ {len(queries)} 条查询的批量结果与逐条结果一致")
+
+def test_register_function_rule():
+    """测试注册为函数规则"""
+    print("\n=== 函数规则注册测试 ===")
+
+    manager = ReplyRuleManager()
+    manager.clear_rules()
+    SimilarityMatcher(FAQ).register(manager)
+
+    match = manager.find_match("怎么申请退歀")
+    assert match.rule_name == "相似问题匹配" and match.reply == FAQ[1][1], f"应该通过函数规则回复: {match}"
+
+    print("✅ 函数规则注册测试通过！")
+
+if __name__ == "__main__":
+    try:
+        test_char_ngrams()
+        test_similarity_match()
+        test_batch_matches_single()
+        test_register_function_rule()
+
+        print("\n🎉 所有相似问题匹配测试通过！")
+    except Exception as e:
+        print(f"\n❌ 测试失败: {str(e)}")
+        import traceback
+        traceback.print_exc()
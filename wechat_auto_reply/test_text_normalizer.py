@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+文本规范化测试脚本
+用于测试全半角折叠、大小写折叠、首尾标点处理以及各匹配层对规范化视图的使用
+"""
+
+from text_normalizer import fold_text, normalize_key, normalize_message
+from reply_rules import ReplyRuleManager
+
+def test_normalized_views():
+    """测试规范化视图"""
+    print("=== 规范化视图测试 ===")
+    
+    view = normalize_message("  ＨｅＬＬｏ，Ｗｏｒｌｄ！ ")
+    print(f"规范化结果: {view}")
+    assert view.text == "ＨｅＬＬｏ，Ｗｏｒｌｄ！", "原文只去除首尾空白"
+    assert view.folded == "hello,world!", "全角字符应该折叠为半角并转为小写"
+    assert view.key == "hello,world", "精确匹配键应该去掉首尾标点"
+    
+    assert normalize_key("你好！！") == "你好", "中文感叹号应该被去掉"
+    assert normalize_key("【你好】") == "你好", "首尾括号应该被去掉"
+    assert normalize_key("？？") == "??", "全部是标点时保留折叠后的文本"
+    assert fold_text("Straße") == "strasse", "大小写折叠应该处理特殊字母"
+    
+    assert normalize_message("你好") is normalize_message("你好"), "相同消息应该复用规范化结果"
+    
+    print("✅ 规范化视图测试通过！")
+
+def test_matching_uses_normalized_view():
+    """测试各匹配层使用规范化视图"""
+    print("\n=== 规范化匹配测试 ===")
+    
+    manager = ReplyRuleManager()
+    manager.add_rule("全角规则", "ＶＩＰ", "会员回复", "contains")
+    
+    assert manager.find_reply("你好！") == "你好+1", "带标点的消息应该命中精确规则"
+    assert manager.find_reply("【帮助】") is not None, "带括号的消息应该命中精确规则"
+    assert manager.find_reply("ｈｅｌｌｏ") == "您好！很高兴为您服务，有什么可以帮助您的吗？", "全角英文应该命中意图"
+    assert manager.find_reply("我是vip") == "会员回复", "全角模式应该在编译时规范化"
+    assert manager.find_reply("电话１３８１２３４５６７８") == "检测到电话号码，请注意保护个人隐私信息。", "全角数字应该命中正则"
+    
+    print("✅ 规范化匹配测试通过！")
+
+if __name__ == "__main__":
+    try:
+        test_normalized_views()
+        test_matching_uses_normalized_view()
+        
+        print("\n🎉 所有文本规范化测试通过！")
+    except Exception as e:
+        print(f"\n❌ 测试失败: {str(e)}")
+        import traceback
+        traceback.print_exc()
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+安全模式加解密测试脚本
+用于测试消息加解密、msg_signature 校验、错误密文的处理和处理器的加密消息收发
+"""
+
+import base64
+import struct
+import xml.etree.ElementTree as ET
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from flask import Flask, request
+import xml_samples
+from wechat_crypto import CryptoError, WeChatCrypto, compute_signature, derive_key
+from wechat_handler import WeChatHandler
+
+TOKEN = "test_token"
+ENCODING_AES_KEY = "abcdefghijklmnopqrstuvwxyz0123456789ABCDEFG"
+APPID = "wx1234567890abcdef"
+
+def reference_decrypt(encrypt):
+    """按微信官方示例的步骤解密，用于检查格式兼容"""
+    key = base64.b64decode(ENCODING_AES_KEY + '=')
+    decryptor = Cipher(algorithms.AES(key), modes.CBC(key[:16])).decryptor()
+    plain = decryptor.update(base64.b64decode(encrypt)) + decryptor.finalize()
+    content = plain[16:-plain[-1]]
+    length = struct.unpack('>I', content[:4])[0]
+    return content[4:4 + length], content[4 + length:]
+
+def test_encrypt_decrypt():
+    """测试加解密和密钥缓存"""
+    print("=== 加解密测试 ===")
+
+    crypto = WeChatCrypto(TOKEN, ENCODING_AES_KEY, APPID)
+    key, iv = derive_key(ENCODING_AES_KEY)
+    assert len(key) == 32 and iv == key[:16], "密钥应该为32字节，初始向量为密钥前16字节"
+    assert derive_key(ENCODING_AES_KEY) is derive_key(ENCODING_AES_KEY), "派生的密钥应该被缓存"
+
+    for message in (b'', b'<xml/>', xml_samples.TEXT_MESSAGE_SAMPLE.encode('utf-8'), b'x' * 4000):
+        encrypt = crypto.encrypt(message)
+        assert len(base64.b64decode(encrypt)) % 32 == 0, "填充后应该是32字节的整数倍"
+        assert bytes(crypto.decrypt(encrypt)) == message, "解密结果应该与原文一致"
+        assert reference_decrypt(encrypt) == (message, APPID.encode()), "应该与官方示例的格式一致"
+    assert crypto.encrypt(b'same') != crypto.encrypt(b'same'), "每次加密应该使用新的随机串"
+
+    # 解密结果是 memoryview 切片
+    assert isinstance(crypto.decrypt(crypto.encrypt(b'<xml/>')), memoryview)
+
+    print("✅ 加解密测试通过！")
+
+def test_invalid_input():
+    """测试签名错误、密文损坏和 AppID 不匹配"""
+    print("\n=== 错误输入测试 ===")
+
+    crypto = WeChatCrypto(TOKEN, ENCODING_AES_KEY, APPID)
+    encrypt = crypto.encrypt(b'<xml/>').decode('ascii')
+    signature = compute_signature(TOKEN, '1409304348', 'xxxxxx', encrypt)
+    assert crypto.check_signature(signature, '1409304348', 'xxxxxx', encrypt)
+    assert not crypto.check_signature(signature, '1409304349', 'xxxxxx', encrypt), "时间戳不同时签名应该不通过"
+    assert not crypto.check_signature('签名', '1409304348', 'xxxxxx', encrypt), "非ASCII签名应该不通过"
+    assert not crypto.check_signature('', '1409304348', 'xxxxxx', encrypt)
+
+    for bad in ('not base64!', base64.b64encode(b'short').decode(), ''):
+        try:
+            crypto.decrypt(bad)
+            assert False, f"应该拒绝密文: {bad!r}"
+        except CryptoError:
+            pass
+
+    other = WeChatCrypto(TOKEN, ENCODING_AES_KEY, 'wx_other_app')
+    try:
+        other.decrypt(encrypt)
+        assert False, "AppID 不匹配时应该拒绝"
+    except CryptoError:
+        pass
+    assert bytes(WeChatCrypto(TOKEN, ENCODING_AES_KEY).decrypt(encrypt)) == b'<xml/>', "未配置 AppID 时不校验"
+
+    try:
+        WeChatCrypto(TOKEN, 'too_short')
+        assert False, "EncodingAESKey 长度错误时应该拒绝"
+    except CryptoError:
+        pass
+
+    print("✅ 错误输入测试通过！")
+
+def test_handler_safe_mode():
+    """测试处理器收发加密消息"""
+    print("\n=== 处理器安全模式测试 ===")
+
+    app = Flask(__name__)
+    crypto = WeChatCrypto(TOKEN, ENCODING_AES_KEY, APPID)
+    handler = WeChatHandler(TOKEN, crypto=crypto)
+    encrypt = crypto.encrypt(xml_samples.TEXT_MESSAGE_SAMPLE.encode('utf-8')).decode('ascii')
+    body = f"<xml><ToUserName><![CDATA[gh_123456789abc]]></ToUserName><Encrypt><![CDATA[{encrypt}]]></Encrypt></xml>"
+    query = {
+        'timestamp': '1409304348', 'nonce': 'xxxxxx', 'encrypt_type': 'aes',
+        'msg_signature': compute_signature(TOKEN, '1409304348', 'xxxxxx', encrypt)
+    }
+
+    with app.test_request_context('/wechat', method='POST', data=body, query_string=query):
+        response = handler.handle_message(request)
+    root = ET.fromstring(response.get_data())
+    reply_encrypt = root.find('Encrypt').text
+    assert root.find('MsgSignature').text == compute_signature(
+        TOKEN, root.find('TimeStamp').text, 'xxxxxx', reply_encrypt
+    ), "回复的签名应该正确"
+    reply = ET.fromstring(bytes(crypto.decrypt(reply_encrypt)))
+    assert reply.find('Content').text == '你好+1' and reply.find('ToUserName').text == 'oUser123456789'
+
+    # 签名错误时不解密，直接拒绝
+    decrypted = []
+    original_decrypt = crypto.decrypt
+    crypto.decrypt = lambda value: decrypted.append(value) or original_decrypt(value)
+    handler.idempotency.clear()
+    with app.test_request_context('/wechat', method='POST', data=body,
+                                  query_string=dict(query, msg_signature='0' * 40)):
+        assert handler.handle_message(request).status_code == 403, "签名错误应该返回403"
+    assert not decrypted, "签名校验通过之前不应该解密"
+
+    # 开启安全模式后拒绝明文请求，不能绕过 msg_signature 校验
+    with app.test_request_context('/wechat', method='POST', data=xml_samples.TEXT_MESSAGE_SAMPLE.encode('utf-8')):
+        assert handler.handle_message(request).status_code == 403, "安全模式下明文请求应该返回403"
+    with app.test_request_context('/wechat', method='POST', data=xml_samples.TEXT_MESSAGE_SAMPLE.encode('utf-8'),
+                                  query_string=dict(query, encrypt_type='raw')):
+        assert handler.handle_message(request).status_code == 403, "安全模式下明文请求应该返回403"
+    
+    # 没有配置密钥时明文请求照常处理
+    with app.test_request_context('/wechat', method='POST', data=xml_samples.TEXT_MESSAGE_SAMPLE.encode('utf-8')):
+        assert '你好+1'.encode('utf-8') in WeChatHandler(TOKEN).handle_message(request).get_data()
+
+    # 没有配置密钥时不处理加密消息
+    with app.test_request_context('/wechat', method='POST', data=body, query_string=query):
+        assert WeChatHandler(TOKEN).handle_message(request).get_data() == b'success'
+
+    print("✅ 处理器安全模式测试通过！")
+
+if __name__ == "__main__":
+    try:
+        test_encrypt_decrypt()
+        test_invalid_input()
+        test_handler_safe_mode()
+
+        print("\n🎉 所有安全模式加解密测试通过！")
+    except Exception as e:
+        print(f"\n❌ 测试失败: {str(e)}")
+        import traceback
+        traceback.print_exc()
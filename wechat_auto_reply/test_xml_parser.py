@@ -4,8 +4,12 @@ XML消息解析测试脚本
 用于测试微信XML消息的解析和处理功能
 """
 
+import time
 import xml.etree.ElementTree as ET
+from flask import Flask, request
 from wechat_handler import WeChatHandler
+from xml_parser import parse_message, parse_xml_fields, XMLFormatError
+import xml_samples
 
 # 测试用的XML消息样例
 SAMPLE_TEXT_MESSAGE = """<xml>
@@ -125,6 +129,109 @@ def test_empty_xml_handling():
     
     print("✅ 空XML处理测试通过！")
 
+def test_parser_matches_element_tree():
+    """测试单次扫描解析器与ElementTree的结果一致"""
+    print("\n=== 解析器一致性测试 ===")
+    
+    for name in dir(xml_samples):
+        if not name.endswith('_SAMPLE'):
+            continue
+        sample = getattr(xml_samples, name)
+        root = ET.fromstring(sample)
+        expected = {
+            element.tag: element.text or ''
+            for element in root.iter()
+            if element is not root and len(element) == 0
+        }
+        assert parse_xml_fields(sample) == expected, f"{name} 的解析结果与ElementTree不一致"
+        assert parse_xml_fields(sample.encode('utf-8')) == expected, f"{name} 应该支持字节输入"
+    
+    # 事件、语音识别、位置等字段都应该提取出来
+    event = parse_message(xml_samples.CLICK_EVENT_SAMPLE)
+    assert event['Event'] == 'CLICK' and event['EventKey'], "应该提取事件字段"
+    assert event['Content'] == '' and event['MsgId'] == '', "缺失的基本字段应为空字符串"
+    location = parse_message(xml_samples.LOCATION_MESSAGE_SAMPLE)
+    assert location['Location_X'] and location['Label'], "应该提取位置字段"
+    voice = parse_message(xml_samples.VOICE_MESSAGE_SAMPLE)
+    assert voice['Recognition'] == '语音识别结果', "应该提取语音识别结果"
+    
+    print("✅ 解析器一致性测试通过！")
+
+def test_parser_edge_cases():
+    """测试实体、CDATA和恶意XML"""
+    print("\n=== 解析器边界情况测试 ===")
+    
+    fields = parse_xml_fields(
+        '<?xml version="1.0" encoding="utf-8"?>\n<xml><!-- 注释 -->'
+        '<Content>a &lt; b &amp; &#x4F60;&#22909;</Content>'
+        '<Title><![CDATA[x]]]]><![CDATA[>y]]></Title><Empty/></xml>'
+    )
+    assert fields == {'Content': 'a < b & 你好', 'Title': 'x]]>y', 'Empty': ''}, f"实体或CDATA处理不正确: {fields}"
+    
+    # 实体膨胀攻击和外部实体
+    bomb = ('<?xml version="1.0"?><!DOCTYPE xml [<!ENTITY a "aaaaaaaaaa">'
+            '<!ENTITY b "&a;&a;&a;&a;&a;&a;&a;&a;&a;&a;">]><xml><Content>&b;</Content></xml>')
+    external = '<!DOCTYPE xml [<!ENTITY x SYSTEM "file:///etc/passwd">]><xml><Content>&x;</Content></xml>'
+    for payload in (bomb, external, '<xml><Content>&x;</Content></xml>', '<xml><Content>a & b</Content></xml>'):
+        try:
+            parse_xml_fields(payload)
+        except XMLFormatError:
+            continue
+        raise AssertionError(f"应该拒绝: {payload}")
+    
+    for payload in ('<xml><A>1</B></xml>', '<xml><A>1</A></xml><xml/>', '<xml><A>1</A>'):
+        assert parse_message(payload) is None, f"格式错误应该返回None: {payload}"
+    
+    # 大量未闭合的CDATA或注释不应导致二次方的扫描时间
+    start = time.perf_counter()
+    for payload in ('<xml>' + '<a><![CDATA[' * 5000, '<xml>' + '<!--' * 15000):
+        assert parse_message(payload) is None, "未闭合的CDATA或注释应该返回None"
+    assert time.perf_counter() - start < 1, "恶意输入的解析耗时过长"
+    
+    # 多个已闭合的CDATA段后跟一个未闭合的CDATA段，逐个元素扫描失败时不应指数回溯
+    start = time.perf_counter()
+    for count in (22, 30, 2000):
+        nested = '<![CDATA[x]]>y' * count + '<![CDATA['
+        for payload in ('<xml><a>' + nested, '<xml><ToUserName>a</ToUserName><Content>' + nested + '</Content></xml>'):
+            assert parse_message(payload) is None, "未闭合的CDATA应该返回None"
+    assert time.perf_counter() - start < 1, "多段CDATA的恶意输入解析耗时过长"
+    
+    # memoryview 切片直接解析，不需要先复制为 bytes
+    framed = b'\x00' * 20 + SAMPLE_TEXT_MESSAGE.encode('utf-8') + b'appid'
+    view = memoryview(framed)[20:-5]
+    assert parse_message(view)['Content'] == '你好', "应该支持 memoryview 切片"
+    
+    print("✅ 解析器边界情况测试通过！")
+
+def test_request_body():
+    """测试请求体按字节读取和大小上限"""
+    print("\n=== 请求体读取测试 ===")
+    
+    app = Flask(__name__)
+    handler = WeChatHandler("test_token", max_body_size=1024)
+    payload = SAMPLE_TEXT_MESSAGE.encode('utf-8')
+    
+    with app.test_request_context('/wechat', method='POST', data=payload):
+        response = handler.handle_message(request)
+        assert response.status_code == 200, "正常消息应该返回200"
+        assert response.headers['Content-Length'] == str(len(response.get_data())), "Content-Length 不正确"
+        assert '你好+1' in response.get_data(as_text=True), "应该回复匹配的内容"
+    
+    oversized = payload.replace('你好'.encode('utf-8'), b'x' * 2048)
+    with app.test_request_context('/wechat', method='POST', data=oversized):
+        response = handler.handle_message(request)
+        assert response.status_code == 413, "超过上限的请求体应该返回413"
+    
+    # 没有 Content-Length 时按实际读取的长度检查
+    class StreamRequest:
+        def get_data(self):
+            return oversized
+    
+    with app.app_context():
+        assert handler.handle_message(StreamRequest()).status_code == 413, "读取后超过上限也应该返回413"
+    
+    print("✅ 请求体读取测试通过！")
+
 def test_reply_xml_generation():
     """测试回复XML生成"""
     print("\n=== 回复XML生成测试 ===")
@@ -189,6 +296,9 @@ if __name__ == "__main__":
         test_voice_message_parsing()
         test_malformed_xml_handling()
         test_empty_xml_handling()
+        test_parser_matches_element_tree()
+        test_parser_edge_cases()
+        test_request_body()
         test_reply_xml_generation()
         test_complete_message_flow()
         
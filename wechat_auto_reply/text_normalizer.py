@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+文本规范化
+每条消息只规范化一次，生成供各匹配层共用的规范化视图
+"""
+
+import re
+import unicodedata
+from functools import lru_cache
+
+# 参与缓存的最大消息长度，超长消息直接计算，避免缓存占用过多内存
+CACHEABLE_LENGTH = 256
+
+# 首尾的标点、符号和空白
+_EDGE_PUNCT_RE = re.compile(r'^[\W_]+|[\W_]+$')
+
+class NormalizedText:
+    """
+    消息的规范化视图
+    text：去除首尾空白的原文
+    folded：NFKC（全角转半角等兼容字符折叠）后再做大小写折叠，用于包含匹配和正则匹配
+    key：在 folded 基础上去掉首尾标点，用于精确匹配和缓存键；全部是标点时与 folded 相同
+    """
+    
+    __slots__ = ('text', 'folded', 'key')
+    
+    def __init__(self, text: str):
+        """
+        规范化消息
+        :param text: 原始消息
+        """
+        self.text = text.strip()
+        self.folded = fold_text(self.text)
+        self.key = _EDGE_PUNCT_RE.sub('', self.folded) or self.folded
+    
+    def __repr__(self):
+        return f"NormalizedText({self.text!r}, key={self.key!r})"
+
+def fold_text(text: str) -> str:
+    """
+    兼容字符折叠和大小写折叠
+    :param text: 原始文本
+    :return: 折叠后的文本
+    """
+    return unicodedata.normalize('NFKC', text).casefold()
+
+@lru_cache(maxsize=4096)
+def _normalize_cached(text: str) -> NormalizedText:
+    return NormalizedText(text)
+
+def normalize_message(text: str) -> NormalizedText:
+    """
+    获取消息的规范化视图，短消息的结果会被缓存，同一条消息在处理链路中只计算一次
+    :param text: 原始消息
+    :return: 规范化视图
+    """
+    if len(text) > CACHEABLE_LENGTH:
+        return NormalizedText(text)
+    return _normalize_cached(text)
+
+def normalize_key(text: str) -> str:
+    """
+    计算精确匹配使用的规范化键，规则模式在编译时用它处理
+    :param text: 原始文本
+    :return: 规范化键
+    """
+    return normalize_message(text).key
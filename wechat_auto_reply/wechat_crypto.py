@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+安全模式消息加解密
+安全模式下消息体为 AES-256-CBC 加密后的 Base64 文本，请求带有 msg_signature。
+处理顺序：先校验 msg_signature，通过后才解密；明文的长度前缀、PKCS#7 填充和 AppID 在字节上按偏移处理，
+解密结果以 memoryview 切片交给解析器，不复制消息内容
+"""
+
+import binascii
+import hashlib
+import hmac
+import os
+import struct
+import time
+from functools import lru_cache
+from typing import Optional, Tuple, Union
+from reply_builder import cdata
+
+try:
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+except ImportError:  # 未安装 cryptography 时不能使用安全模式
+    Cipher = None
+
+# EncodingAESKey 为43个字符，补一个 = 后 Base64 解码得到32字节的AES密钥
+ENCODING_AES_KEY_LENGTH = 43
+# 微信的 PKCS#7 填充按32字节分组（AES分组仍为16字节）
+PAD_BLOCK_SIZE = 32
+# 明文格式：16字节随机串 + 4字节网络字节序的消息长度 + 消息 + AppID
+_RANDOM_SIZE = 16
+_HEADER_SIZE = _RANDOM_SIZE + 4
+_LENGTH = struct.Struct('>I')
+
+# 加密回复预先编码为字节模板
+_ENCRYPTED_REPLY_TEMPLATE = (
+    b'<xml>\n<Encrypt><![CDATA[%s]]></Encrypt>\n<MsgSignature><![CDATA[%s]]></MsgSignature>\n'
+    b'<TimeStamp>%d</TimeStamp>\n<Nonce><![CDATA[%s]]></Nonce>\n</xml>'
+)
+
+class CryptoError(ValueError):
+    """加密消息格式错误、解密失败或 AppID 不匹配"""
+
+@lru_cache(maxsize=16)
+def derive_key(encoding_aes_key: str) -> Tuple[bytes, bytes]:
+    """
+    由 EncodingAESKey 得到AES密钥和初始向量，结果按 EncodingAESKey 缓存
+    :param encoding_aes_key: 公众号后台配置的 EncodingAESKey
+    :return: (32字节密钥, 取密钥前16字节的初始向量)
+    :raises CryptoError: EncodingAESKey 格式错误
+    """
+    if len(encoding_aes_key) != ENCODING_AES_KEY_LENGTH:
+        raise CryptoError(f"EncodingAESKey 长度应为{ENCODING_AES_KEY_LENGTH}个字符")
+    try:
+        key = binascii.a2b_base64(encoding_aes_key + '=')
+    except binascii.Error as e:
+        raise CryptoError(f"EncodingAESKey 格式错误: {str(e)}")
+    return key, key[:16]
+
+def compute_signature(token: str, timestamp: str, nonce: str, encrypt: str) -> str:
+    """
+    计算 msg_signature：token、timestamp、nonce 和密文按字典序排序后拼接，取SHA1
+    :param token: 公众号Token
+    :param timestamp: 时间戳
+    :param nonce: 随机数
+    :param encrypt: Base64密文
+    :return: 十六进制签名
+    """
+    return hashlib.sha1(''.join(sorted((token, timestamp, nonce, encrypt))).encode('utf-8')).hexdigest()
+
+class WeChatCrypto:
+    """
+    安全模式消息加解密
+    每个公众号（Token + EncodingAESKey）创建一个实例，密钥和 Cipher 对象只在创建时生成一次，
+    每条消息只创建一次加密或解密上下文
+    """
+
+    def __init__(self, token: str, encoding_aes_key: str, appid: str = ''):
+        """
+        :param token: 公众号Token
+        :param encoding_aes_key: 消息加解密密钥
+        :param appid: 公众号AppID，为空时不校验解密结果中的 AppID
+        :raises ImportError: 未安装 cryptography
+        :raises CryptoError: EncodingAESKey 格式错误
+        """
+        if Cipher is None:
+            raise ImportError("安全模式需要安装 cryptography: pip install cryptography")
+        self.token = token
+        self.appid = appid.encode('utf-8')
+        key, iv = derive_key(encoding_aes_key)
+        self._cipher = Cipher(algorithms.AES(key), modes.CBC(iv))
+
+    def check_signature(self, msg_signature: str, timestamp: str, nonce: str, encrypt: str) -> bool:
+        """
+        校验 msg_signature，必须在解密之前调用
+        :param msg_signature: 请求中的签名
+        :param timestamp: 时间戳
+        :param nonce: 随机数
+        :param encrypt: Base64密文
+        :return: 签名是否正确
+        """
+        if not msg_signature or not encrypt:
+            return False
+        expected = compute_signature(self.token, timestamp, nonce, encrypt)
+        return hmac.compare_digest(expected.encode('ascii'), msg_signature.encode('utf-8'))
+
+    def decrypt(self, encrypt: Union[str, bytes]) -> memoryview:
+        """
+        解密消息
+        :param encrypt: Base64密文（已校验签名）
+        :return: 消息XML字节的 memoryview 切片，可以直接交给 parse_message
+        :raises CryptoError: 密文格式错误、填充错误或 AppID 不匹配
+        """
+        try:
+            ciphertext = binascii.a2b_base64(encrypt)
+        except (binascii.Error, ValueError) as e:
+            raise CryptoError(f"密文不是合法的Base64: {str(e)}")
+        if not ciphertext or len(ciphertext) % 16:
+            raise CryptoError("密文长度不是AES分组长度的整数倍")
+
+        decryptor = self._cipher.decryptor()
+        plain = memoryview(decryptor.update(ciphertext) + decryptor.finalize())
+
+        # 去掉填充，只检查填充长度（与微信官方示例一致）
+        pad = plain[-1]
+        if not 0 < pad <= PAD_BLOCK_SIZE or len(plain) < _HEADER_SIZE + pad:
+            raise CryptoError("解密结果的填充错误")
+        end = len(plain) - pad
+        msg_length = _LENGTH.unpack_from(plain, _RANDOM_SIZE)[0]
+        msg_end = _HEADER_SIZE + msg_length
+        if msg_end > end:
+            raise CryptoError("解密结果的消息长度错误")
+        if self.appid and plain[msg_end:end] != self.appid:
+            raise CryptoError("解密结果中的AppID不匹配")
+        return plain[_HEADER_SIZE:msg_end]
+
+    def encrypt(self, message: bytes) -> bytes:
+        """
+        加密消息
+        :param message: 回复XML字节
+        :return: Base64密文（ASCII字节）
+        """
+        pad = PAD_BLOCK_SIZE - (_HEADER_SIZE + len(message) + len(self.appid)) % PAD_BLOCK_SIZE
+        plain = b''.join((
+            os.urandom(_RANDOM_SIZE), _LENGTH.pack(len(message)), message, self.appid, bytes((pad,)) * pad
+        ))
+        encryptor = self._cipher.encryptor()
+        return binascii.b2a_base64(encryptor.update(plain) + encryptor.finalize(), newline=False)
+
+    def encrypt_reply(self, reply: bytes, nonce: str, timestamp: Optional[int] = None) -> bytes:
+        """
+        构造加密的被动回复
+        :param reply: 回复XML字节
+        :param nonce: 随机数，通常沿用请求中的 nonce
+        :param timestamp: 时间戳，默认当前时间
+        :return: 加密回复XML字节
+        """
+        if timestamp is None:
+            timestamp = int(time.time())
+        encrypt = self.encrypt(reply)
+        signature = compute_signature(self.token, str(timestamp), nonce, encrypt.decode('ascii'))
+        return _ENCRYPTED_REPLY_TEMPLATE % (encrypt, signature.encode('ascii'), timestamp, cdata(nonce))
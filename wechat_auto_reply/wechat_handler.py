@@ -5,10 +5,20 @@
 """
 
 import hashlib
-import xml.etree.ElementTree as ET
 import time
+from functools import partial
 from flask import make_response
+from werkzeug.exceptions import RequestEntityTooLarge
 from reply_rules import reply_manager
+from reply_cache import ReplyCache
+from config import Config
+from text_normalizer import normalize_message
+from xml_parser import parse_message
+from reply_builder import build_text_reply, reply_headers
+from idempotency import create_idempotency_store, message_key
+from async_reply import AsyncReplyQueue, HTTPCustomerServiceSender
+from message_router import message_router
+from wechat_crypto import CryptoError, WeChatCrypto
 from logger_config import wechat_logger, exception_handler, log_function_call
 
 logger = wechat_logger.get_logger('wechat_handler')
@@ -16,12 +26,32 @@ logger = wechat_logger.get_logger('wechat_handler')
 class WeChatHandler:
     """微信消息处理类"""
     
-    def __init__(self, token):
+    def __init__(self, token, reply_cache=None, max_body_size=None, idempotency=None, async_replies=None,
+                 router=None, crypto=None):
         """
         初始化微信处理器
         :param token: 微信公众号Token
+        :param reply_cache: 回复缓存，默认按配置创建
+        :param max_body_size: 请求体大小上限（字节），默认按配置
+        :param idempotency: 消息幂等存储，默认按配置创建（配置为 none 时不做幂等处理）
+        :param async_replies: 异步回复队列，默认在配置开启时创建
+        :param router: 消息分发表，默认使用全局分发表
+        :param crypto: 安全模式加解密器，默认在配置了 EncodingAESKey 时创建
         """
         self.token = token
+        self.reply_cache = reply_cache if reply_cache is not None else ReplyCache(Config.REPLY_CACHE_SIZE)
+        self.max_body_size = max_body_size if max_body_size is not None else Config.MAX_BODY_SIZE
+        self.idempotency = idempotency if idempotency is not None else create_idempotency_store()
+        self.idempotency_wait = Config.IDEMPOTENCY_WAIT
+        if async_replies is None and Config.ASYNC_REPLY_ENABLED:
+            sender = HTTPCustomerServiceSender(Config.WECHAT_ACCESS_TOKEN, Config.CUSTOMER_SERVICE_API_URL)
+            async_replies = AsyncReplyQueue(sender, Config.ASYNC_REPLY_WORKERS, Config.ASYNC_REPLY_MAX_PENDING)
+        self.async_replies = async_replies
+        self.reply_deadline = Config.ASYNC_REPLY_DEADLINE
+        self.router = router if router is not None else message_router
+        if crypto is None and Config.WECHAT_ENCODING_AES_KEY:
+            crypto = WeChatCrypto(token, Config.WECHAT_ENCODING_AES_KEY, Config.WECHAT_APPID)
+        self.crypto = crypto
         
     @exception_handler(logger)
     @log_function_call(logger)
@@ -86,10 +116,32 @@ class WeChatHandler:
         :return: 回复消息
         """
         try:
-            # 获取POST数据
-            xml_data = request.get_data(as_text=True)
-            logger.info(f"收到用户消息，长度: {len(xml_data)} 字符")
-            logger.debug(f"消息内容: {xml_data}")
+            # 回复的截止时间从收到请求起计算
+            deadline = time.monotonic() + self.reply_deadline
+            
+            # 先按 Content-Length 检查大小，超出上限时不读取请求体
+            content_length = getattr(request, 'content_length', None)
+            if content_length is not None and content_length > self.max_body_size:
+                logger.warning(f"请求体过大，拒绝处理，长度: {content_length} 字节")
+                return make_response("请求体过大", 413)
+            
+            # 读取一次原始字节，不解码为字符串，解析器直接处理字节；
+            # 没有 Content-Length 的分块请求由 Flask 的 MAX_CONTENT_LENGTH 在读取时限制
+            try:
+                xml_data = request.get_data()
+            except RequestEntityTooLarge:
+                logger.warning("请求体过大，拒绝处理")
+                return make_response("请求体过大", 413)
+            if len(xml_data) > self.max_body_size:
+                logger.warning(f"请求体过大，拒绝处理，长度: {len(xml_data)} 字节")
+                return make_response("请求体过大", 413)
+            logger.info(f"收到用户消息，长度: {len(xml_data)} 字节")
+            
+            # 配置了 EncodingAESKey 时只接受加密消息，明文请求不经过 msg_signature 校验，不能放行
+            encrypted = request.args.get('encrypt_type', '').lower() == 'aes'
+            if self.crypto is not None and not encrypted:
+                logger.warning("已开启安全模式，拒绝未加密的消息")
+                return make_response("签名验证失败", 403)
             
             # 解析XML消息
             msg_dict = self._parse_xml_message(xml_data)
@@ -97,21 +149,80 @@ class WeChatHandler:
                 logger.error("消息解析失败")
                 return make_response("success")
             
-            # 处理消息并生成回复
-            reply_msg = self._process_message(msg_dict)
+            # 安全模式：先校验 msg_signature，通过后才解密
+            if encrypted:
+                if self.crypto is None:
+                    logger.error("收到加密消息，但没有配置 EncodingAESKey")
+                    return make_response("success")
+                if not self.crypto.check_signature(
+                    request.args.get('msg_signature', ''), request.args.get('timestamp', ''),
+                    request.args.get('nonce', ''), msg_dict.get('Encrypt', '')
+                ):
+                    logger.warning("加密消息的签名验证失败")
+                    return make_response("签名验证失败", 403)
+                msg_dict = self._decrypt_message(msg_dict['Encrypt'])
+                if not msg_dict:
+                    logger.error("加密消息解密失败")
+                    return make_response("success")
             
-            if reply_msg:
-                logger.info("成功生成回复消息")
-                logger.debug(f"回复内容: {reply_msg}")
-                return make_response(reply_msg, 200, {'Content-Type': 'application/xml'})
-            else:
-                logger.info("未生成回复消息")
-                return make_response("success")
+            # 处理消息并生成回复，加密消息的回复同样加密
+            reply_msg = self._reply_once(msg_dict, deadline)
+            if encrypted and reply_msg:
+                reply_msg = self.crypto.encrypt_reply(reply_msg, request.args.get('nonce', ''))
+            return self._reply_response(reply_msg)
                 
         except Exception as e:
             logger.error(f"处理用户消息时发生错误: {str(e)}", exc_info=True)
             return make_response("success")
     
+    def _reply_once(self, msg_dict, deadline=None):
+        """
+        生成消息的回复，微信重试的消息取回第一次处理的回复
+        :param msg_dict: 消息字典
+        :param deadline: 被动回复的截止时间（time.monotonic）
+        :return: 回复XML字节，不回复或等待第一次处理超时时为空
+        """
+        key = message_key(msg_dict) if self.idempotency is not None else None
+        if key is None:
+            return self._process_message(msg_dict, deadline)
+        
+        claim = self.idempotency.acquire(key, self.idempotency_wait)
+        if not claim.owner:
+            logger.info(f"重复消息 {key}，{'返回第一次处理的回复' if claim.reply is not None else '等待第一次处理超时'}")
+            return claim.reply
+        try:
+            reply_msg = self._process_message(msg_dict, deadline)
+        except BaseException:
+            self.idempotency.release(key)
+            raise
+        self.idempotency.complete(key, reply_msg or b'')
+        return reply_msg
+    
+    def _decrypt_message(self, encrypt):
+        """
+        解密并解析安全模式的消息
+        :param encrypt: Base64密文（已校验签名）
+        :return: 消息字典，解密或解析失败时返回None
+        """
+        try:
+            # 解密结果是 memoryview 切片，解析器直接解码，不复制
+            return self._parse_xml_message(self.crypto.decrypt(encrypt))
+        except CryptoError as e:
+            logger.error(f"解密消息时发生错误: {str(e)}")
+            return None
+    
+    def _reply_response(self, reply_msg):
+        """
+        生成回复的HTTP响应
+        :param reply_msg: 回复XML字节，为空时回复 success（不回复用户）
+        :return: 响应对象
+        """
+        if reply_msg:
+            logger.info(f"成功生成回复消息，长度: {len(reply_msg)} 字节")
+            return make_response(reply_msg, 200, reply_headers(reply_msg))
+        logger.info("未生成回复消息")
+        return make_response("success")
+    
     def _parse_xml_message(self, xml_data):
         """
         解析XML消息
@@ -122,72 +233,101 @@ class WeChatHandler:
             if not xml_data:
                 return None
                 
-            # 解析XML
-            root = ET.fromstring(xml_data)
-            
-            # 提取消息信息
-            msg_dict = {
-                'ToUserName': root.find('ToUserName').text if root.find('ToUserName') is not None else '',
-                'FromUserName': root.find('FromUserName').text if root.find('FromUserName') is not None else '',
-                'CreateTime': root.find('CreateTime').text if root.find('CreateTime') is not None else '',
-                'MsgType': root.find('MsgType').text if root.find('MsgType') is not None else '',
-                'Content': root.find('Content').text if root.find('Content') is not None else '',
-                'MsgId': root.find('MsgId').text if root.find('MsgId') is not None else ''
-            }
+            # 一次扫描提取全部字段（包括事件、媒体、位置等字段），格式错误时返回None
+            msg_dict = parse_message(xml_data)
+            if msg_dict is None:
+                return None
             
             logger.info(f"解析消息成功: {msg_dict}")
             return msg_dict
             
-        except ET.ParseError as e:
-            logger.error(f"XML解析错误: {str(e)}")
-            return None
         except Exception as e:
             logger.error(f"解析消息时发生错误: {str(e)}")
             return None
     
-    def _process_message(self, msg_dict):
+    def _process_message(self, msg_dict, deadline=None):
         """
         处理消息并生成回复
         :param msg_dict: 消息字典
-        :return: 回复消息XML
+        :param deadline: 被动回复的截止时间（time.monotonic），开启异步回复时使用
+        :return: 回复消息XML字节
         """
         try:
-            # 只处理文本消息
-            if msg_dict.get('MsgType') != 'text':
-                logger.info(f"忽略非文本消息，消息类型: {msg_dict.get('MsgType')}")
+            # 按 (MsgType, Event) 分发给对应的处理函数
+            reply = self.router.dispatch(self, msg_dict, deadline)
+            if not reply:
                 return None
+            if isinstance(reply, bytes):
+                # 处理函数已生成完整的回复XML（图文、图片等）
+                return reply
             
-            # 获取用户发送的内容
-            user_content = msg_dict.get('Content', '').strip()
-            logger.info(f"用户发送内容: {user_content}")
-            
-            # 内容匹配和回复逻辑
-            reply_content = self._generate_reply(user_content)
-            
-            if reply_content:
-                # 生成回复消息XML
-                reply_xml = self._create_reply_xml(
-                    to_user=msg_dict.get('FromUserName'),
-                    from_user=msg_dict.get('ToUserName'),
-                    content=reply_content
-                )
-                return reply_xml
-            
-            return None
+            # 文本回复，直接生成响应体字节
+            return build_text_reply(
+                to_user=msg_dict.get('FromUserName'),
+                from_user=msg_dict.get('ToUserName'),
+                content=reply
+            )
             
         except Exception as e:
             logger.error(f"处理消息时发生错误: {str(e)}")
             return None
     
-    def _generate_reply(self, user_content):
+    def generate_text_reply(self, user_content, user_id=None, deadline=None):
+        """
+        用规则引擎回复一段文本（文本消息的内容、语音识别结果、菜单的 EventKey 等）
+        :param user_content: 文本
+        :param user_id: 发送者OpenID，状态规则按发送者记录多轮对话的状态
+        :param deadline: 被动回复的截止时间（time.monotonic），开启异步回复时使用
+        :return: 回复内容，超过截止时间转为客服消息或没有匹配时返回None
+        """
+        logger.info(f"用户发送内容: {user_content}")
+        if self.async_replies is None or not user_id:
+            return self._generate_reply(user_content, user_id)
+        
+        # 在后台生成回复，超过截止时间时先回复 success，生成完成后通过客服消息发送
+        if deadline is None:
+            deadline = time.monotonic() + self.reply_deadline
+        on_time, reply_content = self.async_replies.run(
+            partial(self._generate_reply, user_content, user_id), user_id,
+            max(0.0, deadline - time.monotonic())
+        )
+        if not on_time:
+            logger.info(f"回复没有按时生成，转为客服消息或因队列已满被丢弃，用户: {user_id}")
+            return None
+        return reply_content
+    
+    def clear_session(self, user_id):
+        """
+        结束用户的多轮对话会话
+        :param user_id: 用户OpenID
+        :return: 会话是否存在
+        """
+        return reply_manager.sessions.clear_state(user_id)
+    
+    def _generate_reply(self, user_content, user_id=None):
         """
         根据用户内容生成回复
         :param user_content: 用户发送的内容
+        :param user_id: 发送者OpenID
         :return: 回复内容
         """
         try:
-            # 使用回复规则管理器查找匹配的回复
-            reply = reply_manager.find_reply(user_content)
+            if not user_content:
+                return None
+            
+            # 先查回复缓存，规则集更新后版本号变化，旧结果不会再被命中
+            # 缓存键是折叠了全半角和大小写的消息，非动态的函数规则不应依赖这些差异；
+            # 处于多轮流程中的用户的回复取决于状态，不查缓存
+            cache_key = normalize_message(user_content).folded
+            hit, reply = False, None
+            if not reply_manager.has_session(user_id):
+                hit, reply = self.reply_cache.get(cache_key, reply_manager.version)
+            if not hit:
+                # 使用回复规则管理器查找匹配的回复
+                match = reply_manager.find_match(user_content, user_id)
+                reply = match.reply
+                if match.cacheable:
+                    self.reply_cache.put(cache_key, match.version, reply)
             
             if reply:
                 logger.info(f"生成回复: {reply}")
@@ -207,17 +347,10 @@ class WeChatHandler:
         :param to_user: 接收用户
         :param from_user: 发送用户（公众号）
         :param content: 回复内容
-        :return: XML字符串
+        :return: XML字符串（消息处理直接使用 reply_builder 生成的字节）
         """
         try:
-            reply_xml = f"""<xml>
-<ToUserName><![CDATA[{to_user}]]></ToUserName>
-<FromUserName><![CDATA[{from_user}]]></FromUserName>
-<CreateTime>{int(time.time())}</CreateTime>
-<MsgType><![CDATA[text]]></MsgType>
-<Content><![CDATA[{content}]]></Content>
-</xml>"""
-            return reply_xml
+            return build_text_reply(to_user, from_user, content).decode('utf-8')
             
         except Exception as e:
             logger.error(f"创建回复XML时发生错误: {str(e)}")
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+微信消息XML解析器
+微信推送的消息是固定格式的扁平XML（<xml> 下一层字段，少数事件带一层嵌套），
+这里用一次正则扫描提取全部字段，不构建元素树；
+不处理DTD和自定义实体，从根本上避免实体膨胀攻击
+"""
+
+import logging
+import re
+from typing import Dict, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+# 所有消息都带有的字段，缺失时为空字符串
+BASE_FIELDS = ('ToUserName', 'FromUserName', 'CreateTime', 'MsgType', 'Content', 'MsgId')
+
+# 扁平消息（字段值为单个CDATA或不含实体的文本）在根元素内一次扫描取出全部字段，
+# 任何其他内容都会落入最后的 (\S) 分组，此时停止并交给逐个元素扫描。
+# CDATA和注释的内容写成展开形式而不是惰性的 .*?，长内容不逐字符回溯，未闭合时也只扫描一遍
+_FLAT_ROOT_RE = re.compile(r'\s*(?:<\?xml(?:\s[^<>?]*)?\?>\s*)?<xml>')
+_FLAT_FIELD_RE = re.compile(
+    r'\s*(?:<(\w+)>(?:<!\[CDATA\[([^\]]*(?:\](?!\]>)[^\]]*)*)\]\]>|([^<&]*))</\1>'
+    r'|<!--(?:[^-]|-(?!->))*-->|(\S))'
+)
+
+# 逐个元素扫描
+# 叶子元素：<Tag>文本或CDATA</Tag>，或自闭合的 <Tag/>。
+# CDATA内容与 _FLAT_FIELD_RE 一样写成展开形式，不能越过 ]]> 进入下一个CDATA段，
+# 每个位置只有一种匹配方式，CDATA未闭合时也只线性扫描，不会指数回溯
+_LEAF_RE = re.compile(
+    rb'\s*<([A-Za-z_][\w.-]*)(?:\s[^<>]*)?(?:/>|>([^<]*(?:<!\[CDATA\[[^\]]*(?:\](?!\]>)[^\]]*)*\]\]>[^<]*)*)</\1\s*>)'
+)
+# 含子元素的元素的开始和结束标签
+_OPEN_RE = re.compile(rb'\s*<([A-Za-z_][\w.-]*)(?:\s[^<>/]*)?>')
+_CLOSE_RE = re.compile(rb'\s*</([A-Za-z_][\w.-]*)\s*>')
+# 注释和文档开头的XML声明
+_COMMENT_RE = re.compile(rb'\s*<!--.*?-->', re.S)
+_DECLARATION_RE = re.compile(rb'\s*<\?xml(?:\s[^<>?]*)?\?>')
+_CDATA_RE = re.compile(rb'<!\[CDATA\[([^\]]*(?:\](?!\]>)[^\]]*)*)\]\]>')
+_ENTITY_RE = re.compile(rb'&(#x[0-9A-Fa-f]+|#[0-9]+|\w+);|&')
+
+_PREDEFINED_ENTITIES = {b'lt': '<', b'gt': '>', b'amp': '&', b'quot': '"', b'apos': "'"}
+
+# 嵌套深度上限，微信消息最多两层
+MAX_DEPTH = 8
+
+class XMLFormatError(ValueError):
+    """消息XML格式错误或包含不允许的结构"""
+
+def _unescape(text: bytes) -> str:
+    """
+    解码文本节点，只展开预定义实体和字符引用
+    :param text: 原始字节
+    :return: 文本
+    """
+    if b'&' not in text:
+        return text.decode('utf-8')
+
+    def replace(match):
+        name = match.group(1)
+        if name is None:
+            raise XMLFormatError("文本中存在未转义的 &")
+        if name.startswith(b'#x'):
+            return chr(int(name[2:], 16))
+        if name.startswith(b'#'):
+            return chr(int(name[1:]))
+        if name in _PREDEFINED_ENTITIES:
+            return _PREDEFINED_ENTITIES[name]
+        raise XMLFormatError(f"未定义的实体: {name.decode('ascii', 'replace')}")
+
+    return _ENTITY_RE.sub(lambda m: replace(m).encode('utf-8'), text).decode('utf-8')
+
+def _element_text(raw: bytes) -> str:
+    """
+    元素内容转为文本，CDATA原样保留，其余部分解码实体
+    :param raw: 开始和结束标签之间的原始字节
+    :return: 文本
+    """
+    if b'<![CDATA[' not in raw:
+        return _unescape(raw)
+    parts = []
+    position = 0
+    for match in _CDATA_RE.finditer(raw):
+        parts.append(_unescape(raw[position:match.start()]))
+        parts.append(match.group(1).decode('utf-8'))
+        position = match.end()
+    parts.append(_unescape(raw[position:]))
+    return ''.join(parts)
+
+def parse_xml_fields(data: Union[bytes, bytearray, memoryview, str]) -> Dict[str, str]:
+    """
+    提取消息中的全部字段
+    嵌套元素的子字段展开到同一层，同名字段以第一次出现的为准
+    :param data: 消息XML，字节类对象按UTF-8解码（memoryview 切片直接解码，不复制）
+    :return: 字段名到文本的字典
+    :raises XMLFormatError: 格式错误、包含DTD或实体声明
+    """
+    text = data if isinstance(data, str) else str(data, 'utf-8')
+
+    if '<!DOCTYPE' in text or '<!ENTITY' in text:
+        raise XMLFormatError("消息中不允许出现DTD或实体声明")
+
+    fields = _flat_fields(text)
+    if fields is None:
+        return _scan_fields(text.encode('utf-8'))
+    return fields
+
+def _flat_fields(text: str) -> Optional[Dict[str, str]]:
+    """
+    提取扁平消息的字段
+    :param text: 消息XML
+    :return: 字段名到文本的字典，不是扁平消息时返回None
+    """
+    match = _FLAT_ROOT_RE.match(text)
+    end = text.rfind('</xml>')
+    if not match or end < match.end() or text[end + 6:].strip():
+        return None
+
+    fields: Dict[str, str] = {}
+    setdefault = fields.setdefault
+    for field in _FLAT_FIELD_RE.finditer(text, match.end(), end):
+        name, cdata, value, other = field.groups()
+        if other:
+            # 嵌套元素、实体、拆分成多段的CDATA等
+            return None
+        if name:
+            # 同名字段保留第一次出现的值
+            setdefault(name, cdata or value or '')
+    return fields
+
+def _scan_fields(data: bytes) -> Dict[str, str]:
+    """
+    逐个元素扫描，处理嵌套元素、实体、多段CDATA等情况
+    :param data: 消息XML
+    :return: 字段名到文本的字典
+    :raises XMLFormatError: 格式错误
+    """
+    fields: Dict[str, str] = {}
+    stack = []
+    position = 0
+    match = _DECLARATION_RE.match(data)
+    if match:
+        position = match.end()
+
+    leaf_match = _LEAF_RE.match
+    while True:
+        match = leaf_match(data, position)
+        if match:
+            position = match.end()
+            if not stack:
+                # 根元素没有子元素
+                break
+            name = match.group(1).decode('ascii')
+            if name not in fields:
+                raw = match.group(2)
+                fields[name] = _element_text(raw) if raw else ''
+            continue
+
+        match = _OPEN_RE.match(data, position)
+        if match:
+            if len(stack) >= MAX_DEPTH:
+                raise XMLFormatError("元素嵌套过深")
+            stack.append(match.group(1))
+            position = match.end()
+            continue
+
+        match = _CLOSE_RE.match(data, position)
+        if match:
+            if not stack or stack.pop() != match.group(1):
+                raise XMLFormatError("结束标签不匹配")
+            position = match.end()
+            if not stack:
+                break
+            continue
+
+        match = _COMMENT_RE.match(data, position)
+        if match:
+            position = match.end()
+            continue
+
+        raise XMLFormatError(f"无法解析的内容，位置 {position}")
+
+    # 根元素之后只允许空白和注释
+    while True:
+        match = _COMMENT_RE.match(data, position)
+        if not match:
+            break
+        position = match.end()
+    if data[position:].strip():
+        raise XMLFormatError("根元素之后存在多余内容")
+
+    return fields
+
+def parse_message(data: Union[bytes, bytearray, memoryview, str, None]) -> Optional[Dict[str, str]]:
+    """
+    解析微信消息
+    :param data: 消息XML
+    :return: 消息字典，基本字段缺失时为空字符串；格式错误时返回None
+    """
+    if not data:
+        return None
+    try:
+        fields = parse_xml_fields(data)
+    except (ValueError, OverflowError) as e:
+        logger.error(f"XML解析错误: {str(e)}")
+        return None
+
+    message = dict.fromkeys(BASE_FIELDS, '')
+    message.update(fields)
+    return message